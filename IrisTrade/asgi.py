@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'IrisTrade.settings')
+# Endpoints mobiles asynchrones (cf. Merchandising/async_views.py)
+os.environ.setdefault('IRIS_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 import cloudinary
 AUTH_USER_MODEL = 'Merchandising.CustomUser'
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # En tête : mesure toute la chaîne (cf. Merchandising/metrics.py)
+    'Merchandising.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -125,6 +128,88 @@ STATICFILES_DIRS = [
     BASE_DIR / "static",  # pour les fichiers CSS, JS, images globaux
 ]
 
+# Upload photo : spool local puis envoi en arrière-plan (Merchandising/uploads.py)
+# Les fichiers reçus sont écrits directement sur disque, sans passer par la mémoire.
+PHOTO_SPOOL_DIR = BASE_DIR / 'spool'
+FILE_UPLOAD_TEMP_DIR = PHOTO_SPOOL_DIR / 'tmp'
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+PHOTO_STORAGE_BACKEND = 'Merchandising.uploads.CloudinaryBackend'
+PHOTO_UPLOAD_WORKERS = 4
+PHOTO_UPLOAD_RETRIES = 3
+# Upload par morceaux (Merchandising/chunked.py) : taille conseillée au téléphone,
+# taille maximale acceptée par morceau et par fichier (octets)
+PHOTO_CHUNK_SIZE = 256 * 1024
+PHOTO_CHUNK_MAX_SIZE = 4 * 1024 * 1024
+PHOTO_UPLOAD_MAX_SIZE = 25 * 1024 * 1024
+# Uploads par morceaux non terminés autorisés par merchandiser (fichiers préalloués)
+PHOTO_UPLOAD_MAX_OPEN = 20
+# Distance de Hamming (bits sur 64) sous laquelle deux photos sont des quasi-doublons
+PHOTO_NEAR_DUPLICATE_DISTANCE = 6
+
+# Rayon (m) autour du PDV dans lequel le début / la fin de visite sont
+# considérés sur place (Mission.begin_in_geofence / end_in_geofence)
+GEOFENCE_RADIUS_M = 200
+# Cache du numéro de version de l'index des PDV (Merchandising/geo.py), à
+# partager entre processus (ex. Redis) pour que tous reconstruisent l'index.
+GEO_CACHE_ALIAS = 'default'
+
+# Instrumentation (Merchandising/metrics.py) : en-tête Server-Timing,
+# adresses autorisées sur /metrics et budget de requêtes SQL par vue
+# (dépassement signalé dans les logs et par Merchandising.testing).
+METRICS_SERVER_TIMING = DEBUG
+# Adresses du scraper Prometheus, hors loopback (cf. Merchandising/metrics.py)
+METRICS_ALLOWED_IPS = ()
+VIEW_QUERY_BUDGETS = {
+    # session + utilisateur : 2 requêtes à froid, 0 une fois en cache
+    'dashboard_merch': 6,
+    'mission_realisation': 10,  # catalogue froid ; 4 quand il est en cache
+    'mission_catalog': 6,
+    'list_photos': 6,
+    'dashboard_superviseur': 6,
+    'supervision_state': 6,
+    'search_photos': 6,
+    'upload_chunk': 4,
+    'save_client_products': 12,
+    'save_concurrent_products': 12,
+    'sync_delta': 6,
+    'mission_route': 5,
+    'nearby_pdvs': 6,
+    'client_dashboard': 6,
+    'client_kpis': 6,
+}
+
+# Authentification sans requête SQL sur le chemin chaud : utilisateur (client
+# joint) servi par Merchandising/auth_cache.py, session lue depuis le cache.
+# ModelBackend reste listé pour les sessions ouvertes avant ce réglage.
+AUTHENTICATION_BACKENDS = [
+    'Merchandising.auth_cache.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+USER_CACHE_TTL = 30          # s, LRU local au processus
+USER_CACHE_SIZE = 2048
+# Alias de CACHES partagé entre processus (ex. Redis) : remplace alors le LRU
+# local et rend l'invalidation immédiate pour tous les processus.
+USER_CACHE_ALIAS = None
+USER_CACHE_SHARED_TTL = 300
+
+# Tableau de bord superviseur (Merchandising/supervision.py) : missions non
+# démarrées à cette heure = retard ; versions et snapshots gardés dans ce
+# cache, à partager entre processus (ex. Redis) pour un réveil immédiat.
+MISSION_START_DEADLINE = '10:00'
+SUPERVISION_CACHE_ALIAS = 'default'
+
+# Synchronisation hors-ligne (Merchandising/sync.py) : produits supprimés
+# gardés ce nombre de jours pour le delta ; un jeton plus ancien redemande
+# le catalogue complet (purge : manage.py purge_catalog_tombstones).
+SYNC_TOMBSTONE_DAYS = 30
+
+# Endpoints mobiles du merchandiser et long-poll superviseur en vues async
+# (Merchandising/async_views.py).
+# Activé par IrisTrade/asgi.py : sous WSGI, chaque vue async coûterait une
+# boucle d'événements par requête.
+ASYNC_MOBILE_VIEWS = os.environ.get('IRIS_ASYNC_VIEWS') == '1'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
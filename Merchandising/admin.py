@@ -1,5 +1,10 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from .imports import InvalidImport, run_import
 from .models import CustomUser, Client, Projet,PointDeVente,Concurrent,ProduitClient,ProduitConcurrent,Mission,RealisationClientData,RealisationConcurrenceData,PhotoMission
 
 class CustomUserAdmin(UserAdmin):
@@ -20,13 +25,87 @@ class CustomUserAdmin(UserAdmin):
     search_fields = ('email',)
     ordering = ('email',)
 
+class ImportForm(forms.Form):
+    fichier = forms.FileField(help_text="CSV (; ou ,) ou XLSX, première ligne = en-têtes")
+    client = forms.ModelChoiceField(queryset=Client.objects.all(), required=False)
+    dry_run = forms.BooleanField(required=False, label="Valider sans importer")
+
+
+class ImportAdminMixin:
+    """Page « Importer » sur la liste des objets (fichier CSV / XLSX, cf. imports.py)."""
+    change_list_template = 'admin/Merchandising/change_list_import.html'
+    import_kind = None
+
+    def get_urls(self):
+        opts = self.model._meta
+        return [
+            path(
+                'import/',
+                self.admin_site.admin_view(self.import_view),
+                name=f'{opts.app_label}_{opts.model_name}_import',
+            ),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect('admin:index')
+        form = ImportForm(request.POST or None, request.FILES or None)
+        report = None
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['fichier']
+            client = form.cleaned_data['client']
+            try:
+                # Les uploads sont toujours écrits sur disque (TemporaryFileUploadHandler)
+                report = run_import(
+                    self.import_kind,
+                    upload.temporary_file_path(),
+                    client_id=client.id if client else None,
+                    fmt=upload.name.rsplit('.', 1)[-1].lower(),
+                    dry_run=form.cleaned_data['dry_run'],
+                )
+            except InvalidImport as exc:
+                messages.error(request, str(exc))
+            else:
+                messages.success(
+                    request,
+                    f"{report.rows} ligne(s) lue(s) : {report.created} créée(s), "
+                    f"{report.updated} mise(s) à jour, {report.rejected} refusée(s).",
+                )
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f"Importer : {self.model._meta.verbose_name_plural}",
+            'form': form,
+            'report': report,
+        }
+        return TemplateResponse(request, 'admin/Merchandising/import.html', context)
+
+
+@admin.register(PointDeVente)
+class PointDeVenteAdmin(ImportAdminMixin, admin.ModelAdmin):
+    import_kind = 'pdv'
+    list_display = ('code', 'no_pdv', 'wilaya', 'commune', 'type_pdv')
+    search_fields = ('code', 'no_pdv', 'commune')
+
+
+@admin.register(ProduitClient)
+class ProduitClientAdmin(ImportAdminMixin, admin.ModelAdmin):
+    import_kind = 'produits'
+
+
+@admin.register(Concurrent)
+class ConcurrentAdmin(ImportAdminMixin, admin.ModelAdmin):
+    import_kind = 'concurrents'
+
+
+@admin.register(ProduitConcurrent)
+class ProduitConcurrentAdmin(ImportAdminMixin, admin.ModelAdmin):
+    import_kind = 'produits_concurrents'
+
+
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Client)
 admin.site.register(Projet)
-admin.site.register(Concurrent)
-admin.site.register(PointDeVente)
-admin.site.register(ProduitClient)
-admin.site.register(ProduitConcurrent)
 admin.site.register(Mission)
 admin.site.register(RealisationClientData)
 admin.site.register(RealisationConcurrenceData)
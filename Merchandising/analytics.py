@@ -0,0 +1,116 @@
+"""
+KPI des relevés en linéaire, calculés en colonnes (pandas / NumPy).
+
+Deux étapes :
+1. chargement de « faits » produit x PDV x période (semaine ou mois) lus
+   sur les agrégats journaliers (cf. rollups.py) : le coût dépend du
+   nombre de jours couverts, pas du nombre de relevés ;
+2. calcul vectorisé des KPI par produit x wilaya x région x période :
+   - distribution numérique : % des PDV audités où le produit est disponible ;
+   - taux de rupture (OOS) : % des relevés où le produit est absent ;
+   - part de linéaire moyenne (facing_share) ;
+   - indice prix : prix moyen du produit / prix moyen des concurrents de la
+     même catégorie, même zone, même période (x 100).
+"""
+import numpy as np
+import pandas as pd
+
+from . import rollups
+
+FACT_COLUMNS = list(rollups.SERIES_COLUMNS)
+KPI_KEYS = ['produit_id', 'produit', 'categorie', 'wilaya', 'region', 'periode']
+
+
+def _facts(kind, client_id, keys, grain, date_from, date_to):
+    """Séries agrégées par la base ; retourne un DataFrame (periode + clés + FACT_COLUMNS)."""
+    rows = rollups.series(kind, client_id, grain, keys, date_from, date_to)
+    frame = pd.DataFrame.from_records(rows.iterator(chunk_size=5000), columns=['periode'] + keys + FACT_COLUMNS)
+    for col in FACT_COLUMNS:
+        dtype = float if col.endswith('_sum') else 'int64'
+        frame[col] = pd.to_numeric(frame[col], errors='coerce').fillna(0).astype(dtype)
+    if not frame.empty:
+        frame['periode'] = pd.to_datetime(frame['periode']).dt.date
+    return frame
+
+
+def load_client_facts(client_id, date_from=None, date_to=None, grain='week'):
+    """Faits produit client au grain produit x PDV x période."""
+    keys = ['produit_id', 'produit__nom', 'produit__categorie', 'pdv_id', 'wilaya', 'region']
+    frame = _facts('client', client_id, keys, grain, date_from, date_to)
+    return frame.rename(columns={'produit__nom': 'produit', 'produit__categorie': 'categorie'})
+
+
+def load_competitor_facts(client_id, date_from=None, date_to=None, grain='week'):
+    """Faits concurrence au grain catégorie x zone x période."""
+    keys = ['produit_concurrent__categorie', 'wilaya', 'region']
+    frame = _facts('concurrence', client_id, keys, grain, date_from, date_to)
+    return frame.rename(columns={'produit_concurrent__categorie': 'categorie'})
+
+
+def _ratio(num, den):
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    out = np.full(num.shape, np.nan)
+    np.divide(num, den, out=out, where=den > 0)
+    return out
+
+
+def compute_kpis(client_facts, competitor_facts=None):
+    """
+    KPI par produit x wilaya x région x période à partir des faits
+    (grain produit x PDV x période). Entièrement vectorisé.
+    """
+    if client_facts.empty:
+        return pd.DataFrame(columns=KPI_KEYS + [
+            'pdv_audites', 'pdv_disponibles', 'releves', 'distribution_numerique',
+            'taux_rupture', 'part_lineaire', 'prix_moyen', 'prix_concurrence', 'indice_prix',
+        ])
+
+    facts = client_facts.assign(disponible_pdv=(client_facts['n_dispo'] > 0).astype(int))
+    grouped = facts.groupby(KPI_KEYS, sort=True, dropna=False).agg(
+        pdv_audites=('pdv_id', 'nunique'),
+        pdv_disponibles=('disponible_pdv', 'sum'),
+        releves=('n', 'sum'),
+        n_dispo=('n_dispo', 'sum'),
+        facing_sum=('facing_sum', 'sum'),
+        facing_n=('facing_n', 'sum'),
+        price_sum=('price_sum', 'sum'),
+        price_n=('price_n', 'sum'),
+    ).reset_index()
+
+    grouped['distribution_numerique'] = 100 * _ratio(grouped['pdv_disponibles'], grouped['pdv_audites'])
+    grouped['taux_rupture'] = 100 * (1 - _ratio(grouped['n_dispo'], grouped['releves']))
+    grouped['part_lineaire'] = _ratio(grouped['facing_sum'], grouped['facing_n'])
+    grouped['prix_moyen'] = _ratio(grouped['price_sum'], grouped['price_n'])
+
+    if competitor_facts is not None and not competitor_facts.empty:
+        comp = competitor_facts.groupby(['categorie', 'wilaya', 'region', 'periode'], dropna=False).agg(
+            c_price_sum=('price_sum', 'sum'), c_price_n=('price_n', 'sum'),
+        ).reset_index()
+        comp['prix_concurrence'] = _ratio(comp['c_price_sum'], comp['c_price_n'])
+        grouped = grouped.merge(
+            comp[['categorie', 'wilaya', 'region', 'periode', 'prix_concurrence']],
+            on=['categorie', 'wilaya', 'region', 'periode'], how='left',
+        )
+    else:
+        grouped['prix_concurrence'] = np.nan
+    grouped['indice_prix'] = 100 * _ratio(grouped['prix_moyen'], grouped['prix_concurrence'])
+
+    return grouped.drop(columns=['n_dispo', 'facing_sum', 'facing_n', 'price_sum', 'price_n'])
+
+
+def client_kpis(client_id, date_from=None, date_to=None, grain='week'):
+    return compute_kpis(
+        load_client_facts(client_id, date_from, date_to, grain),
+        load_competitor_facts(client_id, date_from, date_to, grain),
+    )
+
+
+def to_records(frame):
+    """Lignes JSON-sérialisables (NaN -> None, dates ISO)."""
+    frame = frame.astype(object).where(pd.notna(frame), None)
+    records = frame.to_dict(orient='records')
+    for row in records:
+        if row.get('periode') is not None:
+            row['periode'] = row['periode'].isoformat()
+    return records
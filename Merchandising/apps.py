@@ -1,6 +1,17 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class MerchandisingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Merchandising'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Les uploads sont écrits sur disque dès réception (cf. settings.FILE_UPLOAD_HANDLERS)
+        temp_dir = getattr(settings, 'FILE_UPLOAD_TEMP_DIR', None)
+        if temp_dir:
+            os.makedirs(temp_dir, exist_ok=True)
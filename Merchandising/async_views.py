@@ -0,0 +1,278 @@
+"""
+Versions asynchrones des endpoints mobiles du merchandiser (début / fin
+de visite, photos dont l'upload par morceaux, relevés) et du long-poll
+superviseur, pour un service sous ASGI (cf. IrisTrade/asgi.py) : une
+connexion mobile lente ou une page en attente n'occupe plus un thread
+worker.
+
+Mêmes URLs, mêmes noms et mêmes réponses que les vues de views.py ;
+urls.py choisit l'une ou l'autre selon settings.ASYNC_MOBILE_VIEWS.
+
+Les lectures simples passent par l'ORM asynchrone (aget, asave). Ce qui
+reste synchrone (transactions d'ingestion, analyse multipart, écriture
+dans le spool) est délégué à sync_to_async ; les accès disque sont faits
+hors du thread partagé de l'ORM (thread_sensitive=False). L'envoi vers
+le stockage reste celui du pool d'uploads (cf. uploads.py).
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponseForbidden, JsonResponse
+from django.shortcuts import aget_object_or_404, redirect
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.timezone import localdate
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+
+from . import chunked, supervision
+from .auth_cache import fresh_user
+from .ingestion import ingest_client_products, ingest_concurrent_products
+from .models import ChunkedUpload, Mission, PhotoMission
+from .pagination import CursorPaginator, InvalidCursor, count_estimate
+from .uploads import create_photo, photo_display_url, photo_payload, photo_thumbnail_url, spool_upload
+
+
+def login_required(view):
+    """
+    login_required pour vue asynchrone (Django 5.0 ne sait décorer que les
+    vues synchrones). L'utilisateur chargé remplace request.user : le
+    SimpleLazyObject du middleware ferait une requête synchrone.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _form(request):
+    # Analyse multipart (fichiers temporaires) : synchrone
+    return request.POST, request.FILES
+
+
+def _json_items(request):
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return None, JsonResponse({'error': 'invalid json'}, status=400)
+    if not isinstance(payload, dict):
+        return None, JsonResponse({'error': 'invalid json'}, status=400)
+    items = payload.get('items', [])
+    if not isinstance(items, list):
+        return None, JsonResponse({'error': 'invalid items'}, status=400)
+    return items, None
+
+
+@require_POST
+@login_required
+@fresh_user
+async def start_visit(request, mission_id):
+    mission = await aget_object_or_404(Mission, id=mission_id)
+    if mission.merchandiser_id != request.user.id:
+        return HttpResponseForbidden("Non autorisé")
+
+    post, _ = await sync_to_async(_form, thread_sensitive=False)(request)
+    mission.etat = 'in_progress'
+    mission.begin_time = timezone.now()
+    mission.begin_latitude = post.get('latitude')
+    mission.begin_longitude = post.get('longitude')
+    await mission.asave()
+
+    return redirect('mission_realisation', mission_id=mission.id)
+
+
+@login_required
+@fresh_user
+@require_POST
+async def upload_photo(request, mission_id):
+    """Cf. views.upload_photo."""
+    mission = await aget_object_or_404(Mission, id=mission_id)
+    if mission.merchandiser_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    post, files = await sync_to_async(_form, thread_sensitive=False)(request)
+    image = files.get('image')
+    categorie = post.get('categorie')
+    photo_type = post.get('photo_type')  # 'avant' ou 'apres'
+    if not image or not categorie or photo_type not in ('avant', 'apres'):
+        return JsonResponse({'error': 'missing parameters'}, status=400)
+
+    spool_path = await sync_to_async(spool_upload, thread_sensitive=False)(image)
+    photo = await sync_to_async(create_photo)(mission, categorie, photo_type, spool_path)
+
+    return JsonResponse(photo_payload(request, photo))
+
+
+@login_required
+@fresh_user
+@require_POST
+async def upload_init(request, mission_id):
+    """Cf. views.upload_init."""
+    mission = await aget_object_or_404(Mission, id=mission_id)
+    if mission.merchandiser_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'invalid json'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'invalid json'}, status=400)
+    try:
+        upload = await sync_to_async(chunked.init_upload)(mission, request.user, payload)
+    except chunked.TooManyUploads as exc:
+        return JsonResponse({'error': str(exc)}, status=429)
+    except chunked.ChunkError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(chunked.state(upload))
+
+
+@login_required
+@fresh_user
+@require_http_methods(['GET', 'PUT'])
+async def upload_chunk(request, upload_id):
+    """Cf. views.upload_chunk."""
+    upload = await aget_object_or_404(ChunkedUpload, upload_id=upload_id)
+    if upload.merch_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    if request.method == 'PUT':
+        try:
+            offset = int(request.GET.get('offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            await sync_to_async(chunked.write_chunk, thread_sensitive=False)(
+                upload, offset, request, length, request.headers.get('X-Chunk-Sha256'),
+            )
+        except ValueError:
+            return JsonResponse({'error': 'invalid offset'}, status=400)
+        except chunked.ChunkError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        upload = await sync_to_async(chunked.record_chunk)(upload, offset, length)
+    return JsonResponse(chunked.state(upload))
+
+
+@login_required
+@fresh_user
+@require_POST
+async def upload_complete(request, upload_id):
+    upload = await aget_object_or_404(ChunkedUpload, upload_id=upload_id)
+    if upload.merch_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    try:
+        photo = await sync_to_async(chunked.complete_upload)(upload)
+    except chunked.ChunkError as exc:
+        await upload.arefresh_from_db()
+        return JsonResponse({'error': str(exc), **chunked.state(upload)}, status=409)
+    return JsonResponse(photo_payload(request, photo))
+
+
+@login_required
+@fresh_user
+@require_POST
+async def save_client_products(request, mission_id):
+    mission = await aget_object_or_404(Mission.objects.select_related('pdv'), id=mission_id)
+    if mission.merchandiser_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    items, error = _json_items(request)
+    if error:
+        return error
+    result = await sync_to_async(ingest_client_products)(mission, request.user, items)
+    return JsonResponse({'success': True, **result})
+
+
+@login_required
+@fresh_user
+@require_POST
+async def save_concurrent_products(request, mission_id):
+    mission = await aget_object_or_404(Mission.objects.select_related('pdv'), id=mission_id)
+    if mission.merchandiser_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    items, error = _json_items(request)
+    if error:
+        return error
+    result = await sync_to_async(ingest_concurrent_products)(mission, request.user, items)
+    return JsonResponse({'success': True, **result})
+
+
+@login_required
+@fresh_user
+@require_POST
+async def finish_visit(request, mission_id):
+    mission = await aget_object_or_404(Mission, id=mission_id)
+    if mission.merchandiser_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    post, _ = await sync_to_async(_form, thread_sensitive=False)(request)
+    mission.etat = 'done'
+    await sync_to_async(mission.finish)(post.get('latitude'), post.get('longitude'))
+    return JsonResponse({
+        'success': True,
+        'redirect': reverse('dashboard_merch'),
+        'end_in_geofence': mission.end_in_geofence,
+        'end_distance_m': mission.end_distance_m,
+    })
+
+
+@login_required
+@require_GET
+async def list_photos(request, mission_id):
+    """Cf. views.list_photos."""
+    mission = await aget_object_or_404(Mission, id=mission_id)
+    if mission.merchandiser_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    photo_type = request.GET.get('type')
+    categorie = request.GET.get('categorie')
+
+    qs = PhotoMission.objects.filter(mission=mission)
+    if photo_type in ('avant', 'apres'):
+        qs = qs.filter(type_photo=photo_type)
+    if categorie:
+        qs = qs.filter(categorie=categorie)
+
+    paginator = CursorPaginator(qs, ordering=('-id',))
+    try:
+        page = await sync_to_async(paginator.page)(request.GET.get('cursor'), request.GET.get('page_size'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
+
+    items = [{
+        'id': ph.id,
+        'url': photo_display_url(request, ph),
+        'thumb': photo_thumbnail_url(request, ph),
+        'cat': ph.categorie,
+        'type': ph.type_photo,
+    } for ph in page.items]
+
+    data = {
+        'success': True,
+        'items': items,
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    }
+    if request.GET.get('count') == '1':
+        data['count'], data['count_exact'] = await sync_to_async(count_estimate)(qs)
+    return JsonResponse(data)
+
+
+@login_required
+@require_GET
+async def supervision_state(request):
+    """Cf. views.supervision_state ; l'attente ne bloque pas de thread."""
+    region = supervision.region_for(request.user, request.GET.get('region'))
+    if region is None:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    day = localdate()
+    since = request.GET.get('since')
+    if since:
+        try:
+            await supervision.await_change(region, day, int(since))
+        except ValueError:
+            return JsonResponse({'error': 'invalid parameters'}, status=400)
+    snapshot = await sync_to_async(supervision.snapshot)(region, day)
+    return JsonResponse({'success': True, 'poll_after': 0, **snapshot})
@@ -0,0 +1,176 @@
+"""
+Cache de l'utilisateur authentifié.
+
+AuthenticationMiddleware recharge CustomUser à chaque requête, puis les
+vues client suivent request.user.client : deux requêtes SQL avant toute
+logique métier. CachedModelBackend.get_user sert l'utilisateur, client
+déjà joint, depuis :
+
+- avec settings.USER_CACHE_ALIAS : uniquement ce cache partagé entre
+  processus (USER_CACHE_SHARED_TTL s). Une écriture sur l'utilisateur ou
+  sur son client (cf. signals.py) en retire l'entrée pour tous les
+  processus ;
+- sinon : un LRU local au processus (USER_CACHE_SIZE entrées,
+  USER_CACHE_TTL s). L'invalidation ne touche que le processus courant :
+  les autres gardent l'ancienne version au plus USER_CACHE_TTL s. Les vues
+  sensibles (exports, recherche de photos, métriques...) et toutes les
+  vues d'écriture (visites, photos, relevés, synchronisation) sont donc
+  décorées par fresh_user, qui relit les droits en base dans ce mode.
+
+Les entrées sont gardées sérialisées (pickle) : chaque requête reçoit sa
+propre instance, qu'elle peut modifier sans toucher aux autres threads.
+Les QuerySet.update() ne passent pas par les signaux : appeler
+invalidate() après.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.http import HttpResponseForbidden
+
+from .models import CustomUser
+
+DEFAULT_SIZE = 2048
+DEFAULT_TTL = 30
+DEFAULT_SHARED_TTL = 300
+KEY_PREFIX = 'auth-user'
+# Champs relus par fresh_user : ceux dont dépendent les contrôles d'accès
+ACCESS_FIELDS = ('is_active', 'is_staff', 'is_superuser', 'role', 'client_id', 'region')
+
+
+class LRUCache:
+    """LRU borné avec expiration, sûr entre threads."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # clé -> (expiration, valeur)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LRUCache(
+    getattr(settings, 'USER_CACHE_SIZE', DEFAULT_SIZE),
+    getattr(settings, 'USER_CACHE_TTL', DEFAULT_TTL),
+)
+
+
+def _shared():
+    alias = getattr(settings, 'USER_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def _key(user_id):
+    return f"{KEY_PREFIX}:{user_id}"
+
+
+def load_user(user_id):
+    return CustomUser._default_manager.select_related('client').filter(pk=user_id).first()
+
+
+def get_user(user_id):
+    """L'utilisateur `user_id`, client joint, ou None s'il n'existe pas."""
+    key = _key(user_id)
+    shared = _shared()
+    data = shared.get(key) if shared is not None else _local.get(key)
+    if data is None:
+        user = load_user(user_id)
+        if user is None:
+            return None
+        data = pickle.dumps(user, pickle.HIGHEST_PROTOCOL)
+        if shared is not None:
+            shared.set(key, data, getattr(settings, 'USER_CACHE_SHARED_TTL', DEFAULT_SHARED_TTL))
+        else:
+            _local.set(key, data)
+    return pickle.loads(data)
+
+
+def invalidate(*user_ids):
+    shared = _shared()
+    keys = [_key(user_id) for user_id in user_ids]
+    for key in keys:
+        _local.delete(key)
+    if shared is not None and keys:
+        shared.delete_many(keys)
+
+
+def invalidate_client(client_id):
+    invalidate(*CustomUser.objects.filter(client_id=client_id).values_list('id', flat=True))
+
+
+def _recheck(request):
+    """Réponse 403 si le compte a été désactivé ou supprimé, sinon None (cf. fresh_user)."""
+    user = request.user
+    if user.is_authenticated and _shared() is None:
+        current = CustomUser._default_manager.filter(pk=user.pk).values_list(*ACCESS_FIELDS).first()
+        if current != tuple(getattr(user, field) for field in ACCESS_FIELDS):
+            invalidate(user.pk)
+            user = get_user(user.pk)
+            if user is None or not user.is_active:
+                return HttpResponseForbidden("Non autorisé")
+            request.user = user
+    return None
+
+
+def fresh_user(view):
+    """
+    Vue sensible ou d'écriture : sans cache partagé, relit en base les
+    droits de l'utilisateur (une requête) ; s'ils ont changé, request.user
+    est rechargé, et un compte désactivé ou supprimé est refusé. Accepte
+    les vues synchrones et asynchrones (placer sous login_required).
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            denied = await sync_to_async(_recheck)(request)
+            return denied or await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            return _recheck(request) or view(request, *args, **kwargs)
+    return wrapped
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend dont get_user passe par le cache ci-dessus."""
+
+    def get_user(self, user_id):
+        try:
+            user_id = CustomUser._meta.pk.to_python(user_id)
+        except ValidationError:
+            return None
+        user = get_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -0,0 +1,210 @@
+"""
+Banc de mesure des vues et requêtes clés, à lancer sur un jeu de données
+synthétique (cf. synthetic.py, `manage.py generate_synthetic_data`).
+
+Chaque scénario est rejoué `iterations` fois avec le client de test
+Django (après `warmup` passages ignorés) ; on relève la latence (p50 /
+p95), le nombre de requêtes SQL (metrics.track_queries) et, sur un
+passage supplémentaire sous tracemalloc, le pic de mémoire Python.
+Les écritures (save_client_products) sont annulées après chaque passage.
+
+Les résultats sont un dict JSON (commit git, volumétrie, mesures par
+scénario) ; `compare` affiche l'écart avec un résultat précédent.
+"""
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import timedelta
+
+import django
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.timezone import localdate
+
+from . import analytics
+from .metrics import track_queries
+from .models import (
+    CustomUser,
+    Mission,
+    PhotoMission,
+    PointDeVente,
+    ProduitClient,
+    RealisationClientData,
+    RealisationConcurrenceData,
+)
+
+DEFAULT_ITERATIONS = 20
+DEFAULT_WARMUP = 2
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Context:
+    """Utilisateurs et missions sur lesquels portent les scénarios."""
+
+    def __init__(self, host='localhost'):
+        today = localdate()
+        mission = (
+            Mission.objects.filter(date_mission=today, merchandiser__isnull=False, client__isnull=False)
+            .order_by('id').first()
+        )
+        if mission is None:
+            raise BenchmarkError("Aucune mission du jour : générer d'abord un jeu de données")
+        self.merch = mission.merchandiser
+        self.mission = mission
+        # Mission passée du même merchandiser, avec photos
+        self.photo_mission = (
+            Mission.objects.filter(merchandiser=self.merch, photos__isnull=False)
+            .order_by('-date_mission').first()
+        )
+        self.client_id = mission.client_id
+        self.client_user = CustomUser.objects.filter(role='client', client_id=self.client_id).first()
+        if self.client_user is None:
+            raise BenchmarkError(f"Aucun utilisateur client pour le client {self.client_id}")
+        self.produits = list(
+            ProduitClient.objects.filter(client_id=self.client_id).values_list('id', flat=True)[:10]
+        )
+
+        self.merch_http = Client(SERVER_NAME=host)
+        self.merch_http.force_login(self.merch)
+        self.client_http = Client(SERVER_NAME=host)
+        self.client_http.force_login(self.client_user)
+
+
+def _get(http, url, **params):
+    def run():
+        response = http.get(url, params)
+        if response.status_code != 200:
+            raise BenchmarkError(f"{url} : HTTP {response.status_code}")
+    return run
+
+
+def _save_client_products(ctx):
+    url = reverse('save_client_products', args=[ctx.mission.id])
+    body = json.dumps({'items': [
+        {'produit_id': produit_id, 'disponible': True, 'facing_share': 20, 'prix_vente': '120.00', 'stock': 12}
+        for produit_id in ctx.produits
+    ]})
+
+    def run():
+        with transaction.atomic():
+            response = ctx.merch_http.post(url, body, content_type='application/json')
+            transaction.set_rollback(True)
+        if response.status_code != 200:
+            raise BenchmarkError(f"{url} : HTTP {response.status_code}")
+    return run
+
+
+def _client_kpis(ctx):
+    date_from = localdate() - timedelta(days=90)
+    return lambda: analytics.client_kpis(ctx.client_id, date_from=date_from)
+
+
+def _list_photos(ctx):
+    if ctx.photo_mission is None:
+        raise BenchmarkError("Aucune mission avec photos")
+    return _get(ctx.merch_http, reverse('list_photos', args=[ctx.photo_mission.id]))
+
+
+# nom -> fabrique du scénario (Context -> callable sans argument)
+SCENARIOS = {
+    'dashboard_merch': lambda ctx: _get(ctx.merch_http, reverse('dashboard_merch')),
+    'list_photos': _list_photos,
+    'save_client_products': _save_client_products,
+    'client_dashboard': lambda ctx: _get(ctx.client_http, reverse('client_dashboard')),
+    'client_kpis_view': lambda ctx: _get(ctx.client_http, reverse('client_kpis')),
+    'client_kpis_query': _client_kpis,
+}
+
+
+def measure(run, iterations=DEFAULT_ITERATIONS, warmup=DEFAULT_WARMUP):
+    for _ in range(warmup):
+        run()
+    timings, queries = [], []
+    for _ in range(iterations):
+        with track_queries() as stats:
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        queries.append(stats.count)
+    # Passage séparé : tracemalloc ralentit l'exécution
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    ms = np.array(timings) * 1000
+    return {
+        'iterations': iterations,
+        'p50_ms': round(float(np.percentile(ms, 50)), 2),
+        'p95_ms': round(float(np.percentile(ms, 95)), 2),
+        'mean_ms': round(float(ms.mean()), 2),
+        'queries': max(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def dataset_size():
+    return {
+        'pdvs': PointDeVente.objects.count(),
+        'missions': Mission.objects.count(),
+        'realisations_client': RealisationClientData.objects.count(),
+        'realisations_concurrence': RealisationConcurrenceData.objects.count(),
+        'photos': PhotoMission.objects.count(),
+    }
+
+
+def run_benchmarks(names=None, iterations=DEFAULT_ITERATIONS, warmup=DEFAULT_WARMUP, host='localhost', log=None):
+    names = list(names or SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise BenchmarkError(f"Scénario(s) inconnu(s) : {', '.join(sorted(unknown))}")
+    ctx = Context(host=host)
+    results = {}
+    for name in names:
+        results[name] = measure(SCENARIOS[name](ctx), iterations, warmup)
+        if log:
+            log(name, results[name])
+    return {
+        'commit': git_commit(),
+        'created_at': timezone.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'dataset': dataset_size(),
+        'results': results,
+    }
+
+
+def compare(current, baseline):
+    """Lignes (scénario, mesure, avant, après, écart %) pour les scénarios communs."""
+    rows = []
+    for name, after in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        for key in ('p50_ms', 'p95_ms', 'queries', 'peak_kb'):
+            old, new = before.get(key), after.get(key)
+            delta = None if not old else round((new - old) * 100 / old, 1)
+            rows.append((name, key, old, new, delta))
+    return rows
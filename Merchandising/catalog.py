@@ -0,0 +1,85 @@
+"""
+Catalogue client (produits, concurrents, catégories) mis en cache.
+
+Le contenu est mis en cache sous la clé (client, version) : une
+modification du catalogue incrémente CatalogVersion (cf. signals.py),
+ce qui rend l'ancienne entrée inutilisée sans invalidation explicite.
+Lire le catalogue coûte donc une requête sur la clé primaire de
+CatalogVersion, quel que soit le nombre de produits.
+"""
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import CatalogVersion, ProduitClient, ProduitConcurrent
+
+CACHE_TIMEOUT = 7 * 24 * 3600
+
+
+def get_version(client_id):
+    if client_id is None:
+        return 0
+    version = CatalogVersion.objects.filter(client_id=client_id).values_list('version', flat=True).first()
+    if version is None:
+        version = CatalogVersion.objects.get_or_create(client_id=client_id)[0].version
+    return version
+
+
+def bump_version(client_id):
+    # Sans ligne CatalogVersion, aucun catalogue n'a encore été mis en cache
+    if client_id is not None:
+        CatalogVersion.objects.filter(client_id=client_id).update(version=F('version') + 1)
+
+
+def etag(client_id, version):
+    return f'"catalog-{client_id}-{version}"'
+
+
+def _image_url(p):
+    return p.image.url if p.image else None
+
+
+def build_catalog(client_id):
+    produits = [{
+        'id': p.id,
+        'nom': p.nom,
+        'categorie': p.categorie,
+        'format': p.format,
+        'image': _image_url(p),
+    } for p in ProduitClient.objects.filter(client_id=client_id).order_by('categorie', 'nom', 'id')]
+
+    concurrents = [{
+        'id': p.id,
+        'nom': p.nom,
+        'categorie': p.categorie,
+        'format': p.format,
+        'image': _image_url(p),
+        'concurrent_id': p.concurrent_id,
+        'concurrent': p.concurrent.nom,
+    } for p in (
+        ProduitConcurrent.objects.filter(concurrent__client_id=client_id)
+        .select_related('concurrent')
+        .order_by('categorie', 'nom', 'id')
+    )]
+
+    return {
+        'client_id': client_id,
+        'client_products': produits,
+        'concurrent_products': concurrents,
+        'categories': sorted({p['categorie'] for p in produits}),
+    }
+
+
+def get_catalog(client_id, version=None):
+    """Retourne (version, catalogue) pour un client, depuis le cache si possible."""
+    if version is None:
+        version = get_version(client_id)
+    if client_id is None:
+        return version, {'client_id': None, 'client_products': [], 'concurrent_products': [], 'categories': []}
+
+    key = f'catalog:{client_id}:{version}'
+    catalog = cache.get(key)
+    if catalog is None:
+        catalog = build_catalog(client_id)
+        catalog['version'] = version
+        cache.set(key, catalog, CACHE_TIMEOUT)
+    return version, catalog
@@ -0,0 +1,241 @@
+"""
+Upload photo reprenable, par morceaux, pour les liaisons mobiles instables.
+
+Protocole (cf. urls.py) :
+1. POST missions/<id>/uploads : {upload_id, size, sha256, categorie,
+   photo_type, filename}. `upload_id` vient du téléphone : un renvoi
+   retrouve l'upload et renvoie ce qui est déjà reçu ;
+2. PUT uploads/<upload_id>?offset=N : le corps brut du morceau, en-tête
+   X-Chunk-Sha256 facultatif. Les morceaux peuvent arriver dans le
+   désordre, en double ou en parallèle ;
+3. GET uploads/<upload_id> : intervalles reçus, pour reprendre après une
+   coupure sans renvoyer ce qui est déjà arrivé ;
+4. POST uploads/<upload_id>/complete : vérifie que tout est reçu et que
+   le SHA-256 du fichier correspond, puis crée la PhotoMission (cf.
+   uploads.create_photo). Idempotent.
+
+Le fichier est préalloué dans le spool et chaque morceau y est écrit à
+son offset, lu par blocs depuis la requête : le fichier n'est jamais
+gardé en mémoire. Un morceau accompagné de X-Chunk-Sha256 est d'abord lu
+dans un tampon (en mémoire jusqu'à PHOTO_CHUNK_SIZE, sur disque au-delà)
+et n'est écrit qu'une fois sa somme vérifiée : un renvoi corrompu ne
+peut pas écraser des octets déjà reçus. Un morceau entièrement déjà reçu
+est ignoré.
+
+Un merchandiser a au plus PHOTO_UPLOAD_MAX_OPEN uploads non terminés ;
+`manage.py purge_chunked_uploads` supprime les uploads abandonnés (et
+leur fichier) et oublie les uploads terminés après STALE_AFTER.
+"""
+import hashlib
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import fingerprint
+from .models import ChunkedUpload
+from .uploads import create_photo, spool_dir
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+DEFAULT_MAX_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_MAX_FILE_SIZE = 25 * 1024 * 1024
+DEFAULT_MAX_OPEN = 20
+READ_SIZE = 64 * 1024
+STALE_AFTER = timedelta(days=2)
+
+
+class ChunkError(Exception):
+    """Requête refusée ; le message sert de raison dans la réponse."""
+
+
+class TooManyUploads(ChunkError):
+    """Limite d'uploads non terminés atteinte (réponse 429)."""
+
+
+def chunk_size():
+    return getattr(settings, 'PHOTO_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def merge(ranges, start, end):
+    """Ajoute [start, end) à une liste triée d'intervalles disjoints et fusionne."""
+    merged = []
+    for lo, hi in sorted([*ranges, [start, end]]):
+        if merged and lo <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return merged
+
+
+def is_complete(upload):
+    return upload.received == [[0, upload.size]]
+
+
+def is_received(upload, start, end):
+    return any(lo <= start and end <= hi for lo, hi in upload.received)
+
+
+def open_uploads(user):
+    """Uploads non terminés de `user`, hors uploads abandonnés (cf. purge_stale)."""
+    return ChunkedUpload.objects.filter(
+        merch=user, photo__isnull=True, updated_at__gte=timezone.now() - STALE_AFTER,
+    )
+
+
+def state(upload):
+    return {
+        'upload_id': str(upload.upload_id),
+        'size': upload.size,
+        'chunk_size': chunk_size(),
+        'received': upload.received,
+        'complete': is_complete(upload),
+        'photo_id': upload.photo_id,
+    }
+
+
+def init_upload(mission, user, payload):
+    try:
+        upload_id = uuid.UUID(str(payload.get('upload_id')))
+        size = int(payload.get('size'))
+    except (TypeError, ValueError):
+        raise ChunkError("upload_id ou size invalide")
+    sha256 = str(payload.get('sha256') or '').lower()
+    categorie = payload.get('categorie')
+    photo_type = payload.get('photo_type')
+    if len(sha256) != 64 or not categorie or photo_type not in ('avant', 'apres'):
+        raise ChunkError("missing parameters")
+    if not 0 < size <= getattr(settings, 'PHOTO_UPLOAD_MAX_SIZE', DEFAULT_MAX_FILE_SIZE):
+        raise ChunkError("taille invalide")
+
+    previous = ChunkedUpload.objects.filter(upload_id=upload_id).first()
+    if previous is not None:
+        if previous.mission_id != mission.id or previous.sha256 != sha256 or previous.size != size:
+            raise ChunkError("upload_id déjà utilisé pour un autre fichier")
+        return previous
+    if open_uploads(user).count() >= getattr(settings, 'PHOTO_UPLOAD_MAX_OPEN', DEFAULT_MAX_OPEN):
+        raise TooManyUploads("trop d'uploads en cours")
+
+    # Nom définitif dès le départ : le fichier complet n'a pas à être déplacé
+    suffix = Path(payload.get('filename') or '').suffix.lower()[:10]
+    path = spool_dir() / f"{upload_id.hex}{suffix}"
+    with open(path, 'wb') as fh:
+        fh.truncate(size)
+    return ChunkedUpload.objects.create(
+        upload_id=upload_id,
+        mission=mission,
+        merch=user,
+        filename=(payload.get('filename') or '')[:255],
+        size=size,
+        sha256=sha256,
+        categorie=categorie,
+        type_photo=photo_type,
+        spool_path=str(path),
+    )
+
+
+def _copy(source, target, length, digest=None):
+    """Copie au plus `length` octets par blocs ; retourne le nombre copié."""
+    copied = 0
+    while copied < length:
+        block = source.read(min(READ_SIZE, length - copied))
+        if not block:
+            break
+        if digest is not None:
+            digest.update(block)
+        target.write(block)
+        copied += len(block)
+    return copied
+
+
+def write_chunk(upload, offset, stream, length, checksum=None):
+    """
+    Écrit `length` octets lus dans `stream` à `offset` du fichier spool,
+    après vérification de `checksum` s'il est donné. Ne touche pas la base
+    (appelable hors du thread de l'ORM) ; la plage n'est comptée
+    qu'ensuite, par record_chunk.
+    """
+    if upload.photo_id is not None:
+        return
+    if offset < 0 or length <= 0 or offset + length > upload.size:
+        raise ChunkError("plage invalide")
+    if length > getattr(settings, 'PHOTO_CHUNK_MAX_SIZE', DEFAULT_MAX_CHUNK_SIZE):
+        raise ChunkError("morceau trop grand")
+    if is_received(upload, offset, offset + length):
+        return
+
+    if not checksum:
+        with open(upload.spool_path, 'r+b') as fh:
+            fh.seek(offset)
+            if _copy(stream, fh, length) != length:
+                raise ChunkError("morceau incomplet")
+        return
+
+    digest = hashlib.sha256()
+    with tempfile.SpooledTemporaryFile(max_size=chunk_size(), dir=spool_dir()) as buffer:
+        if _copy(stream, buffer, length, digest) != length:
+            raise ChunkError("morceau incomplet")
+        if digest.hexdigest() != checksum.lower():
+            raise ChunkError("somme de contrôle du morceau invalide")
+        buffer.seek(0)
+        with open(upload.spool_path, 'r+b') as fh:
+            fh.seek(offset)
+            _copy(buffer, fh, length)
+
+
+def record_chunk(upload, offset, length):
+    with transaction.atomic():
+        locked = ChunkedUpload.objects.select_for_update().get(id=upload.id)
+        if locked.photo_id is None:
+            locked.received = merge(locked.received, offset, offset + length)
+            locked.save(update_fields=['received', 'updated_at'])
+    return locked
+
+
+def complete_upload(upload):
+    """
+    Crée la photo d'un upload entièrement reçu ; retourne la PhotoMission.
+    Si le fichier assemblé ne correspond pas au SHA-256 annoncé, les plages
+    reçues sont oubliées (tout est à renvoyer) et ChunkError est levée.
+    """
+    with transaction.atomic():
+        upload = ChunkedUpload.objects.select_for_update().select_related('mission', 'photo').get(id=upload.id)
+        if upload.photo_id is not None:
+            return upload.photo
+        if not is_complete(upload):
+            raise ChunkError("upload incomplet")
+        corrupted = fingerprint.sha256_file(upload.spool_path) != upload.sha256
+        if corrupted:
+            upload.received = []
+            upload.save(update_fields=['received', 'updated_at'])
+        else:
+            upload.photo = create_photo(
+                upload.mission, upload.categorie, upload.type_photo, upload.spool_path, upload.sha256,
+            )
+            upload.save(update_fields=['photo', 'updated_at'])
+    if corrupted:
+        raise ChunkError("somme de contrôle du fichier invalide")
+    return upload.photo
+
+
+def purge_stale(older_than=STALE_AFTER):
+    """
+    Supprime les uploads sans activité depuis `older_than` ; retourne leur
+    nombre. Le fichier d'un upload abandonné est supprimé ; celui d'un
+    upload terminé appartient à la photo (supprimé par uploads.push_photo).
+    """
+    stale = ChunkedUpload.objects.filter(updated_at__lt=timezone.now() - older_than)
+    count = 0
+    for upload in stale.iterator():
+        if upload.photo_id is None:
+            try:
+                os.remove(upload.spool_path)
+            except OSError:
+                pass
+        upload.delete()
+        count += 1
+    return count
@@ -0,0 +1,137 @@
+"""
+Attribution des codes PointDeVente / Mission.
+
+Les codes viennent d'un compteur en base par type (CodeSequence) : une
+plage de n valeurs est réservée en une transaction (un UPDATE puis un
+SELECT), quelle que soit la taille du lot. Les valeurs sont écrites en
+base 36 sur 7 caractères (78 milliards de codes) ; les anciens codes
+aléatoires ont 6 caractères, les deux formats ne peuvent donc pas se
+croiser.
+
+Hors transaction, chaque processus réserve des blocs de BLOCK_SIZE valeurs
+et les distribue aux save() unitaires sans retourner en base. Dans une
+transaction englobante, on réserve au plus juste : un rollback rendrait
+les valeurs d'un bloc en cache à nouveau distribuables.
+
+Un conflit reste possible (code saisi à la main, compteur réinitialisé) :
+save_with_code et bulk_create réattribuent alors de nouveaux codes et
+réessaient.
+"""
+import threading
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import CodeSequence
+
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+WIDTH = 7
+BLOCK_SIZE = 50
+RETRIES = 3
+BULK_BATCH_SIZE = 1000
+
+_lock = threading.Lock()
+_blocks = {}  # name -> [prochaine valeur, fin exclue]
+
+
+def _base36(value):
+    digits = []
+    while value:
+        value, rest = divmod(value, 36)
+        digits.append(ALPHABET[rest])
+    return ''.join(reversed(digits)).rjust(WIDTH, '0')
+
+
+def _mission_code(obj, value):
+    return f"MSN-{_base36(value)}"
+
+
+def _pdv_code(obj, value):
+    wilaya_part = (obj.wilaya or '').upper().replace(" ", "")[:5]
+    return f"PDV-{wilaya_part}-{_base36(value)}"
+
+
+FORMATS = {
+    'mission': _mission_code,
+    'pdv': _pdv_code,
+}
+
+
+def reserve(name, count):
+    """Réserve `count` valeurs consécutives du compteur `name` ; retourne la première."""
+    for _ in range(RETRIES):
+        with transaction.atomic():
+            updated = CodeSequence.objects.filter(name=name).update(next_value=F('next_value') + count)
+            if updated:
+                return CodeSequence.objects.get(name=name).next_value - count
+        try:
+            with transaction.atomic():
+                CodeSequence.objects.create(name=name, next_value=1 + count)
+            return 1
+        except IntegrityError:
+            # Créé entre-temps par un autre processus
+            continue
+    raise IntegrityError(f"Compteur {name} indisponible")
+
+
+def next_values(name, count):
+    """`count` valeurs inédites du compteur `name`."""
+    if count <= 0:
+        return []
+    if transaction.get_connection().in_atomic_block or count >= BLOCK_SIZE:
+        start = reserve(name, count)
+        return list(range(start, start + count))
+    with _lock:
+        block = _blocks.get(name)
+        if block is None or block[1] - block[0] < count:
+            start = reserve(name, BLOCK_SIZE)
+            block = _blocks[name] = [start, start + BLOCK_SIZE]
+        values = list(range(block[0], block[0] + count))
+        block[0] += count
+    return values
+
+
+def assign_codes(objs, kind):
+    """Attribue un nouveau code à chaque objet (kind : 'mission' | 'pdv')."""
+    build = FORMATS[kind]
+    for obj, value in zip(objs, next_values(kind, len(objs))):
+        obj.code = build(obj, value)
+    return objs
+
+
+def _code_taken(model, objs):
+    return model._default_manager.filter(code__in=[obj.code for obj in objs]).exists()
+
+
+def _save_retrying(model, objs, kind, save):
+    for attempt in range(RETRIES):
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError:
+            if attempt == RETRIES - 1 or not _code_taken(model, objs):
+                raise
+            assign_codes(objs, kind)
+
+
+def save_with_code(obj, kind, save):
+    """
+    Appelle `save()` pour un objet dont le code vient d'être attribué ;
+    si ce code est déjà pris, en attribue un autre et recommence.
+    """
+    return _save_retrying(type(obj), [obj], kind, save)
+
+
+def bulk_create(model, objs, kind, batch_size=BULK_BATCH_SIZE):
+    """
+    bulk_create par paquets avec codes réservés d'avance ; un paquet en
+    conflit sur un code est réinséré avec de nouveaux codes.
+    Retourne le nombre d'objets insérés.
+    """
+    objs = list(objs)
+    assign_codes(objs, kind)
+    for start in range(0, len(objs), batch_size):
+        chunk = objs[start:start + batch_size]
+        _save_retrying(model, chunk, kind, partial(model._default_manager.bulk_create, chunk))
+    return len(objs)
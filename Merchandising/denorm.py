@@ -0,0 +1,191 @@
+"""
+Colonnes dénormalisées depuis le PDV (wilaya, région) et la mission
+(client, PDV) sur les relevés, les photos et les tables dérivées.
+
+- denormalize : remplit ces colonnes pour une liste d'objets du même
+  modèle. Les relations déjà chargées (mission.pdv, pdv) sont utilisées
+  telles quelles ; les autres sont lues en une requête pour tout le lot.
+  C'est ce qu'appellent save() et DenormalizedQuerySet.bulk_create_denormalized ;
+- cascade_pdv : quand un PDV change de wilaya / région / commune,
+  recopie les nouvelles valeurs dans toutes les tables qui les
+  dénormalisent, en un UPDATE par table. Déclenché par le signal
+  post_save du PDV et par l'import ; `manage.py refresh_denormalized`
+  le rejoue sur tous les PDV, client compris (cf. CLIENT_SOURCES), ce
+  qui répare aussi les lignes écrites sans client.
+"""
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+
+from .models import (
+    DailyRealisationClient,
+    DailyRealisationConcurrence,
+    DashboardFacet,
+    Mission,
+    PhotoMission,
+    PointDeVente,
+    ProduitClient,
+    ProduitConcurrent,
+    RealisationClientData,
+    RealisationConcurrenceData,
+    VisitSummary,
+)
+
+GEO_FIELDS = ('wilaya', 'region')
+# Tables qui recopient wilaya / région du PDV
+GEO_MODELS = (
+    RealisationClientData,
+    RealisationConcurrenceData,
+    PhotoMission,
+    VisitSummary,
+    DailyRealisationClient,
+    DailyRealisationConcurrence,
+)
+CASCADE_BATCH = 500
+
+
+def _value(model, field, ref):
+    return Subquery(model.objects.filter(id=OuterRef(ref)).values(field)[:1])
+
+
+def _client_sources():
+    """Modèle -> expression du client : celui du produit, sinon celui de la mission."""
+    mission_client = _value(Mission, 'client_id', 'mission_id')
+    return {
+        RealisationClientData: Coalesce(_value(ProduitClient, 'client_id', 'produit_id'), mission_client),
+        RealisationConcurrenceData: Coalesce(
+            _value(ProduitConcurrent, 'concurrent__client_id', 'produit_concurrent_id'), mission_client,
+        ),
+        PhotoMission: mission_client,
+        DailyRealisationClient: _value(ProduitClient, 'client_id', 'produit_id'),
+        DailyRealisationConcurrence: _value(ProduitConcurrent, 'concurrent__client_id', 'produit_concurrent_id'),
+    }
+
+
+def _cached(obj, name):
+    return obj._meta.get_field(name).is_cached(obj)
+
+
+def _from_missions(objs):
+    """PhotoMission : client et PDV recopiés depuis la mission."""
+    missing = {obj.mission_id for obj in objs if obj.mission_id and not _cached(obj, 'mission')}
+    rows = {}
+    if missing:
+        rows = {
+            mission_id: (client_id, pdv_id)
+            for mission_id, client_id, pdv_id in Mission.objects.filter(id__in=missing)
+            .values_list('id', 'client_id', 'pdv_id')
+        }
+    for obj in objs:
+        if not obj.mission_id:
+            continue
+        if obj.mission_id in rows:
+            obj.client_id, obj.pdv_id = rows[obj.mission_id]
+            continue
+        mission = obj.mission
+        obj.client_id = mission.client_id
+        if _cached(mission, 'pdv'):
+            obj.pdv = mission.pdv
+        else:
+            obj.pdv_id = mission.pdv_id
+
+
+def denormalize(objs):
+    """Remplit les colonnes dénormalisées d'objets du même modèle (au plus deux requêtes)."""
+    objs = list(objs)
+    if not objs:
+        return objs
+    if isinstance(objs[0], PhotoMission):
+        _from_missions(objs)
+
+    missing = {obj.pdv_id for obj in objs if obj.pdv_id and not _cached(obj, 'pdv')}
+    geo = {}
+    if missing:
+        geo = {
+            pdv_id: (wilaya, region)
+            for pdv_id, wilaya, region in PointDeVente.objects.filter(id__in=missing)
+            .values_list('id', *GEO_FIELDS)
+        }
+    for obj in objs:
+        if not obj.pdv_id:
+            continue
+        if obj.pdv_id in geo:
+            obj.wilaya, obj.region = geo[obj.pdv_id]
+        else:
+            obj.wilaya, obj.region = obj.pdv.wilaya, obj.pdv.region
+    return objs
+
+
+def denormalize_on_save(obj, update_fields):
+    """
+    Appelé par save() : rien à faire si l'enregistrement est partiel et ne
+    touche pas les colonnes dénormalisées.
+    """
+    if update_fields is not None and not set(update_fields) & {'pdv', 'mission', *GEO_FIELDS}:
+        return
+    denormalize([obj])
+
+
+def _pdv_value(field):
+    return _value(PointDeVente, field, 'pdv_id')
+
+
+def _pdv_label():
+    # Même format que PointDeVente.__str__
+    label = PointDeVente.objects.filter(id=OuterRef('pdv_id')).annotate(
+        label=Concat('code', Value(' - '), 'commune', Value(', '), 'wilaya'),
+    )
+    return Subquery(label.values('label')[:1])
+
+
+def cascade_pdv(pdv_ids=None, batch_size=CASCADE_BATCH, with_client=False):
+    """
+    Recopie wilaya / région (et le libellé des résumés de visite) des PDV
+    donnés, ou de tous les PDV, dans les tables dénormalisées ; avec
+    `with_client`, recalcule aussi leur client. Retourne le nombre de
+    lignes mises à jour.
+    """
+    clients = _client_sources() if with_client else {}
+    if pdv_ids is None:
+        pdv_ids = PointDeVente.objects.order_by('id').values_list('id', flat=True)
+    pdv_ids = list(pdv_ids)
+    updated = 0
+    for start in range(0, len(pdv_ids), batch_size):
+        batch = pdv_ids[start:start + batch_size]
+        with transaction.atomic():
+            for model in GEO_MODELS:
+                values = {field: _pdv_value(field) for field in GEO_FIELDS}
+                if model is VisitSummary:
+                    values['pdv_label'] = _pdv_label()
+                if model in clients:
+                    values['client_id'] = clients[model]
+                updated += model.objects.filter(pdv_id__in=batch).update(**values)
+            # Nouvelles valeurs de filtre pour les clients concernés
+            pairs = (
+                VisitSummary.objects.filter(pdv_id__in=batch)
+                .values_list('client_id', *GEO_FIELDS)
+                .distinct()
+            )
+            DashboardFacet.objects.bulk_create(
+                [
+                    DashboardFacet(client_id=client_id, kind=kind, value=value)
+                    for client_id, wilaya, region in pairs
+                    for kind, value in (('wilaya', wilaya), ('region', region))
+                    if value
+                ],
+                ignore_conflicts=True,
+            )
+    return updated
+
+
+def pdv_moved(pdv):
+    """Vrai si wilaya / région / commune diffèrent des valeurs lues en base."""
+    loaded = getattr(pdv, '_loaded_geo', None)
+    current = tuple(getattr(pdv, f) for f in PointDeVente.DENORMALIZED_FIELDS)
+    return loaded is not None and loaded != current
+
+
+def remember(pdv):
+    """Les valeurs actuelles du PDV deviennent la référence de pdv_moved."""
+    if not set(PointDeVente.DENORMALIZED_FIELDS) & pdv.get_deferred_fields():
+        pdv._loaded_geo = tuple(getattr(pdv, f) for f in PointDeVente.DENORMALIZED_FIELDS)
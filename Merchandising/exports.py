@@ -0,0 +1,161 @@
+"""
+Export des réalisations (client / concurrence) en CSV ou Excel.
+
+Les lignes sont lues par paquets avec `.values_list().iterator()` et
+écrites au fil de l'eau : la mémoire reste constante quel que soit le
+nombre de lignes.
+
+- CSV : générateur servi directement par StreamingHttpResponse ;
+- XLSX : classeur openpyxl en mode write-only (write_xlsx, une feuille
+  par tranche de MAX_XLSX_ROWS lignes), écrit directement dans le
+  fichier de sortie par la commande ; pour la vue, dans un fichier
+  temporaire rendu par morceaux (iter_xlsx).
+"""
+import csv
+import tempfile
+from datetime import date
+
+from openpyxl import Workbook
+
+from .models import RealisationClientData, RealisationConcurrenceData
+
+CHUNK_SIZE = 2000
+# Limite Excel : 1 048 576 lignes par feuille, en-tête compris
+MAX_XLSX_ROWS = 1_048_575
+# Classeur gardé en mémoire jusqu'à cette taille, puis sur disque
+XLSX_SPOOL_SIZE = 8 * 1024 * 1024
+XLSX_READ_SIZE = 64 * 1024
+
+EXPORTS = {
+    'client': {
+        'model': RealisationClientData,
+        'columns': [
+            ('Date', 'date_realisation'),
+            ('Mission', 'mission__code'),
+            ('Code PDV', 'pdv__code'),
+            ('N° PDV', 'pdv__no_pdv'),
+            ('Wilaya', 'wilaya'),
+            ('Région', 'region'),
+            ('Merch prénom', 'merch__first_name'),
+            ('Merch nom', 'merch__last_name'),
+            ('Produit', 'produit__nom'),
+            ('Catégorie', 'produit__categorie'),
+            ('Format', 'produit__format'),
+            ('Disponible', 'disponible'),
+            ('Handling', 'handling'),
+            ('Part de linéaire (%)', 'facing_share'),
+            ('Prix de vente', 'prix_vente'),
+            ('Stock', 'stock'),
+        ],
+    },
+    'concurrence': {
+        'model': RealisationConcurrenceData,
+        'columns': [
+            ('Date', 'date_realisation'),
+            ('Mission', 'mission__code'),
+            ('Code PDV', 'pdv__code'),
+            ('N° PDV', 'pdv__no_pdv'),
+            ('Wilaya', 'wilaya'),
+            ('Région', 'region'),
+            ('Merch prénom', 'merch__first_name'),
+            ('Merch nom', 'merch__last_name'),
+            ('Concurrent', 'produit_concurrent__concurrent__nom'),
+            ('Produit', 'produit_concurrent__nom'),
+            ('Catégorie', 'produit_concurrent__categorie'),
+            ('Format', 'produit_concurrent__format'),
+            ('Disponible', 'disponible'),
+            ('Part de linéaire (%)', 'facing_share'),
+            ('Prix de vente', 'prix_vente'),
+            ('Stock', 'stock'),
+        ],
+    },
+}
+
+
+class InvalidExport(ValueError):
+    pass
+
+
+def export_queryset(kind, client_id=None, date_from=None, date_to=None, region=None, wilaya=None):
+    if kind not in EXPORTS:
+        raise InvalidExport(f"type d'export inconnu : {kind}")
+    spec = EXPORTS[kind]
+    qs = spec['model'].objects.all()
+    if client_id is not None:
+        qs = qs.filter(client_id=client_id)
+    if date_from:
+        qs = qs.filter(date_realisation__gte=date_from)
+    if date_to:
+        qs = qs.filter(date_realisation__lte=date_to)
+    if region:
+        qs = qs.filter(region=region)
+    if wilaya:
+        qs = qs.filter(wilaya=wilaya)
+    return qs.order_by('id').values_list(*[f for _, f in spec['columns']])
+
+
+def headers(kind):
+    return [label for label, _ in EXPORTS[kind]['columns']]
+
+
+def iter_rows(queryset, chunk_size=CHUNK_SIZE):
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """Pseudo-fichier : csv.writer renvoie la ligne au lieu de l'écrire."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(kind, queryset, chunk_size=CHUNK_SIZE):
+    writer = csv.writer(_Echo(), delimiter=';')
+    # BOM pour qu'Excel détecte l'UTF-8
+    yield '\ufeff' + writer.writerow(headers(kind))
+    for row in iter_rows(queryset, chunk_size):
+        yield writer.writerow(row)
+
+
+def write_xlsx(kind, queryset, target, chunk_size=CHUNK_SIZE):
+    """Écrit le classeur dans `target` (chemin ou fichier). Retourne le nombre de lignes."""
+    wb = Workbook(write_only=True)
+    ws = None
+    written = 0
+    sheet_rows = MAX_XLSX_ROWS
+    for row in iter_rows(queryset, chunk_size):
+        if sheet_rows >= MAX_XLSX_ROWS:
+            ws = wb.create_sheet(title=f"{kind}_{len(wb.worksheets) + 1}")
+            ws.append(headers(kind))
+            sheet_rows = 0
+        ws.append(list(row))
+        sheet_rows += 1
+        written += 1
+    if ws is None:
+        wb.create_sheet(title=f"{kind}_1").append(headers(kind))
+    wb.save(target)
+    return written
+
+
+def iter_xlsx(kind, queryset, chunk_size=CHUNK_SIZE):
+    """
+    Classeur write_xlsx rendu par morceaux d'octets (cf. StreamingHttpResponse).
+    Écrit d'abord dans un fichier temporaire (en mémoire sous XLSX_SPOOL_SIZE),
+    fermé une fois la réponse consommée ou abandonnée.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_SIZE, suffix='.xlsx') as tmp:
+        write_xlsx(kind, queryset, tmp, chunk_size)
+        tmp.seek(0)
+        while block := tmp.read(XLSX_READ_SIZE):
+            yield block
+
+
+def export_filename(kind, fmt, date_from=None, date_to=None):
+    parts = ['realisations', kind]
+    if date_from:
+        parts.append(str(date_from))
+    if date_to:
+        parts.append(str(date_to))
+    if not date_from and not date_to:
+        parts.append(date.today().isoformat())
+    return '_'.join(parts) + f'.{fmt}'
@@ -0,0 +1,243 @@
+"""
+Empreintes des photos et détection des doublons.
+
+- sha256_file : empreinte exacte du fichier reçu. Un fichier déjà
+  uploadé pour le même client n'est pas renvoyé au stockage (cf.
+  uploads.create_photo) ;
+- perceptual_hash : pHash 64 bits (DCT 32x32 de l'image en niveaux de
+  gris, signe des 8x8 basses fréquences par rapport à leur médiane).
+  Deux photos du même rayon, recadrées ou ré-encodées, sont à quelques
+  bits d'écart ;
+- HashIndex : recherche des empreintes à distance de Hamming <= d.
+  L'empreinte est découpée en d + 1 bandes : deux empreintes à distance
+  <= d ont au moins une bande identique (principe des tiroirs). Chaque
+  bande est un tableau trié (recherche dichotomique), seuls les candidats
+  ainsi trouvés sont comparés bit à bit. Quelques millisecondes pour
+  des millions d'empreintes.
+
+L'index vit en mémoire dans chaque processus (comme geo.PDVIndex) et est
+complété au fil des uploads du processus (cf. uploads.push_photo). Passé
+INDEX_TTL secondes, un seul appelant le reconstruit, hors du verrou :
+les autres continuent de chercher dans l'ancien index pendant ce temps.
+"""
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import PhotoMission
+
+HASH_SIDE = 32
+LOW_FREQ = 8
+DEFAULT_NEAR_DISTANCE = 6
+INDEX_TTL = 300
+READ_SIZE = 1 << 20
+# Empreintes lues par requête lors de la construction de l'index
+FETCH_SIZE = 10_000
+
+
+class FingerprintError(Exception):
+    pass
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / n)
+
+
+_DCT = _dct_matrix(HASH_SIDE)
+_BITS = 1 << np.arange(63, -1, -1, dtype=np.uint64)
+
+
+def perceptual_hash(img):
+    """pHash 64 bits d'une image PIL, en entier signé (colonne BigIntegerField)."""
+    gray = ImageOps.exif_transpose(img).convert('L').resize((HASH_SIDE, HASH_SIDE), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:LOW_FREQ, :LOW_FREQ].ravel()
+    # Le coefficient continu (luminosité moyenne) ne compte pas dans la médiane
+    bits = low > np.median(low[1:])
+    value = np.bitwise_or.reduce(_BITS[bits], initial=np.uint64(0))
+    return int(np.array(value, dtype=np.uint64).view(np.int64))
+
+
+def perceptual_hash_file(path):
+    try:
+        with Image.open(path) as img:
+            img.draft('L', (HASH_SIDE * 4, HASH_SIDE * 4))  # décodage JPEG réduit
+            return perceptual_hash(img)
+    except (UnidentifiedImageError, OSError) as exc:
+        raise FingerprintError(str(exc)) from exc
+
+
+def _popcount(values):
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def hamming(a, b):
+    return int(_popcount(np.array([a ^ b], dtype=np.int64).view(np.uint64))[0])
+
+
+def near_distance():
+    return getattr(settings, 'PHOTO_NEAR_DUPLICATE_DISTANCE', DEFAULT_NEAR_DISTANCE)
+
+
+@dataclass
+class Match:
+    photo_id: int
+    distance: int
+
+
+class HashIndex:
+    """Empreintes (uint64) et photo / client / mission correspondants, indexés par bande."""
+
+    def __init__(self, ids, hashes, clients, missions, max_distance=DEFAULT_NEAR_DISTANCE):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.hashes = np.asarray(hashes, dtype=np.int64).view(np.uint64)
+        # client inconnu : -1
+        self.clients = np.asarray(clients, dtype=np.int64)
+        self.missions = np.asarray(missions, dtype=np.int64)
+        self.max_distance = max_distance
+        edges = np.linspace(0, 64, max_distance + 2).astype(int)
+        self.bands = []
+        for lo, hi in zip(edges[:-1], edges[1:]):
+            shift, mask = np.uint64(64 - hi), np.uint64((1 << (hi - lo)) - 1)
+            keys = (self.hashes >> shift) & mask
+            order = np.argsort(keys, kind='stable').astype(np.int32)
+            self.bands.append((shift, mask, keys[order], order))
+        self._extra = []  # ajouts depuis la construction : (id, hash, client, mission)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_queryset(cls, queryset=None, max_distance=None, chunk_size=FETCH_SIZE):
+        """
+        Lit les empreintes par paquets de `chunk_size` lignes, converties
+        aussitôt en tableaux NumPy (4 x 8 octets par photo) : l'historique
+        complet n'est jamais chargé en tuples Python.
+        """
+        queryset = queryset if queryset is not None else PhotoMission.objects.filter(phash__isnull=False)
+        rows = queryset.values_list('id', 'phash', 'client_id', 'mission_id').iterator(chunk_size=chunk_size)
+        blocks = [[] for _ in range(4)]
+        while chunk := list(islice(rows, chunk_size)):
+            table = np.array(
+                [(photo_id, phash, -1 if client_id is None else client_id, mission_id)
+                 for photo_id, phash, client_id, mission_id in chunk],
+                dtype=np.int64,
+            )
+            for column, block in zip(table.T, blocks):
+                block.append(column.copy())
+        columns = [np.concatenate(block) if block else np.empty(0, dtype=np.int64) for block in blocks]
+        return cls(*columns, max_distance if max_distance is not None else near_distance())
+
+    def __len__(self):
+        return len(self.ids) + len(self._extra)
+
+    def add(self, photo_id, phash, client_id, mission_id):
+        with self._lock:
+            self._extra.append((photo_id, phash, -1 if client_id is None else client_id, mission_id))
+
+    def _candidates(self, value):
+        found = []
+        for shift, mask, keys, order in self.bands:
+            key = (value >> shift) & mask
+            lo, hi = np.searchsorted(keys, key, 'left'), np.searchsorted(keys, key, 'right')
+            if hi > lo:
+                found.append(order[lo:hi])
+        if not found:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(found))
+
+    def search(self, phash, client_id=None, exclude_mission=None, max_distance=None):
+        """Photos à distance <= max_distance (au plus celle de l'index), les plus proches d'abord."""
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        value = np.array([phash], dtype=np.int64).view(np.uint64)[0]
+        client = -1 if client_id is None else client_id
+
+        positions = self._candidates(value)
+        ids, hashes = self.ids[positions], self.hashes[positions]
+        clients, missions = self.clients[positions], self.missions[positions]
+        with self._lock:
+            extra = list(self._extra)
+        if extra:
+            extra = np.array(extra, dtype=np.int64).reshape(-1, 4)
+            ids = np.concatenate([ids, extra[:, 0]])
+            hashes = np.concatenate([hashes, extra[:, 1].view(np.uint64)])
+            clients = np.concatenate([clients, extra[:, 2]])
+            missions = np.concatenate([missions, extra[:, 3]])
+
+        keep = clients == client
+        if exclude_mission is not None:
+            keep &= missions != exclude_mission
+        ids, hashes = ids[keep], hashes[keep]
+        distances = _popcount(hashes ^ value)
+        close = distances <= limit
+        ids, distances = ids[close], distances[close]
+        order = np.lexsort((ids, distances))
+        return [Match(int(ids[i]), int(distances[i])) for i in order]
+
+
+_index = None
+_index_built_at = 0.0
+_index_refreshing = False
+_index_lock = threading.Lock()
+
+
+def _refresh(previous):
+    """Reconstruit l'index (sans verrou) puis le substitue à `previous`."""
+    global _index, _index_built_at, _index_refreshing
+    try:
+        index = HashIndex.from_queryset()
+    except Exception:
+        with _index_lock:
+            _index_refreshing = False
+        raise
+    with _index_lock:
+        # Ajouts du processus pendant la reconstruction, pas encore lus en base
+        with previous._lock:
+            extra = list(previous._extra)
+        if extra:
+            ids = np.array([row[0] for row in extra], dtype=np.int64)
+            index._extra = [row for row, known in zip(extra, np.isin(ids, index.ids)) if not known]
+        _index, _index_built_at, _index_refreshing = index, time.monotonic(), False
+        return _index
+
+
+def get_index():
+    global _index, _index_built_at, _index_refreshing
+    with _index_lock:
+        if _index is None:
+            # Première construction : les appelants n'ont encore rien à consulter
+            _index = HashIndex.from_queryset()
+            _index_built_at = time.monotonic()
+            return _index
+        if _index_refreshing or time.monotonic() - _index_built_at <= INDEX_TTL:
+            return _index
+        _index_refreshing = True
+        previous = _index
+    return _refresh(previous)
+
+
+def find_near_duplicate(photo):
+    """
+    Photo du même client, prise lors d'une autre mission, dont l'empreinte
+    est la plus proche de celle de `photo` (None si aucune sous le seuil).
+    """
+    if photo.phash is None:
+        return None
+    matches = get_index().search(photo.phash, photo.client_id, exclude_mission=photo.mission_id)
+    matches = [m for m in matches if m.photo_id != photo.id]
+    return matches[0] if matches else None
@@ -0,0 +1,197 @@
+"""
+Outils géographiques : distances vectorisées, index spatial des PDV et
+contrôle de géorepérage (geofence) des missions.
+
+L'index découpe la carte en cellules de CELL_DEG degrés ; une recherche
+« PDV à moins de r km » ne calcule les distances que sur les cellules qui
+recouvrent le cercle, au lieu de parcourir les 60 000 PDV. L'index est
+construit une fois par processus à partir de trois colonnes
+(id, latitude, longitude) et reconstruit quand un PDV change (cf.
+signals.py) ou au plus tard après INDEX_TTL secondes. Le numéro de
+version qui signale le changement est gardé dans le cache
+settings.GEO_CACHE_ALIAS : à partager entre processus (ex. Redis), sinon
+les autres processus ne voient le changement qu'à l'expiration du TTL.
+"""
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Mission, PointDeVente
+
+EARTH_RADIUS_M = 6_371_000.0
+# ~2,2 km en latitude : un rayon de 2 km couvre 3 x 3 cellules
+CELL_DEG = 0.02
+INDEX_TTL = 300
+VERSION_KEY = 'geo:pdv_index_version'
+VERSION_TTL = None
+DEFAULT_GEOFENCE_RADIUS_M = 200
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distance orthodromique en mètres ; accepte scalaires ou tableaux (broadcast NumPy)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _cells(lat, lon):
+    return np.floor(np.asarray(lat) / CELL_DEG).astype(np.int64), np.floor(np.asarray(lon) / CELL_DEG).astype(np.int64)
+
+
+@dataclass
+class Neighbour:
+    pdv_id: int
+    distance_m: float
+
+
+class PDVIndex:
+    """Grille régulière sur des tableaux NumPy (ids, latitudes, longitudes)."""
+
+    def __init__(self, ids, lats, lons):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.cells = {}
+        if not len(self.ids):
+            return
+        ci, cj = _cells(self.lats, self.lons)
+        order = np.lexsort((cj, ci))
+        ci, cj = ci[order], cj[order]
+        # Début de chaque cellule dans l'ordre trié
+        starts = np.flatnonzero(np.r_[True, (ci[1:] != ci[:-1]) | (cj[1:] != cj[:-1])])
+        for start, end in zip(starts, np.r_[starts[1:], len(order)]):
+            self.cells[(int(ci[start]), int(cj[start]))] = order[start:end]
+
+    @classmethod
+    def from_queryset(cls, queryset=None):
+        queryset = PointDeVente.objects.all() if queryset is None else queryset
+        rows = np.array(list(queryset.values_list('id', 'latitude', 'longitude').iterator(chunk_size=5000)), dtype=float)
+        if not len(rows):
+            return cls([], [], [])
+        return cls(rows[:, 0], rows[:, 1], rows[:, 2])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _candidates(self, lat, lon, radius_m):
+        dlat = radius_m / 111_320.0
+        dlon = radius_m / (111_320.0 * max(np.cos(np.radians(lat)), 1e-6))
+        i0, j0 = _cells(lat - dlat, lon - dlon)
+        i1, j1 = _cells(lat + dlat, lon + dlon)
+        blocks = [
+            self.cells[(i, j)]
+            for i in range(int(i0), int(i1) + 1)
+            for j in range(int(j0), int(j1) + 1)
+            if (i, j) in self.cells
+        ]
+        return np.concatenate(blocks) if blocks else np.empty(0, dtype=np.int64)
+
+    def nearby(self, lat, lon, radius_m, limit=None):
+        """PDV à moins de `radius_m` mètres, du plus proche au plus lointain."""
+        positions = self._candidates(float(lat), float(lon), float(radius_m))
+        if not len(positions):
+            return []
+        distances = haversine_m(lat, lon, self.lats[positions], self.lons[positions])
+        keep = distances <= radius_m
+        positions, distances = positions[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+        if limit is not None:
+            order = order[:limit]
+        return [Neighbour(int(self.ids[p]), float(d)) for p, d in zip(positions[order], distances[order])]
+
+
+_index = None
+_index_version = None
+_index_built_at = 0.0
+
+
+def _cache():
+    return caches[getattr(settings, 'GEO_CACHE_ALIAS', 'default')]
+
+
+def _bump():
+    cache = _cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Valeur initiale non nulle : un cache vidé ne se confond pas avec la version 0
+        if not cache.add(VERSION_KEY, time.time_ns(), VERSION_TTL):
+            cache.incr(VERSION_KEY)
+
+
+def invalidate():
+    """Signale, après commit, à tous les processus que l'index des PDV doit être reconstruit."""
+    transaction.on_commit(_bump)
+
+
+def get_index():
+    global _index, _index_version, _index_built_at
+    version = _cache().get(VERSION_KEY, 0)
+    expired = time.monotonic() - _index_built_at > INDEX_TTL
+    if _index is None or version != _index_version or expired:
+        _index = PDVIndex.from_queryset()
+        _index_version = version
+        _index_built_at = time.monotonic()
+    return _index
+
+
+def nearby_pdvs(lat, lon, radius_m, limit=50):
+    return get_index().nearby(lat, lon, radius_m, limit)
+
+
+# ---------------------------------------------------------------------------
+# Géorepérage des missions
+# ---------------------------------------------------------------------------
+
+def geofence_radius_m():
+    return getattr(settings, 'GEOFENCE_RADIUS_M', DEFAULT_GEOFENCE_RADIUS_M)
+
+
+def _as_float(value):
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _pdv_position(mission):
+    """(latitude, longitude) du PDV : instance déjà chargée, sinon deux colonnes lues."""
+    if Mission.pdv.is_cached(mission):
+        return mission.pdv.latitude, mission.pdv.longitude
+    return PointDeVente.objects.filter(id=mission.pdv_id).values_list('latitude', 'longitude').get()
+
+
+def apply_geofence(mission):
+    """
+    Calcule la distance au PDV des positions de début / fin de la mission
+    et les indicateurs `*_in_geofence`. Retourne les champs modifiés.
+    """
+    radius = geofence_radius_m()
+    changed = []
+    pdv_position = None
+    for prefix in ('begin', 'end'):
+        lat = _as_float(getattr(mission, f'{prefix}_latitude'))
+        lon = _as_float(getattr(mission, f'{prefix}_longitude'))
+        if lat is None or lon is None:
+            distance, inside = None, None
+        else:
+            if pdv_position is None:
+                pdv_position = _pdv_position(mission)
+            distance = round(float(haversine_m(lat, lon, *pdv_position)), 1)
+            inside = distance <= radius
+        if getattr(mission, f'{prefix}_distance_m') != distance:
+            setattr(mission, f'{prefix}_distance_m', distance)
+            changed.append(f'{prefix}_distance_m')
+        if getattr(mission, f'{prefix}_in_geofence') != inside:
+            setattr(mission, f'{prefix}_in_geofence', inside)
+            changed.append(f'{prefix}_in_geofence')
+    return changed
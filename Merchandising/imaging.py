@@ -0,0 +1,60 @@
+"""
+Traitement des photos avant envoi au stockage.
+
+- applique l'orientation EXIF puis supprime toutes les métadonnées
+  (GPS du téléphone compris) ;
+- réduit l'image à MAX_SIDE px sur le plus grand côté, ré-encodée en WebP ;
+- produit une vignette carrée THUMB_SIZE px pour les tuiles des galeries.
+
+Fichier illisible ou trop grand (Image.MAX_IMAGE_PIXELS, « bombe de
+décompression ») : ImageProcessingError, l'original n'est jamais envoyé.
+"""
+from pathlib import Path
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+MAX_SIDE = 1600
+THUMB_SIZE = 256
+QUALITY = 80
+THUMB_QUALITY = 70
+
+
+class ImageProcessingError(Exception):
+    pass
+
+
+def _to_rgb(img):
+    if img.mode in ('RGB', 'L'):
+        return img
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    return img.convert('RGB')
+
+
+def process_photo(path):
+    """
+    Traite le fichier `path` et retourne (chemin_image, chemin_vignette),
+    deux fichiers WebP écrits à côté de l'original.
+    """
+    source = Path(path)
+    try:
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            img = _to_rgb(img)
+
+            full = img.copy()
+            full.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+            full_path = source.with_name(f"{source.stem}_full.webp")
+            # pas de paramètre exif : les métadonnées ne sont pas recopiées
+            full.save(full_path, 'WEBP', quality=QUALITY, method=4)
+
+            thumb = ImageOps.fit(img, (THUMB_SIZE, THUMB_SIZE), Image.LANCZOS)
+            thumb_path = source.with_name(f"{source.stem}_thumb.webp")
+            thumb.save(thumb_path, 'WEBP', quality=THUMB_QUALITY, method=4)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        raise ImageProcessingError(str(exc)) from exc
+
+    return str(full_path), str(thumb_path)
@@ -0,0 +1,403 @@
+"""
+Import en masse des PDV et du catalogue client depuis un fichier CSV ou
+Excel.
+
+Le fichier est lu en flux (csv.reader / openpyxl en lecture seule) par
+paquets de CHUNK_SIZE lignes ; chaque paquet devient un DataFrame validé
+colonne par colonne (champs obligatoires, longueurs, coordonnées, type de
+PDV, wilaya connue, doublons de clé dans tout le fichier), puis les lignes
+valides sont écrites : bulk_update pour les clés déjà en base,
+bulk_create (avec codes réservés, cf. codes.py) pour les nouvelles. La
+mémoire dépend de la taille d'un paquet, pas de celle du fichier (seules
+les clés déjà vues sont gardées pour détecter les doublons).
+
+Chaque ligne refusée produit une entrée (ligne, motif) dans le rapport.
+
+Types d'import :
+- pdv : no_pdv, region, wilaya, commune, type_pdv, latitude, longitude
+  (clé : no_pdv) ;
+- produits : nom, categorie, format (clé : nom + format, par client) ;
+- concurrents : nom (clé : nom, par client) ;
+- produits_concurrents : concurrent, nom, categorie, format (clé :
+  concurrent + nom + format ; le concurrent doit exister).
+"""
+import abc
+import csv
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from . import codes, denorm, geo
+from .catalog import bump_version
+from .models import Concurrent, PointDeVente, ProduitClient, ProduitConcurrent
+
+CHUNK_SIZE = 5000
+# Erreurs gardées dans le rapport (toutes sont comptées et écrites dans le fichier d'erreurs)
+MAX_REPORTED_ERRORS = 1000
+
+WILAYAS = [
+    'Adrar', 'Chlef', 'Laghouat', 'Oum El Bouaghi', 'Batna', 'Béjaïa', 'Biskra', 'Béchar',
+    'Blida', 'Bouira', 'Tamanrasset', 'Tébessa', 'Tlemcen', 'Tiaret', 'Tizi Ouzou', 'Alger',
+    'Djelfa', 'Jijel', 'Sétif', 'Saïda', 'Skikda', 'Sidi Bel Abbès', 'Annaba', 'Guelma',
+    'Constantine', 'Médéa', 'Mostaganem', "M'Sila", 'Mascara', 'Ouargla', 'Oran', 'El Bayadh',
+    'Illizi', 'Bordj Bou Arréridj', 'Boumerdès', 'El Tarf', 'Tindouf', 'Tissemsilt', 'El Oued',
+    'Khenchela', 'Souk Ahras', 'Tipaza', 'Mila', 'Aïn Defla', 'Naâma', 'Aïn Témouchent',
+    'Ghardaïa', 'Relizane', 'Timimoun', 'Bordj Badji Mokhtar', 'Ouled Djellal', 'Béni Abbès',
+    'In Salah', 'In Guezzam', 'Touggourt', 'Djanet', "El M'Ghair", 'El Meniaa',
+]
+
+# En-têtes acceptés (après normalisation) -> colonne
+ALIASES = {
+    'n_pdv': 'no_pdv',
+    'numero_pdv': 'no_pdv',
+    'type': 'type_pdv',
+    'lat': 'latitude',
+    'lon': 'longitude',
+    'lng': 'longitude',
+    'produit': 'nom',
+    'categorie_produit': 'categorie',
+}
+
+
+class InvalidImport(ValueError):
+    pass
+
+
+def normalize(text):
+    """Minuscules, sans accents, séparateurs ramenés à '_' : « N° PDV » -> « n_pdv »."""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_')
+
+
+def _wilaya_lookup():
+    names = getattr(settings, 'IMPORT_WILAYAS', WILAYAS)
+    return {normalize(name): name for name in names}
+
+
+@dataclass
+class ImportReport:
+    kind: str
+    dry_run: bool = False
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    rejected: int = 0
+    # [(ligne, motif)], au plus MAX_REPORTED_ERRORS
+    errors: list = field(default_factory=list)
+
+
+# ---------------------------------------------------------------------------
+# Lecture en flux
+# ---------------------------------------------------------------------------
+
+def _csv_rows(path):
+    with open(path, encoding='utf-8-sig', newline='') as fh:
+        sample = fh.read(4096)
+        fh.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(fh, dialect)
+
+
+def _xlsx_rows(path):
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def iter_chunks(path, columns, fmt=None, chunk_size=CHUNK_SIZE):
+    """
+    DataFrames de `chunk_size` lignes au plus, colonnes = `columns`
+    (chaînes, '' si vide) + 'ligne' (numéro de ligne dans le fichier).
+    """
+    fmt = fmt or os.path.splitext(str(path))[1].lstrip('.').lower()
+    if fmt not in ('csv', 'xlsx'):
+        raise InvalidImport("format inconnu : csv ou xlsx attendu")
+    rows = _xlsx_rows(path) if fmt == 'xlsx' else _csv_rows(path)
+    try:
+        header = [normalize(h) if h is not None else '' for h in next(rows)]
+    except StopIteration:
+        raise InvalidImport("fichier vide")
+    header = [ALIASES.get(h, h) for h in header]
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise InvalidImport(f"colonne(s) manquante(s) : {', '.join(missing)}")
+    positions = [header.index(c) for c in columns]
+
+    def frame(batch, lines):
+        df = pd.DataFrame(batch, columns=columns, dtype=object)
+        df = df.fillna('').astype(str).apply(lambda col: col.str.strip())
+        df['ligne'] = lines
+        return df
+
+    batch, lines = [], []
+    for line, row in enumerate(rows, start=2):
+        row = list(row)
+        if not any(v not in (None, '') for v in row):
+            continue
+        row += [None] * (len(header) - len(row))
+        batch.append([row[p] for p in positions])
+        lines.append(line)
+        if len(batch) >= chunk_size:
+            yield frame(batch, lines)
+            batch, lines = [], []
+    if batch:
+        yield frame(batch, lines)
+
+
+# ---------------------------------------------------------------------------
+# Validation et écriture
+# ---------------------------------------------------------------------------
+
+class Importer(abc.ABC):
+    """
+    Un type d'import. `clean` ajoute des motifs de refus par ligne et
+    prépare les colonnes ; `write` écrit les lignes valides d'un paquet et
+    retourne (créées, mises à jour).
+    """
+    model = None
+    columns = ()
+    key = ()
+    needs_client = False
+
+    def __init__(self, client_id=None):
+        if self.needs_client and client_id is None:
+            raise InvalidImport("client obligatoire pour ce type d'import")
+        self.client_id = client_id
+        self.seen = set()
+
+    def validate(self, df):
+        """Motifs de refus : {index: [motifs]}."""
+        errors = {}
+        for col in self.columns:
+            self.reject(errors, df[col] == '', f"{col} manquant")
+            max_length = getattr(self.model._meta.get_field(col), 'max_length', None)
+            if max_length:
+                self.reject(errors, df[col].str.len() > max_length, f"{col} trop long ({max_length} max)")
+        self.clean(df, errors)
+
+        keys = df[self.key[0]]
+        for col in self.key[1:]:
+            keys = keys + '\x1f' + df[col]
+        duplicate = keys.duplicated() | keys.isin(self.seen)
+        self.reject(errors, duplicate, f"doublon ({' + '.join(self.key)})")
+        self.seen.update(keys[~df.index.isin(list(errors))])
+        return errors
+
+    @staticmethod
+    def reject(errors, mask, message):
+        for index in mask[mask].index:
+            errors.setdefault(index, []).append(message)
+
+    def clean(self, df, errors):
+        pass
+
+    @abc.abstractmethod
+    def write(self, df):
+        ...
+
+    def finish(self, changed):
+        pass
+
+
+class PDVImporter(Importer):
+    model = PointDeVente
+    columns = ('no_pdv', 'region', 'wilaya', 'commune', 'type_pdv', 'latitude', 'longitude')
+    key = ('no_pdv',)
+    fields = ('region', 'wilaya', 'commune', 'type_pdv', 'latitude', 'longitude')
+
+    def __init__(self, client_id=None):
+        super().__init__(client_id)
+        self.wilayas = _wilaya_lookup()
+        self.types = {}
+        for value, label in PointDeVente.TYPE_PDV_CHOICES:
+            self.types[normalize(value)] = value
+            self.types[normalize(label)] = value
+
+    def clean(self, df, errors):
+        for col, bound in (('latitude', 90), ('longitude', 180)):
+            values = pd.to_numeric(df[col].str.replace(',', '.', regex=False), errors='coerce')
+            filled = df[col] != ''
+            self.reject(errors, filled & values.isna(), f"{col} invalide")
+            self.reject(errors, values.abs() > bound, f"{col} hors limites")
+            df[col] = values.round(6)
+
+        wilaya = df['wilaya'].map(normalize).map(self.wilayas)
+        self.reject(errors, (df['wilaya'] != '') & wilaya.isna(), "wilaya inconnue")
+        df['wilaya'] = wilaya.fillna(df['wilaya'])
+
+        type_pdv = df['type_pdv'].map(normalize).map(self.types)
+        self.reject(errors, (df['type_pdv'] != '') & type_pdv.isna(), "type_pdv inconnu")
+        df['type_pdv'] = type_pdv.fillna(df['type_pdv'])
+
+    def write(self, df):
+        existing = PointDeVente.objects.in_bulk(list(df['no_pdv']), field_name='no_pdv')
+        created, updated = [], []
+        for row in df.itertuples(index=False):
+            values = {
+                'region': row.region,
+                'wilaya': row.wilaya,
+                'commune': row.commune,
+                'type_pdv': row.type_pdv,
+                'latitude': Decimal(f"{row.latitude:.6f}"),
+                'longitude': Decimal(f"{row.longitude:.6f}"),
+            }
+            pdv = existing.get(row.no_pdv)
+            if pdv is None:
+                created.append(PointDeVente(no_pdv=row.no_pdv, **values))
+            else:
+                for name, value in values.items():
+                    setattr(pdv, name, value)
+                updated.append(pdv)
+        codes.bulk_create(PointDeVente, created, 'pdv')
+        PointDeVente.objects.bulk_update(updated, self.fields, batch_size=1000)
+        # Relevés, photos et résumés des PDV qui ont changé de zone
+        denorm.cascade_pdv([pdv.id for pdv in updated if denorm.pdv_moved(pdv)])
+        return len(created), len(updated)
+
+    def finish(self, changed):
+        # bulk_create / bulk_update n'envoient pas de signaux
+        if changed:
+            geo.invalidate()
+
+
+class CatalogImporter(Importer):
+    needs_client = True
+
+    def finish(self, changed):
+        if changed:
+            bump_version(self.client_id)
+
+
+class ProduitClientImporter(CatalogImporter):
+    model = ProduitClient
+    columns = ('nom', 'categorie', 'format')
+    key = ('nom', 'format')
+
+    def write(self, df):
+        existing = {
+            (p.nom, p.format): p
+            for p in ProduitClient.objects.filter(client_id=self.client_id, nom__in=set(df['nom']))
+        }
+        now = timezone.now()
+        created, updated = [], []
+        for row in df.itertuples(index=False):
+            produit = existing.get((row.nom, row.format))
+            if produit is None:
+                created.append(ProduitClient(client_id=self.client_id, nom=row.nom, categorie=row.categorie, format=row.format))
+            elif produit.categorie != row.categorie:
+                # bulk_update ne renseigne pas auto_now : updated_at sert au delta de synchro
+                produit.categorie, produit.updated_at = row.categorie, now
+                updated.append(produit)
+        ProduitClient.objects.bulk_create(created, batch_size=1000)
+        ProduitClient.objects.bulk_update(updated, ['categorie', 'updated_at'], batch_size=1000)
+        return len(created), len(updated)
+
+
+class ConcurrentImporter(CatalogImporter):
+    model = Concurrent
+    columns = ('nom',)
+    key = ('nom',)
+
+    def write(self, df):
+        existing = set(
+            Concurrent.objects.filter(client_id=self.client_id, nom__in=set(df['nom'])).values_list('nom', flat=True)
+        )
+        created = [Concurrent(client_id=self.client_id, nom=nom) for nom in df['nom'] if nom not in existing]
+        Concurrent.objects.bulk_create(created, batch_size=1000)
+        return len(created), 0
+
+
+class ProduitConcurrentImporter(CatalogImporter):
+    model = ProduitConcurrent
+    columns = ('concurrent', 'nom', 'categorie', 'format')
+    key = ('concurrent', 'nom', 'format')
+
+    def __init__(self, client_id=None):
+        super().__init__(client_id)
+        self.concurrents = dict(Concurrent.objects.filter(client_id=client_id).values_list('nom', 'id'))
+
+    def clean(self, df, errors):
+        df['concurrent_id'] = df['concurrent'].map(self.concurrents)
+        self.reject(errors, (df['concurrent'] != '') & df['concurrent_id'].isna(), "concurrent inconnu")
+
+    def write(self, df):
+        existing = {
+            (p.concurrent_id, p.nom, p.format): p
+            for p in ProduitConcurrent.objects.filter(
+                concurrent_id__in=set(df['concurrent_id'].astype(int).tolist()), nom__in=set(df['nom']),
+            )
+        }
+        now = timezone.now()
+        created, updated = [], []
+        for row in df.itertuples(index=False):
+            concurrent_id = int(row.concurrent_id)
+            produit = existing.get((concurrent_id, row.nom, row.format))
+            if produit is None:
+                created.append(ProduitConcurrent(
+                    concurrent_id=concurrent_id, nom=row.nom, categorie=row.categorie, format=row.format,
+                ))
+            elif produit.categorie != row.categorie:
+                produit.categorie, produit.updated_at = row.categorie, now
+                updated.append(produit)
+        ProduitConcurrent.objects.bulk_create(created, batch_size=1000)
+        ProduitConcurrent.objects.bulk_update(updated, ['categorie', 'updated_at'], batch_size=1000)
+        return len(created), len(updated)
+
+
+IMPORTS = {
+    'pdv': PDVImporter,
+    'produits': ProduitClientImporter,
+    'concurrents': ConcurrentImporter,
+    'produits_concurrents': ProduitConcurrentImporter,
+}
+
+
+def run_import(kind, path, client_id=None, fmt=None, dry_run=False, chunk_size=CHUNK_SIZE, error_file=None):
+    """
+    Importe le fichier `path` ; retourne un ImportReport. Chaque paquet
+    est écrit dans sa propre transaction. `error_file` (fichier texte
+    ouvert) reçoit toutes les lignes refusées en CSV (ligne;motif).
+    """
+    if kind not in IMPORTS:
+        raise InvalidImport(f"type d'import inconnu : {kind}")
+    importer = IMPORTS[kind](client_id)
+    report = ImportReport(kind=kind, dry_run=dry_run)
+    writer = csv.writer(error_file, delimiter=';') if error_file is not None else None
+    if writer:
+        writer.writerow(['ligne', 'motif'])
+
+    for df in iter_chunks(path, importer.columns, fmt, chunk_size):
+        report.rows += len(df)
+        errors = importer.validate(df)
+        for index in sorted(errors):
+            message = ', '.join(errors[index])
+            line = int(df.at[index, 'ligne'])
+            if len(report.errors) < MAX_REPORTED_ERRORS:
+                report.errors.append((line, message))
+            if writer:
+                writer.writerow([line, message])
+        report.rejected += len(errors)
+
+        valid = df[~df.index.isin(list(errors))]
+        if dry_run or valid.empty:
+            continue
+        with transaction.atomic():
+            created, updated = importer.write(valid)
+        report.created += created
+        report.updated += updated
+
+    importer.finish(report.created + report.updated > 0)
+    return report
@@ -0,0 +1,171 @@
+"""
+Ingestion par lots des relevés produits (client et concurrence).
+
+Au lieu d'un get() + create() par article, on résout tous les produits
+en une seule requête `id__in`, on dénormalise wilaya / région / client
+une seule fois depuis la mission, puis on écrit toutes les lignes avec
+`bulk_create_denormalized` dans une transaction. Les agrégats journaliers du PDV
+(cf. rollups.py) sont recalculés dans cette même transaction.
+"""
+import math
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import rollups
+from .models import (
+    ProduitClient,
+    ProduitConcurrent,
+    RealisationClientData,
+    RealisationConcurrenceData,
+)
+
+BATCH_SIZE = 500
+
+
+class RejectedItem(Exception):
+    """Article refusé ; le message sert de raison dans la réponse."""
+
+
+def _to_int(value, field):
+    if value in (None, ''):
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise RejectedItem(f"{field} invalide")
+    if number < 0:
+        raise RejectedItem(f"{field} négatif")
+    return number
+
+
+def _to_float(value, field):
+    if value in (None, ''):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RejectedItem(f"{field} invalide")
+    # « nan » / « inf » sont acceptés par float() mais pas par les agrégats
+    if not math.isfinite(number):
+        raise RejectedItem(f"{field} invalide")
+    return number
+
+
+def _to_decimal(value, field):
+    if value in (None, ''):
+        return None
+    try:
+        number = Decimal(str(value)).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise RejectedItem(f"{field} invalide")
+    if not number.is_finite():
+        raise RejectedItem(f"{field} invalide")
+    # DecimalField(max_digits=10, decimal_places=2)
+    if abs(number) >= Decimal('1e8'):
+        raise RejectedItem(f"{field} hors limites")
+    return number
+
+
+def _client_fields(it):
+    return {
+        'disponible': bool(it.get('disponible')),
+        'handling': bool(it.get('handling')),
+        # 0 / '' sont traités comme "non renseigné" (comportement historique)
+        'facing_share': _to_float(it.get('facing_share'), 'facing_share') or None,
+        'prix_vente': _to_decimal(it.get('prix_vente'), 'prix_vente') or None,
+        'stock': _to_int(it.get('stock'), 'stock') or None,
+    }
+
+
+def _concurrent_fields(it):
+    return {
+        'disponible': bool(it.get('disponible')),
+        'facing_share': _to_float(it.get('facing_share'), 'facing_share') or None,
+        'prix_vente': _to_decimal(it.get('prix_vente'), 'prix_vente') or None,
+        'stock': _to_int(it.get('stock'), 'stock') or None,
+    }
+
+
+def _ingest(
+    mission, merch, items, produit_model, realisation_model, produit_field, client_lookup, build_fields, rollup_kind,
+):
+    """
+    Moteur commun. Retourne {'created', 'rejected', 'results'} où
+    `results` contient un statut accepted / rejected par article, dans
+    l'ordre de la requête. Seuls les produits du client de la mission
+    (`client_lookup` depuis le produit) sont acceptés ; pour une mission
+    sans client, ceux du client du merchandiser, et aucun contrôle si lui
+    non plus n'en a pas.
+    """
+    results = []
+    pending = []  # (index, produit_id, champs)
+    for index, it in enumerate(items):
+        produit_id = it.get('produit_id') if isinstance(it, dict) else None
+        try:
+            if produit_id in (None, ''):
+                raise RejectedItem("produit_id manquant")
+            try:
+                produit_id = int(produit_id)
+            except (TypeError, ValueError):
+                raise RejectedItem("produit_id invalide")
+            fields = build_fields(it)
+        except RejectedItem as exc:
+            results.append({'index': index, 'produit_id': produit_id, 'status': 'rejected', 'reason': str(exc)})
+            continue
+        results.append({'index': index, 'produit_id': produit_id, 'status': 'accepted'})
+        pending.append((index, produit_id, fields))
+
+    # Une seule requête pour tous les produits référencés : id -> client
+    known = dict(
+        produit_model.objects.filter(id__in={pid for _, pid, _ in pending}).values_list('id', client_lookup)
+    ) if pending else {}
+
+    # wilaya / région recopiées par bulk_create_denormalized (cf. denorm.py),
+    # depuis mission.pdv déjà chargé : pas de requête supplémentaire
+    pdv = mission.pdv
+    common = {
+        'mission': mission,
+        'pdv': pdv,
+        'merch': merch,
+    }
+    owner = mission.client_id or merch.client_id
+
+    rows = []
+    for index, produit_id, fields in pending:
+        if produit_id not in known:
+            results[index].update(status='rejected', reason="produit inconnu")
+            continue
+        if owner is not None and known[produit_id] != owner:
+            results[index].update(status='rejected', reason="produit d'un autre client")
+            continue
+        # Client du produit, comme denorm._client_sources() (celui de la mission une fois contrôlé)
+        rows.append(realisation_model(
+            **common, client_id=known[produit_id], **{f'{produit_field}_id': produit_id}, **fields,
+        ))
+
+    with transaction.atomic():
+        realisation_model.objects.bulk_create_denormalized(rows, batch_size=BATCH_SIZE)
+        if rows and pdv:
+            rollups.refresh_slice(rollup_kind, pdv.id, {row.date_realisation for row in rows})
+
+    return {
+        'created': len(rows),
+        'rejected': len(results) - len(rows),
+        'results': results,
+    }
+
+
+def ingest_client_products(mission, merch, items):
+    return _ingest(
+        mission, merch, items,
+        ProduitClient, RealisationClientData, 'produit', 'client_id', _client_fields, 'client',
+    )
+
+
+def ingest_concurrent_products(mission, merch, items):
+    return _ingest(
+        mission, merch, items,
+        ProduitConcurrent, RealisationConcurrenceData, 'produit_concurrent', 'concurrent__client_id',
+        _concurrent_fields, 'concurrence',
+    )
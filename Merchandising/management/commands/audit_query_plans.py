@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Merchandising.query_audit import audit, canonical_queries
+
+
+class Command(BaseCommand):
+    help = "Passe les requêtes canoniques de l'application à EXPLAIN et signale les parcours complets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--query', action='append', dest='queries',
+                            help="Limiter à une requête (répétable) : " + ', '.join(n for n, _ in canonical_queries()))
+        parser.add_argument('--fail-on-scan', action='store_true', help="Code retour non nul si un parcours complet est détecté")
+
+    def handle(self, *args, **options):
+        reports = audit(using=options['database'], only=options['queries'])
+        for report in reports:
+            status = self.style.SUCCESS('OK  ') if report.ok else self.style.ERROR('SCAN')
+            self.stdout.write(f"{status} {report.name}")
+            if options['verbosity'] > 1 or not report.ok:
+                for line in report.plan:
+                    self.stdout.write(f"       {line}")
+
+        scans = [r.name for r in reports if not r.ok]
+        if scans and options['fail_on_scan']:
+            raise CommandError(f"Parcours complet détecté : {', '.join(scans)}")
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from Merchandising.exports import EXPORTS, export_queryset, iter_csv, write_xlsx
+
+
+class Command(BaseCommand):
+    help = "Exporte les réalisations (client / concurrence) en CSV ou XLSX, en flux."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Fichier de sortie (.csv ou .xlsx)")
+        parser.add_argument('--type', dest='kind', choices=sorted(EXPORTS), default='client')
+        parser.add_argument('--client', type=int)
+        parser.add_argument('--from', dest='date_from')
+        parser.add_argument('--to', dest='date_to')
+        parser.add_argument('--region')
+        parser.add_argument('--wilaya')
+
+    def handle(self, *args, **options):
+        try:
+            date_from = parse_date(options['date_from']) if options['date_from'] else None
+            date_to = parse_date(options['date_to']) if options['date_to'] else None
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        kind = options['kind']
+        qs = export_queryset(
+            kind,
+            client_id=options['client'],
+            date_from=date_from,
+            date_to=date_to,
+            region=options['region'],
+            wilaya=options['wilaya'],
+        )
+
+        output = options['output']
+        if output.endswith('.xlsx'):
+            count = write_xlsx(kind, qs, output)
+        elif output.endswith('.csv'):
+            count = -1
+            with open(output, 'w', encoding='utf-8', newline='') as fh:
+                for line in iter_csv(kind, qs):
+                    fh.write(line)
+                    count += 1
+        else:
+            raise CommandError("Le fichier de sortie doit finir par .csv ou .xlsx")
+
+        self.stdout.write(self.style.SUCCESS(f"{count} ligne(s) exportée(s) dans {output}"))
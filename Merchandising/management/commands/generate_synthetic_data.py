@@ -0,0 +1,47 @@
+from dataclasses import replace
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Merchandising.synthetic import SCALES, Generator, exists, flush
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère un jeu de données synthétique (clients, PDV, missions, relevés, photos) "
+        "pour les mesures de performance (cf. synthetic.py, run_benchmarks)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='small', help="Volumétrie de base")
+        parser.add_argument('--clients', type=int)
+        parser.add_argument('--pdvs', type=int)
+        parser.add_argument('--merchandisers', type=int)
+        parser.add_argument('--missions', type=int)
+        parser.add_argument('--days', type=int, help="Historique couvert, aujourd'hui compris")
+        parser.add_argument('--releves-per-mission', type=int)
+        parser.add_argument('--photos-per-mission', type=int)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--flush', action='store_true', help="Supprimer d'abord les données synthétiques existantes")
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help="Ne pas reconstruire agrégats et résumés (rebuild_rollups / rebuild_visit_summaries plus tard)",
+        )
+
+    def handle(self, *args, **options):
+        overrides = {
+            field: options[field]
+            for field in ('clients', 'pdvs', 'merchandisers', 'missions', 'days',
+                          'releves_per_mission', 'photos_per_mission')
+            if options[field] is not None
+        }
+        if any(value < 1 for value in overrides.values()):
+            raise CommandError("Les volumes doivent être positifs")
+        scale = replace(SCALES[options['scale']], **overrides)
+
+        if options['flush']:
+            flush()
+            self.stdout.write("Données synthétiques précédentes supprimées.")
+        elif exists():
+            raise CommandError("Des données synthétiques existent déjà (--flush pour les remplacer)")
+        Generator(scale, seed=options['seed'], derived=not options['skip_derived'], log=self.stdout.write).run()
+        self.stdout.write(self.style.SUCCESS("Jeu de données synthétique généré."))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Merchandising.imports import CHUNK_SIZE, IMPORTS, InvalidImport, run_import
+from Merchandising.models import Client
+
+
+class Command(BaseCommand):
+    help = "Importe des PDV ou le catalogue d'un client depuis un fichier CSV / XLSX (cf. imports.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTS))
+        parser.add_argument('path', help="Fichier .csv ou .xlsx")
+        parser.add_argument('--client', type=int, help="Client du catalogue (id)")
+        parser.add_argument('--errors', help="Fichier CSV des lignes refusées")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes validées et écrites par paquet")
+        parser.add_argument('--dry-run', action='store_true', help="Valider sans rien écrire")
+
+    def handle(self, *args, **options):
+        client_id = options['client']
+        if client_id is not None and not Client.objects.filter(id=client_id).exists():
+            raise CommandError(f"Client {client_id} introuvable")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size doit être positif")
+
+        error_file = open(options['errors'], 'w', encoding='utf-8', newline='') if options['errors'] else None
+        try:
+            report = run_import(
+                options['kind'],
+                options['path'],
+                client_id=client_id,
+                dry_run=options['dry_run'],
+                chunk_size=options['chunk_size'],
+                error_file=error_file,
+            )
+        except (InvalidImport, OSError) as exc:
+            raise CommandError(str(exc))
+        finally:
+            if error_file is not None:
+                error_file.close()
+
+        if not options['errors']:
+            for line, message in report.errors:
+                self.stdout.write(f"ligne {line} : {message}")
+        verb = "validée(s)" if report.dry_run else "importée(s)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{report.rows} ligne(s) lue(s), {report.rows - report.rejected} {verb} "
+            f"({report.created} créée(s), {report.updated} mise(s) à jour), {report.rejected} refusée(s)."
+        ))
@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Merchandising.models import CustomUser
+from Merchandising.planning import PlanningError, parse_rules, plan_missions
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère en masse les missions décrites par un fichier de règles JSON "
+        "(projet x merchandiser x PDV x jours de semaine, cf. planning.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('rules', help="Fichier JSON : liste de règles")
+        parser.add_argument('--projet', type=int, help="Projet par défaut des règles (id)")
+        parser.add_argument('--created-by', help="Email de l'auteur des missions")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Missions insérées par paquet")
+        parser.add_argument('--dry-run', action='store_true', help="Compter sans rien écrire")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size doit être positif")
+        created_by = None
+        if options['created_by']:
+            created_by = CustomUser.objects.filter(email=options['created_by']).first()
+            if created_by is None:
+                raise CommandError(f"Utilisateur {options['created_by']} introuvable")
+        try:
+            with open(options['rules'], encoding='utf-8') as fh:
+                data = json.load(fh)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Fichier de règles illisible : {exc}")
+
+        try:
+            rules = parse_rules(data, options['projet'])
+            report = plan_missions(
+                rules,
+                created_by=created_by,
+                dry_run=options['dry_run'],
+                chunk_size=options['chunk_size'],
+            )
+        except PlanningError as exc:
+            raise CommandError(str(exc))
+
+        for conflict in report.conflict_details:
+            self.stdout.write(
+                f"conflit ({conflict['reason']}) : merchandiser {conflict['merchandiser_id']}, "
+                f"PDV {conflict['pdv_id']}, {conflict['date']}"
+            )
+        verb = "à créer" if report.dry_run else "créée(s)"
+        count = report.generated if report.dry_run else report.created
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} mission(s) {verb} ; {report.conflicts} conflit(s), "
+            f"{report.skipped_past} occurrence(s) passée(s) ignorée(s)."
+        ))
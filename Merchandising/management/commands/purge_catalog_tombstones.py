@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from Merchandising.sync import purge_tombstones, tombstone_retention
+
+
+class Command(BaseCommand):
+    help = "Supprime les tombes de produits plus anciennes que la durée de validité des jetons de synchronisation."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=tombstone_retention().days,
+            help="Âge minimal des tombes supprimées (jours)",
+        )
+
+    def handle(self, *args, **options):
+        count = purge_tombstones(timedelta(days=max(0, options['days'])))
+        self.stdout.write(self.style.SUCCESS(f"{count} tombe(s) supprimée(s)."))
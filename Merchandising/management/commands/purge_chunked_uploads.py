@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from Merchandising.chunked import STALE_AFTER, purge_stale
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime les uploads par morceaux sans activité récente : abandonnés (avec leur fichier "
+        "dans le spool) ou terminés (la photo garde son fichier)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=int(STALE_AFTER.total_seconds() // 3600),
+            help="Âge minimal (heures depuis le dernier morceau reçu)",
+        )
+
+    def handle(self, *args, **options):
+        count = purge_stale(timedelta(hours=max(0, options['hours'])))
+        self.stdout.write(self.style.SUCCESS(f"{count} upload(s) supprimé(s)."))
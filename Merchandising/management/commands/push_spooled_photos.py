@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from Merchandising.models import PhotoMission
+from Merchandising.uploads import get_backend, push_photo
+
+
+class Command(BaseCommand):
+    help = "Pousse vers le stockage les photos restées dans le spool (pending / failed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--failed-only', action='store_true', help="Ne reprendre que les photos en échec")
+
+    def handle(self, *args, **options):
+        statuts = ['failed'] if options['failed_only'] else ['pending', 'failed']
+        ids = list(
+            PhotoMission.objects.filter(statut_upload__in=statuts)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        backend = get_backend()
+        ok = sum(1 for photo_id in ids if push_photo(photo_id, backend=backend))
+        self.stdout.write(self.style.SUCCESS(f"{ok}/{len(ids)} photo(s) uploadée(s)."))
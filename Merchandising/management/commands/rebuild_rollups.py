@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from Merchandising import rollups
+from Merchandising.models import Client
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les agrégats journaliers des relevés depuis les données brutes. "
+        "Sans --date-from / --date-to : toute la période couverte par les relevés (rattrapage). "
+        "À lancer sur la période concernée après des relevés écrits ou modifiés par "
+        "QuerySet.update() / bulk_create() ou en SQL : ces écritures ne passent pas par les "
+        "signaux qui tiennent les agrégats à jour."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['client', 'concurrence', 'all'], default='all')
+        parser.add_argument('--client', type=int, help="Limiter à un client (id)")
+        parser.add_argument('--date-from', help="AAAA-MM-JJ")
+        parser.add_argument('--date-to', help="AAAA-MM-JJ")
+        parser.add_argument('--days-per-batch', type=int, default=31, help="Jours recalculés par transaction")
+
+    def _date(self, value, option):
+        if not value:
+            return None
+        try:
+            parsed = parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise CommandError(f"{option} invalide : {value}")
+        return parsed
+
+    def handle(self, *args, **options):
+        client_id = options['client']
+        if client_id is not None and not Client.objects.filter(id=client_id).exists():
+            raise CommandError(f"Client {client_id} introuvable")
+        if options['days_per_batch'] < 1:
+            raise CommandError("--days-per-batch doit être positif")
+        date_from = self._date(options['date_from'], '--date-from')
+        date_to = self._date(options['date_to'], '--date-to')
+
+        kinds = list(rollups.ROLLUPS) if options['kind'] == 'all' else [options['kind']]
+        for kind in kinds:
+            first, last = rollups.raw_date_bounds(kind, client_id)
+            start = date_from or first
+            end = date_to or last
+            if start is None or end is None:
+                self.stdout.write(f"{kind} : aucun relevé.")
+                continue
+            if start > end:
+                raise CommandError("--date-from doit précéder --date-to")
+            count = rollups.refresh_range(kind, start, end, client_id=client_id, days_per_batch=options['days_per_batch'])
+            self.stdout.write(self.style.SUCCESS(f"{kind} : {count} agrégat(s) journalier(s) du {start} au {end}."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Merchandising.models import Client
+from Merchandising.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les résumés de visite (VisitSummary) et les facettes du dashboard client."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', type=int, help="Limiter à un client (id)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        client = None
+        if options['client'] is not None:
+            try:
+                client = Client.objects.get(id=options['client'])
+            except Client.DoesNotExist:
+                raise CommandError(f"Client {options['client']} introuvable")
+
+        count = rebuild_summaries(client=client, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"{count} résumé(s) de visite reconstruit(s)."))
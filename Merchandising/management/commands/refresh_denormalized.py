@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from Merchandising.denorm import cascade_pdv
+
+
+class Command(BaseCommand):
+    help = (
+        "Recopie wilaya / région des PDV et le client des produits / missions dans les relevés, "
+        "photos, résumés et agrégats (rattrapage après des modifications faites hors de l'application)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pdv', type=int, nargs='+', help="Limiter à ces PDV (ids)")
+        parser.add_argument('--batch-size', type=int, default=500, help="PDV traités par transaction")
+
+    def handle(self, *args, **options):
+        updated = cascade_pdv(options['pdv'], batch_size=max(1, options['batch_size']), with_client=True)
+        self.stdout.write(self.style.SUCCESS(f"{updated} ligne(s) mise(s) à jour."))
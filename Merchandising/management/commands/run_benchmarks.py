@@ -0,0 +1,72 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from Merchandising.benchmark import (
+    DEFAULT_ITERATIONS,
+    DEFAULT_WARMUP,
+    SCENARIOS,
+    BenchmarkError,
+    compare,
+    run_benchmarks,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure latence (p50 / p95), requêtes SQL et pic mémoire des vues clés ; "
+        "écrit le résultat en JSON pour comparaison entre commits (cf. benchmark.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=sorted(SCENARIOS), help="Scénarios à jouer")
+        parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+        parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP)
+        parser.add_argument('--host', default='localhost', help="Hôte des requêtes (doit être autorisé)")
+        parser.add_argument('--output', help="Fichier JSON (défaut : benchmarks/<date>-<commit>.json)")
+        parser.add_argument('--compare', help="Résultat JSON précédent à comparer")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['warmup'] < 0:
+            raise CommandError("--iterations doit être positif, --warmup positif ou nul")
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text(encoding='utf-8'))
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Résultat de référence illisible : {exc}")
+
+        def log(name, result):
+            self.stdout.write(
+                f"{name:<24} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+                f"{result['queries']:>4} requêtes  {result['peak_kb']:>10.1f} Ko"
+            )
+
+        try:
+            report = run_benchmarks(
+                options['only'],
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                host=options['host'],
+                log=log,
+            )
+        except BenchmarkError as exc:
+            raise CommandError(str(exc))
+
+        output = options['output']
+        if not output:
+            stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+            output = Path(settings.BASE_DIR) / 'benchmarks' / f"{stamp}-{report['commit'] or 'nogit'}.json"
+        output = Path(output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+
+        if baseline is not None:
+            self.stdout.write(f"\nComparaison avec {baseline.get('commit') or options['compare']} :")
+            for name, key, old, new, delta in compare(report, baseline):
+                change = '—' if delta is None else f"{delta:+.1f} %"
+                self.stdout.write(f"{name:<24} {key:<8} {old} -> {new} ({change})")
+        self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {output}"))
@@ -0,0 +1,202 @@
+"""
+Mesure des requêtes : nombre et durée des requêtes SQL, latence totale et
+taille de la réponse, par vue.
+
+- track_queries : gestionnaire de contexte qui compte les requêtes SQL
+  exécutées (via connection.execute_wrapper, sans DEBUG) ;
+- MetricsMiddleware : mesure chaque requête HTTP, ajoute un en-tête
+  Server-Timing (db / total) et alimente REGISTRY. Une vue qui dépasse son
+  budget de requêtes (settings.VIEW_QUERY_BUDGETS) est signalée dans les
+  logs ;
+- metrics_view : les compteurs de REGISTRY au format texte Prometheus,
+  réservé au staff et aux adresses listées dans METRICS_ALLOWED_IPS
+  (vide par défaut : derrière un proxy local, toutes les requêtes
+  arrivent de 127.0.0.1).
+
+Les compteurs sont propres à chaque processus. Les requêtes SQL faites
+pendant l'envoi d'une réponse en flux (exports) ne sont pas comptées.
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .auth_cache import fresh_user
+
+logger = logging.getLogger(__name__)
+
+# Bornes (s) de l'histogramme de latence
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class QueryStats:
+    """Compteur branché sur connection.execute_wrapper."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+@contextmanager
+def track_queries(using=None):
+    """Compte les requêtes SQL exécutées dans le bloc (toutes les bases, ou `using`)."""
+    stats = QueryStats()
+    aliases = [using] if using else list(connections)
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(stats))
+        yield stats
+
+
+def query_budget(view_name):
+    return getattr(settings, 'VIEW_QUERY_BUDGETS', {}).get(view_name)
+
+
+class _ViewMetrics:
+    def __init__(self):
+        self.requests = {}  # code HTTP -> nombre
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.seconds = 0.0
+        self.response_bytes = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.over_budget = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, status, queries, sql_seconds, seconds, response_bytes, over_budget=False):
+        with self._lock:
+            m = self._views.setdefault(view, _ViewMetrics())
+            m.requests[status] = m.requests.get(status, 0) + 1
+            m.queries += queries
+            m.sql_seconds += sql_seconds
+            m.seconds += seconds
+            m.response_bytes += response_bytes or 0
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    m.buckets[i] += 1
+            m.over_budget += int(over_budget)
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self):
+        """Compteurs au format texte Prometheus (version 0.0.4)."""
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        with self._lock:
+            views = sorted(self._views.items())
+            family('iris_http_requests_total', 'counter', "Requêtes HTTP par vue et code.", [
+                f'iris_http_requests_total{{view="{v}",status="{status}"}} {n}'
+                for v, m in views for status, n in sorted(m.requests.items())
+            ])
+            histogram = []
+            for v, m in views:
+                total = sum(m.requests.values())
+                for bound, n in zip(LATENCY_BUCKETS, m.buckets):
+                    histogram.append(f'iris_http_request_duration_seconds_bucket{{view="{v}",le="{bound}"}} {n}')
+                histogram.append(f'iris_http_request_duration_seconds_bucket{{view="{v}",le="+Inf"}} {total}')
+                histogram.append(f'iris_http_request_duration_seconds_sum{{view="{v}"}} {m.seconds:.6f}')
+                histogram.append(f'iris_http_request_duration_seconds_count{{view="{v}"}} {total}')
+            family('iris_http_request_duration_seconds', 'histogram', "Latence totale des requêtes.", histogram)
+            family('iris_sql_queries_total', 'counter', "Requêtes SQL exécutées.", [
+                f'iris_sql_queries_total{{view="{v}"}} {m.queries}' for v, m in views
+            ])
+            family('iris_sql_duration_seconds_total', 'counter', "Temps passé en SQL.", [
+                f'iris_sql_duration_seconds_total{{view="{v}"}} {m.sql_seconds:.6f}' for v, m in views
+            ])
+            family('iris_http_response_bytes_total', 'counter', "Octets de réponse (hors flux).", [
+                f'iris_http_response_bytes_total{{view="{v}"}} {m.response_bytes}' for v, m in views
+            ])
+            family('iris_query_budget_exceeded_total', 'counter', "Requêtes au-delà du budget SQL de la vue.", [
+                f'iris_query_budget_exceeded_total{{view="{v}"}} {m.over_budget}' for v, m in views
+            ])
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+class MetricsMiddleware:
+    """
+    À placer en tête de MIDDLEWARE pour mesurer toute la chaîne.
+    Synchrone et asynchrone : sous ASGI, les vues async (cf. async_views.py)
+    ne sont pas ramenées dans un thread à cause de ce middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with track_queries() as stats:
+            response = self.get_response(request)
+        return self._record(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with track_queries() as stats:
+            response = await self.get_response(request)
+        return self._record(request, response, stats, time.perf_counter() - start)
+
+    def _record(self, request, response, stats, elapsed):
+        view = view_name(request)
+        size = None if response.streaming else len(response.content)
+        budget = query_budget(view)
+        over_budget = budget is not None and stats.count > budget
+        if over_budget:
+            logger.warning("%s : %d requêtes SQL (budget %d)", view, stats.count, budget)
+
+        if getattr(settings, 'METRICS_SERVER_TIMING', settings.DEBUG):
+            response['Server-Timing'] = (
+                f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries", '
+                f'total;dur={elapsed * 1000:.1f}'
+            )
+        REGISTRY.observe(view, response.status_code, stats.count, stats.duration, elapsed, size, over_budget)
+        return response
+
+
+@fresh_user
+def metrics_view(request):
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ())
+    is_staff = getattr(request.user, 'is_staff', False)
+    if request.META.get('REMOTE_ADDR') not in allowed and not is_staff:
+        return HttpResponseForbidden("Non autorisé")
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
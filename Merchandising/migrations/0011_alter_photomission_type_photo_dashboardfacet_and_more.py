@@ -0,0 +1,61 @@
+# Generated by Django 5.0.9 on 2026-10-17 15:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0010_photomission_pdv_photomission_region_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='photomission',
+            name='type_photo',
+            field=models.CharField(choices=[('avant', 'Avant'), ('apres', 'Après')], max_length=5),
+        ),
+        migrations.CreateModel(
+            name='DashboardFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('wilaya', 'Wilaya'), ('region', 'Région')], max_length=10)),
+                ('value', models.CharField(max_length=100)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dashboard_facets', to='Merchandising.client')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VisitSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_visite', models.DateField()),
+                ('pdv_label', models.CharField(blank=True, max_length=255)),
+                ('wilaya', models.CharField(blank=True, max_length=100)),
+                ('region', models.CharField(blank=True, max_length=100)),
+                ('merch_nom', models.CharField(blank=True, max_length=201)),
+                ('nb_avant', models.PositiveIntegerField(default=0)),
+                ('nb_apres', models.PositiveIntegerField(default=0)),
+                ('categories', models.JSONField(blank=True, default=dict)),
+                ('derniere_photo', models.DateTimeField(blank=True, null=True)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='visit_summaries', to='Merchandising.client')),
+                ('pdv', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visit_summaries', to='Merchandising.pointdevente')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dashboardfacet',
+            constraint=models.UniqueConstraint(fields=('client', 'kind', 'value'), name='uniq_dashboard_facet'),
+        ),
+        migrations.AddIndex(
+            model_name='visitsummary',
+            index=models.Index(fields=['client', '-date_visite', '-id'], name='visit_client_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitsummary',
+            index=models.Index(fields=['client', 'wilaya', 'region', '-date_visite'], name='visit_client_geo_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='visitsummary',
+            constraint=models.UniqueConstraint(fields=('client', 'pdv', 'date_visite'), name='uniq_visit_summary'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.9 on 2026-10-17 15:56
+
+import cloudinary.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0011_alter_photomission_type_photo_dashboardfacet_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photomission',
+            name='spool_path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='photomission',
+            name='statut_upload',
+            field=models.CharField(choices=[('pending', 'En attente'), ('uploaded', 'Uploadée'), ('failed', 'Échec')], default='uploaded', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='photomission',
+            name='image',
+            field=cloudinary.models.CloudinaryField(blank=True, max_length=255, verbose_name='image'),
+        ),
+    ]
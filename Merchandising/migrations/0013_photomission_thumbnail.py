@@ -0,0 +1,19 @@
+# Generated by Django 5.0.9 on 2026-10-17 15:58
+
+import cloudinary.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0012_photomission_spool_path_photomission_statut_upload_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photomission',
+            name='thumbnail',
+            field=cloudinary.models.CloudinaryField(blank=True, max_length=255, verbose_name='thumbnail'),
+        ),
+    ]
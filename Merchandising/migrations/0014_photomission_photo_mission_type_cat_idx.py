@@ -0,0 +1,17 @@
+# Generated by Django 5.0.9 on 2026-10-17 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0013_photomission_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photomission',
+            index=models.Index(fields=['mission', 'type_photo', 'categorie', 'id'], name='photo_mission_type_cat_idx'),
+        ),
+    ]
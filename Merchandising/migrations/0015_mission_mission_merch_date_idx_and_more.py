@@ -0,0 +1,41 @@
+# Generated by Django 5.0.9 on 2026-10-17 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0014_photomission_photo_mission_type_cat_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mission',
+            index=models.Index(fields=['merchandiser', 'date_mission'], name='mission_merch_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mission',
+            index=models.Index(fields=['client', 'date_mission'], name='mission_client_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mission',
+            index=models.Index(fields=['date_mission', 'etat'], name='mission_date_etat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photomission',
+            index=models.Index(fields=['client', 'wilaya', 'region', '-timestamp'], name='photo_client_geo_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photomission',
+            index=models.Index(fields=['client', '-timestamp'], name='photo_client_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='realisationclientdata',
+            index=models.Index(fields=['client', 'date_realisation', 'region'], name='real_client_date_region_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='realisationconcurrencedata',
+            index=models.Index(fields=['client', 'date_realisation', 'region'], name='realc_client_date_region_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.9 on 2026-10-17 16:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0015_mission_mission_merch_date_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produitclient',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='produitconcurrent',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='SyncBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.UUIDField(unique=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('response', models.JSONField(default=dict)),
+                ('merch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_batches', to=settings.AUTH_USER_MODEL)),
+                ('mission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_batches', to='Merchandising.mission')),
+            ],
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.9 on 2026-10-17 16:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0017_catalogversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRealisationConcurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('wilaya', models.CharField(blank=True, max_length=100)),
+                ('region', models.CharField(blank=True, max_length=100)),
+                ('nb_releves', models.PositiveIntegerField(default=0)),
+                ('nb_disponible', models.PositiveIntegerField(default=0)),
+                ('facing_total', models.FloatField(default=0)),
+                ('nb_facing', models.PositiveIntegerField(default=0)),
+                ('prix_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('nb_prix', models.PositiveIntegerField(default=0)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='Merchandising.client')),
+                ('pdv', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Merchandising.pointdevente')),
+                ('produit_concurrent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Merchandising.produitconcurrent')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyRealisationClient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('wilaya', models.CharField(blank=True, max_length=100)),
+                ('region', models.CharField(blank=True, max_length=100)),
+                ('nb_releves', models.PositiveIntegerField(default=0)),
+                ('nb_disponible', models.PositiveIntegerField(default=0)),
+                ('facing_total', models.FloatField(default=0)),
+                ('nb_facing', models.PositiveIntegerField(default=0)),
+                ('prix_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('nb_prix', models.PositiveIntegerField(default=0)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='Merchandising.client')),
+                ('pdv', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Merchandising.pointdevente')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Merchandising.produitclient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['client', 'jour', 'region'], name='daily_client_jour_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrealisationclient',
+            constraint=models.UniqueConstraint(fields=('pdv', 'produit', 'jour'), name='uniq_daily_real_client'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyrealisationconcurrence',
+            index=models.Index(fields=['client', 'jour', 'region'], name='dailyc_client_jour_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrealisationconcurrence',
+            constraint=models.UniqueConstraint(fields=('pdv', 'produit_concurrent', 'jour'), name='uniq_daily_real_concurrence'),
+        ),
+    ]
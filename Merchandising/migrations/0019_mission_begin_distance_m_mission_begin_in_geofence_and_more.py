@@ -0,0 +1,33 @@
+# Generated by Django 5.0.9 on 2026-10-17 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0018_dailyrealisationconcurrence_dailyrealisationclient_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mission',
+            name='begin_distance_m',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mission',
+            name='begin_in_geofence',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mission',
+            name='end_distance_m',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mission',
+            name='end_in_geofence',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+    ]
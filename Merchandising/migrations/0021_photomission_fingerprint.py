@@ -0,0 +1,38 @@
+# Generated by Django 5.0.9 on 2026-10-17 17:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0020_codesequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photomission',
+            name='content_sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='photomission',
+            name='duplicate_kind',
+            field=models.CharField(blank=True, choices=[('exact', 'Fichier identique'), ('near', 'Image quasi identique')], max_length=5),
+        ),
+        migrations.AddField(
+            model_name='photomission',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='Merchandising.photomission'),
+        ),
+        migrations.AddField(
+            model_name='photomission',
+            name='phash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='photomission',
+            index=models.Index(fields=['client', 'content_sha256'], name='photo_client_sha_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.9 on 2026-10-17 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0022_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photomission',
+            index=models.Index(fields=['client', '-mission', '-id'], name='photo_client_mission_idx'),
+        ),
+    ]
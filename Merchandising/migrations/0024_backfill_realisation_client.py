@@ -0,0 +1,52 @@
+# Renseigne client sur les relevés (et leurs agrégats) enregistrés avant la
+# dénormalisation : les exports et les agrégats filtrent sur client_id.
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _value(model, field, ref):
+    return Subquery(model.objects.filter(id=OuterRef(ref)).values(field)[:1])
+
+
+def backfill_client(apps, schema_editor):
+    Mission = apps.get_model('Merchandising', 'Mission')
+    ProduitClient = apps.get_model('Merchandising', 'ProduitClient')
+    ProduitConcurrent = apps.get_model('Merchandising', 'ProduitConcurrent')
+
+    # Client du produit, sinon celui de la mission
+    for model_name, produit_model, produit_field, client_field in (
+        ('RealisationClientData', ProduitClient, 'produit_id', 'client_id'),
+        ('RealisationConcurrenceData', ProduitConcurrent, 'produit_concurrent_id', 'concurrent__client_id'),
+    ):
+        apps.get_model('Merchandising', model_name).objects.filter(client__isnull=True).update(
+            client_id=Coalesce(
+                _value(produit_model, client_field, produit_field),
+                _value(Mission, 'client_id', 'mission_id'),
+            ),
+        )
+
+    apps.get_model('Merchandising', 'PhotoMission').objects.filter(client__isnull=True).update(
+        client_id=_value(Mission, 'client_id', 'mission_id'),
+    )
+
+    # Agrégats journaliers calculés depuis ces relevés
+    for model_name, produit_model, produit_field, client_field in (
+        ('DailyRealisationClient', ProduitClient, 'produit_id', 'client_id'),
+        ('DailyRealisationConcurrence', ProduitConcurrent, 'produit_concurrent_id', 'concurrent__client_id'),
+    ):
+        apps.get_model('Merchandising', model_name).objects.filter(client__isnull=True).update(
+            client_id=_value(produit_model, client_field, produit_field),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0023_photomission_client_mission_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_client, migrations.RunPython.noop),
+    ]
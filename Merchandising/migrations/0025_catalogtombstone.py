@@ -0,0 +1,27 @@
+# Generated by Django 5.0.9 on 2026-10-17 18:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0024_backfill_realisation_client'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('client', 'Produit client'), ('concurrent', 'Produit concurrent')], max_length=20)),
+                ('produit_id', models.PositiveBigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='Merchandising.client')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['client', 'deleted_at'], name='tombstone_client_deleted_idx')],
+            },
+        ),
+    ]
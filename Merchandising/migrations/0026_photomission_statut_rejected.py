@@ -0,0 +1,18 @@
+# Generated by Django 5.0.9 on 2026-10-17 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0025_catalogtombstone'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='photomission',
+            name='statut_upload',
+            field=models.CharField(choices=[('pending', 'En attente'), ('uploaded', 'Uploadée'), ('failed', 'Échec'), ('rejected', 'Image illisible')], default='uploaded', max_length=10),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.9 on 2026-10-17 18:39
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Merchandising', '0027_remove_photo_client_geo_ts_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='photomission',
+            name='photo_client_ts_idx',
+        ),
+    ]
@@ -1,9 +1,16 @@
+from functools import partial
+
 from django.db import models
 from cloudinary.models import CloudinaryField
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-import uuid
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+class DenormalizedQuerySet(models.QuerySet):
+    """Lignes qui recopient wilaya / région (et client) : cf. denorm.py."""
+
+    def bulk_create_denormalized(self, objs, **kwargs):
+        from .denorm import denormalize
+        return self.bulk_create(denormalize(objs), **kwargs)
 class Client(models.Model):
     raison_sociale = models.CharField(max_length=255)
     ai = models.CharField(max_length=50)  # AI : Identifiant fiscal
@@ -81,14 +88,24 @@ class PointDeVente(models.Model):
     latitude = models.DecimalField(max_digits=9, decimal_places=6)
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
 
+    # Champs recopiés dans d'autres tables (VisitSummary.pdv_label contient la commune)
+    DENORMALIZED_FIELDS = ('wilaya', 'region', 'commune')
+
     def save(self, *args, **kwargs):
-        if not self.code:
-            # Génération du code : ex: PDV-BLIDA-001A23
-            prefix = "PDV"
-            wilaya_part = self.wilaya.upper().replace(" ", "")[:5]
-            unique_part = uuid.uuid4().hex[:6].upper()
-            self.code = f"{prefix}-{wilaya_part}-{unique_part}"
-        super().save(*args, **kwargs)
+        if self.code:
+            return super().save(*args, **kwargs)
+        # Génération du code : ex: PDV-BLIDA-00001A2 (cf. codes.py)
+        from .codes import assign_codes, save_with_code
+        assign_codes([self], 'pdv')
+        save_with_code(self, 'pdv', partial(super().save, *args, **kwargs))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valeurs lues en base : un changement déclenche denorm.cascade_pdv (cf. signals.py)
+        from .denorm import remember
+        remember(instance)
+        return instance
 
     def __str__(self):
         return f"{self.code} - {self.commune}, {self.wilaya}"
@@ -104,6 +121,7 @@ class ProduitClient(models.Model):
     categorie = models.CharField(max_length=100)
     format = models.CharField(max_length=100)
     image = CloudinaryField('image', blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.nom} - {self.format}"  # OK
@@ -113,9 +131,59 @@ class ProduitConcurrent(models.Model):
     categorie = models.CharField(max_length=100)
     format = models.CharField(max_length=100)
     image = CloudinaryField('image', blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.nom} - {self.format}"
+class CatalogVersion(models.Model):
+    """
+    Tampon de version du catalogue d'un client (produits, concurrents).
+    Incrémenté à chaque modification (cf. signals.py) ; sert de clé de
+    cache et d'ETag pour catalog.py.
+    """
+    client = models.OneToOneField(Client, on_delete=models.CASCADE, primary_key=True, related_name='catalog_version')
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.client} v{self.version}"
+class CatalogTombstone(models.Model):
+    """
+    Produit (client ou concurrent) supprimé : renvoyé par le delta de
+    synchronisation aux téléphones qui l'ont encore (cf. sync.delta_for).
+    Sans contrainte sur le client : la suppression d'un client supprime ses
+    produits, dont les tombes sont écrites dans la même transaction.
+    """
+    KIND_CHOICES = [
+        ('client', 'Produit client'),
+        ('concurrent', 'Produit concurrent'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    produit_id = models.PositiveBigIntegerField()
+    client = models.ForeignKey(
+        Client, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+',
+    )
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['client', 'deleted_at'], name='tombstone_client_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.produit_id} supprimé le {self.deleted_at}"
+class CodeSequence(models.Model):
+    """
+    Compteur par type de code (« mission », « pdv »). codes.py en réserve
+    des plages entières en une transaction ; `next_value` est la première
+    valeur non encore distribuée.
+    """
+    name = models.CharField(max_length=20, primary_key=True)
+    next_value = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name} -> {self.next_value}"
 class Mission(models.Model):
     ETAT_CHOICES = (
         ('planned', 'Planifiée'),
@@ -161,10 +229,33 @@ class Mission(models.Model):
     end_latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     end_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
 
+    # Géorepérage : distance au PDV (m) et position dans le rayon autorisé
+    # (None = pas de coordonnées). Calculés à l'enregistrement (cf. geo.py).
+    begin_distance_m = models.FloatField(null=True, blank=True)
+    begin_in_geofence = models.BooleanField(null=True, blank=True)
+    end_distance_m = models.FloatField(null=True, blank=True)
+    end_in_geofence = models.BooleanField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # dashboard_merch : missions du jour d'un merchandiser
+            models.Index(fields=['merchandiser', 'date_mission'], name='mission_merch_date_idx'),
+            # suivi par client / par jour et par état
+            models.Index(fields=['client', 'date_mission'], name='mission_client_date_idx'),
+            models.Index(fields=['date_mission', 'etat'], name='mission_date_etat_idx'),
+        ]
+
     def save(self, *args, **kwargs):
-        if not self.code:
-            self.code = f"MSN-{uuid.uuid4().hex[:6].upper()}"
-        super().save(*args, **kwargs)
+        from .geo import apply_geofence
+        changed = apply_geofence(self)
+        if changed and kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | set(changed)
+
+        if self.code:
+            return super().save(*args, **kwargs)
+        from .codes import assign_codes, save_with_code
+        assign_codes([self], 'mission')
+        save_with_code(self, 'mission', partial(super().save, *args, **kwargs))
 
     def clean(self):
         super().clean()
@@ -204,12 +295,27 @@ class RealisationClientData(models.Model):
     wilaya = models.CharField(max_length=100, blank=True)
     region = models.CharField(max_length=100, blank=True)
 
+    class Meta:
+        indexes = [
+            # reporting : client x période x région
+            models.Index(fields=['client', 'date_realisation', 'region'], name='real_client_date_region_idx'),
+        ]
+
+    objects = DenormalizedQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         # Récupération automatique wilaya / région depuis le PDV
-        if self.pdv:
-            self.wilaya = self.pdv.wilaya
-            self.region = self.pdv.region
+        from .denorm import denormalize_on_save
+        denormalize_on_save(self, kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Tranche lue en base : un déplacement recalcule aussi l'ancienne (cf. signals.py)
+        from .rollups import remember
+        remember(instance)
+        return instance
     def __str__(self):
         return f"{self.mission} - {self.produit}"
 class RealisationConcurrenceData(models.Model):
@@ -230,12 +336,26 @@ class RealisationConcurrenceData(models.Model):
     wilaya = models.CharField(max_length=100, blank=True)
     region = models.CharField(max_length=100, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['client', 'date_realisation', 'region'], name='realc_client_date_region_idx'),
+        ]
+
+    objects = DenormalizedQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         # Récupération automatique wilaya / région depuis le PDV
-        if self.pdv:
-            self.wilaya = self.pdv.wilaya
-            self.region = self.pdv.region
+        from .denorm import denormalize_on_save
+        denormalize_on_save(self, kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Tranche lue en base : un déplacement recalcule aussi l'ancienne (cf. signals.py)
+        from .rollups import remember
+        remember(instance)
+        return instance
     def __str__(self):
         return f"{self.mission} - {self.produit_concurrent} @ {self.pdv}"
 class PhotoMission(models.Model):
@@ -243,10 +363,21 @@ class PhotoMission(models.Model):
         ('avant', 'Avant'),
         ('apres', 'Après'),
     ]
+    STATUT_UPLOAD_CHOICES = [
+        ('pending', 'En attente'),
+        ('uploaded', 'Uploadée'),
+        ('failed', 'Échec'),
+        ('rejected', 'Image illisible'),
+    ]
     client = models.ForeignKey(Client, on_delete=models.CASCADE, null=True, blank=True, related_name='clien_photos')
     mission = models.ForeignKey('Mission', on_delete=models.CASCADE, related_name='photos')
     categorie = models.CharField(max_length=100)
-    image = CloudinaryField('image')
+    # Vide tant que la photo attend dans le spool local (cf. uploads.py)
+    image = CloudinaryField('image', blank=True)
+    # Vignette WebP carrée générée par imaging.process_photo
+    thumbnail = CloudinaryField('thumbnail', blank=True)
+    statut_upload = models.CharField(max_length=10, choices=STATUT_UPLOAD_CHOICES, default='uploaded')
+    spool_path = models.CharField(max_length=255, blank=True)
     type_photo = models.CharField(max_length=5, choices=TYPE_PHOTO_CHOICES)
     timestamp = models.DateTimeField(auto_now_add=True)
     pdv = models.ForeignKey(
@@ -257,18 +388,180 @@ class PhotoMission(models.Model):
     wilaya = models.CharField(max_length=100, blank=True)
     region = models.CharField(max_length=100, blank=True)
 
-    def save(self, *args, **kwargs):
-        # Récupération automatique du client et PDV depuis la mission
-        if self.mission:
-            self.client = self.mission.client
-            self.pdv = self.mission.pdv
+    # Empreintes (cf. fingerprint.py) : SHA-256 du fichier reçu, pHash 64 bits
+    DUPLICATE_KIND_CHOICES = [
+        ('exact', 'Fichier identique'),
+        ('near', 'Image quasi identique'),
+    ]
+    content_sha256 = models.CharField(max_length=64, blank=True)
+    phash = models.BigIntegerField(null=True, blank=True)
+    duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates',
+    )
+    duplicate_kind = models.CharField(max_length=5, choices=DUPLICATE_KIND_CHOICES, blank=True)
+
+    class Meta:
+        indexes = [
+            # upload_photo : fichier déjà reçu pour ce client ?
+            models.Index(fields=['client', 'content_sha256'], name='photo_client_sha_idx'),
+            # list_photos : filtre mission / type / catégorie, curseur sur -id
+            models.Index(fields=['mission', 'type_photo', 'categorie', 'id'], name='photo_mission_type_cat_idx'),
+            # search_photos : photos d'un client, curseur sur (-mission_id, -id)
+            models.Index(fields=['client', '-mission', '-id'], name='photo_client_mission_idx'),
+        ]
 
-        # Si on a un PDV, mettre à jour wilaya et région
-        if self.pdv:
-            self.wilaya = self.pdv.wilaya
-            self.region = self.pdv.region
+    objects = DenormalizedQuerySet.as_manager()
 
+    def save(self, *args, **kwargs):
+        # Récupération automatique du client et PDV depuis la mission,
+        # puis wilaya / région depuis le PDV
+        from .denorm import denormalize_on_save
+        denormalize_on_save(self, kwargs.get('update_fields'))
+
+        created = self.pk is None
         super().save(*args, **kwargs)
 
+        # Maintien incrémental du résumé de visite (dashboard client)
+        if created:
+            from .summaries import record_photo
+            record_photo(self)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Résumé de visite lu en base : un déplacement recalcule aussi l'ancien (cf. signals.py)
+        from .summaries import remember
+        remember(instance)
+        return instance
+
     def __str__(self):
         return f"{self.mission} - {self.categorie} - {self.type_photo}"
+class SyncBatch(models.Model):
+    """
+    Lot de synchronisation d'une visite envoyé par l'application mobile.
+    `batch_id` est généré côté téléphone : un renvoi du même lot retourne
+    la réponse enregistrée sans rien réappliquer.
+    """
+    batch_id = models.UUIDField(unique=True)
+    mission = models.ForeignKey(Mission, on_delete=models.CASCADE, related_name='sync_batches')
+    merch = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='sync_batches')
+    received_at = models.DateTimeField(auto_now_add=True)
+    response = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f"{self.batch_id} ({self.mission})"
+class ChunkedUpload(models.Model):
+    """
+    Upload photo par morceaux, reprenable (cf. chunked.py). `upload_id` est
+    généré côté téléphone : une initialisation renvoyée retrouve l'upload
+    en cours. `received` : intervalles [début, fin) déjà écrits dans le spool.
+    """
+    upload_id = models.UUIDField(unique=True)
+    mission = models.ForeignKey(Mission, on_delete=models.CASCADE, related_name='chunked_uploads')
+    merch = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='chunked_uploads')
+    filename = models.CharField(max_length=255, blank=True)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    categorie = models.CharField(max_length=100)
+    type_photo = models.CharField(max_length=5, choices=PhotoMission.TYPE_PHOTO_CHOICES)
+    spool_path = models.CharField(max_length=255)
+    received = models.JSONField(default=list)
+    photo = models.ForeignKey(PhotoMission, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.upload_id} ({self.mission})"
+class VisitSummary(models.Model):
+    """
+    Résumé matérialisé d'une visite : PDV x date, compteurs et vignettes
+    par catégorie. Alimenté à chaque insertion de PhotoMission, lu par le
+    dashboard client sans repasser sur l'historique des photos.
+    """
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, null=True, blank=True, related_name='visit_summaries')
+    pdv = models.ForeignKey(PointDeVente, on_delete=models.CASCADE, related_name='visit_summaries')
+    date_visite = models.DateField()
+    pdv_label = models.CharField(max_length=255, blank=True)
+    wilaya = models.CharField(max_length=100, blank=True)
+    region = models.CharField(max_length=100, blank=True)
+    merch_nom = models.CharField(max_length=201, blank=True)
+    nb_avant = models.PositiveIntegerField(default=0)
+    nb_apres = models.PositiveIntegerField(default=0)
+    # {categorie: {"avant": [{"thumb", "full"}], "apres": [...], "nb_avant": n, "nb_apres": n}}
+    categories = models.JSONField(default=dict, blank=True)
+    derniere_photo = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'pdv', 'date_visite'], name='uniq_visit_summary'),
+        ]
+        indexes = [
+            models.Index(fields=['client', '-date_visite', '-id'], name='visit_client_date_idx'),
+            models.Index(fields=['client', 'wilaya', 'region', '-date_visite'], name='visit_client_geo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.pdv_label} - {self.date_visite}"
+class DashboardFacet(models.Model):
+    """Valeurs distinctes (wilaya / région) disponibles pour les filtres d'un client."""
+    KIND_CHOICES = (
+        ('wilaya', 'Wilaya'),
+        ('region', 'Région'),
+    )
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, null=True, blank=True, related_name='dashboard_facets')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    value = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'kind', 'value'], name='uniq_dashboard_facet'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.value}"
+class RealisationRollup(models.Model):
+    """
+    Agrégat journalier des relevés : un enregistrement par PDV x produit x
+    jour. Maintenu par rollups.py à chaque écriture de relevés ; les vues
+    semaine / mois sont calculées à partir de ces lignes.
+    """
+    pdv = models.ForeignKey(PointDeVente, on_delete=models.CASCADE)
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, null=True, blank=True)
+    jour = models.DateField()
+    wilaya = models.CharField(max_length=100, blank=True)
+    region = models.CharField(max_length=100, blank=True)
+    nb_releves = models.PositiveIntegerField(default=0)
+    nb_disponible = models.PositiveIntegerField(default=0)
+    facing_total = models.FloatField(default=0)
+    nb_facing = models.PositiveIntegerField(default=0)
+    prix_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    nb_prix = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+class DailyRealisationClient(RealisationRollup):
+    produit = models.ForeignKey(ProduitClient, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['pdv', 'produit', 'jour'], name='uniq_daily_real_client'),
+        ]
+        indexes = [
+            models.Index(fields=['client', 'jour', 'region'], name='daily_client_jour_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.jour} - {self.pdv_id} - {self.produit_id}"
+class DailyRealisationConcurrence(RealisationRollup):
+    produit_concurrent = models.ForeignKey(ProduitConcurrent, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['pdv', 'produit_concurrent', 'jour'], name='uniq_daily_real_concurrence'),
+        ]
+        indexes = [
+            models.Index(fields=['client', 'jour', 'region'], name='dailyc_client_jour_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.jour} - {self.pdv_id} - {self.produit_concurrent_id}"
@@ -0,0 +1,128 @@
+"""
+Pagination par clé (keyset / curseur) pour les endpoints JSON.
+
+Contrairement à django.core.paginator.Paginator, aucune requête COUNT(*)
+ni OFFSET : chaque page est un `WHERE (clé) < (dernière clé vue)
+ORDER BY clé LIMIT n`, à coût constant quelle que soit la profondeur.
+
+    paginator = CursorPaginator(qs, ordering=('-timestamp', '-id'))
+    page = paginator.page(request.GET.get('cursor'), request.GET.get('page_size'))
+    page.items, page.next_cursor
+
+L'ordre doit se terminer par une clé unique (en pratique 'id' / '-id')
+et ne porter que sur des colonnes non nulles.
+"""
+import base64
+import json
+from dataclasses import dataclass
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Au-delà, count_estimate() répond "au moins COUNT_LIMIT"
+COUNT_LIMIT = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class CursorPage:
+    items: list
+    next_cursor: str = None
+    page_size: int = DEFAULT_PAGE_SIZE
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("curseur invalide")
+    if not isinstance(values, list):
+        raise InvalidCursor("curseur invalide")
+    return values
+
+
+def clamp_page_size(page_size, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        page_size = int(page_size) if page_size not in (None, '') else default
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, maximum))
+
+
+def count_estimate(queryset, limit=COUNT_LIMIT):
+    """
+    Comptage borné : ne lit jamais plus de `limit` + 1 lignes.
+    Retourne (nombre, exact) ; exact=False signifie "au moins `limit`".
+    """
+    n = queryset.order_by()[:limit + 1].count()
+    return min(n, limit), n <= limit
+
+
+class CursorPaginator:
+    def __init__(self, queryset, ordering=('-id',), default_page_size=DEFAULT_PAGE_SIZE, max_page_size=MAX_PAGE_SIZE):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.default_page_size = default_page_size
+        self.max_page_size = max_page_size
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.descending = [name.startswith('-') for name in self.ordering]
+
+    def _model_field(self, name):
+        opts = self.queryset.model._meta
+        if name == 'pk':
+            return opts.pk
+        return opts.get_field(name)
+
+    def _parse(self, cursor):
+        values = decode_cursor(cursor)
+        if len(values) != len(self.fields):
+            raise InvalidCursor("curseur invalide")
+        try:
+            return [self._model_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except Exception:
+            raise InvalidCursor("curseur invalide")
+
+    def _after(self, values):
+        # (a, b, c) > (x, y, z) en ordre lexicographique, chaque clé selon son sens
+        condition = Q()
+        for i, name in enumerate(self.fields):
+            lookup = 'lt' if self.descending[i] else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[i]})
+            for prev in range(i):
+                step &= Q(**{self.fields[prev]: values[prev]})
+            condition |= step
+        return condition
+
+    def page(self, cursor=None, page_size=None):
+        page_size = clamp_page_size(page_size, self.default_page_size, self.max_page_size)
+        qs = self.queryset.order_by(*self.ordering)
+        if cursor:
+            qs = qs.filter(self._after(self._parse(cursor)))
+
+        rows = list(qs[:page_size + 1])
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor([self._key(rows[-1], name) for name in self.fields])
+        return CursorPage(items=rows, next_cursor=next_cursor, page_size=page_size)
+
+    @staticmethod
+    def _key(row, name):
+        if isinstance(row, dict):
+            return row[name]
+        return getattr(row, 'pk' if name == 'pk' else name)
@@ -0,0 +1,143 @@
+"""
+Recherche de photos sur un ensemble de missions (portail client,
+superviseurs), en remplacement d'un appel à list_photos par mission.
+
+- une seule requête par page : les colonnes utiles de la photo, de sa
+  mission, du merchandiser et du PDV sont lues par jointure et projetées
+  avec `.values()` (pas d'instance de modèle) ;
+- tri par (-mission_id, -id) et pagination par clé (cf. pagination.py) :
+  les photos d'une mission sont contiguës, regroupées par `group_rows` ;
+  une mission peut se poursuivre sur la page suivante (même mission_id) ;
+- périmètre selon le rôle (cf. visible_photos), appliqué avant les
+  filtres de la requête.
+"""
+from .models import PhotoMission
+from .pagination import CursorPaginator
+from .uploads import display_url, thumbnail_url
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+COLUMNS = (
+    'id',
+    'mission_id',
+    'categorie',
+    'type_photo',
+    'statut_upload',
+    'image',
+    'thumbnail',
+    'timestamp',
+    'duplicate_of_id',
+    'wilaya',
+    'region',
+    'pdv_id',
+    'mission__code',
+    'mission__date_mission',
+    'mission__etat',
+    'mission__merchandiser__first_name',
+    'mission__merchandiser__last_name',
+    'pdv__code',
+    'pdv__no_pdv',
+    'pdv__commune',
+)
+
+
+class InvalidSearch(ValueError):
+    pass
+
+
+def visible_photos(user):
+    """
+    Photos que `user` peut consulter, None s'il n'a accès à aucune :
+    staff : toutes ; client : celles de son client ; superviseur : celles
+    de sa région ; merchandiser : celles de ses missions.
+    """
+    qs = PhotoMission.objects.all()
+    if user.is_staff:
+        return qs
+    role = getattr(user, 'role', None)
+    if role == 'client':
+        return qs.filter(client_id=user.client_id) if user.client_id else None
+    if role == 'superviseur':
+        return qs.filter(region=user.region) if user.region else None
+    if role == 'merchandiser':
+        return qs.filter(mission__merchandiser=user)
+    return None
+
+
+def search_queryset(
+    base,
+    client_id=None,
+    date_from=None,
+    date_to=None,
+    wilaya=None,
+    region=None,
+    pdv_id=None,
+    mission_ids=None,
+    categorie=None,
+    photo_type=None,
+):
+    qs = base
+    if client_id is not None:
+        qs = qs.filter(client_id=client_id)
+    if date_from:
+        qs = qs.filter(mission__date_mission__gte=date_from)
+    if date_to:
+        qs = qs.filter(mission__date_mission__lte=date_to)
+    if wilaya:
+        qs = qs.filter(wilaya=wilaya)
+    if region:
+        qs = qs.filter(region=region)
+    if pdv_id is not None:
+        qs = qs.filter(pdv_id=pdv_id)
+    if mission_ids:
+        qs = qs.filter(mission_id__in=mission_ids)
+    if categorie:
+        qs = qs.filter(categorie=categorie)
+    if photo_type:
+        if photo_type not in ('avant', 'apres'):
+            raise InvalidSearch(f"type de photo inconnu : {photo_type}")
+        qs = qs.filter(type_photo=photo_type)
+    return qs.values(*COLUMNS)
+
+
+def search_page(queryset, cursor=None, page_size=None):
+    """Lève InvalidCursor si le curseur est corrompu."""
+    paginator = CursorPaginator(
+        queryset, ordering=('-mission_id', '-id'),
+        default_page_size=DEFAULT_PAGE_SIZE, max_page_size=MAX_PAGE_SIZE,
+    )
+    return paginator.page(cursor, page_size)
+
+
+def group_rows(request, rows):
+    """Lignes (triées par mission) -> une entrée par mission, avec son PDV et ses photos."""
+    groups = []
+    for row in rows:
+        if not groups or groups[-1]['mission_id'] != row['mission_id']:
+            groups.append({
+                'mission_id': row['mission_id'],
+                'mission_code': row['mission__code'],
+                'date': row['mission__date_mission'].isoformat(),
+                'etat': row['mission__etat'],
+                'merch': f"{row['mission__merchandiser__first_name']} {row['mission__merchandiser__last_name']}".strip(),
+                'pdv': {
+                    'id': row['pdv_id'],
+                    'code': row['pdv__code'],
+                    'no_pdv': row['pdv__no_pdv'],
+                    'commune': row['pdv__commune'],
+                    'wilaya': row['wilaya'],
+                    'region': row['region'],
+                },
+                'photos': [],
+            })
+        groups[-1]['photos'].append({
+            'id': row['id'],
+            'url': display_url(request, row['id'], row['statut_upload'], row['image']),
+            'thumb': thumbnail_url(request, row['id'], row['statut_upload'], row['image'], row['thumbnail']),
+            'cat': row['categorie'],
+            'type': row['type_photo'],
+            'timestamp': row['timestamp'].isoformat(),
+            'duplicate_of': row['duplicate_of_id'],
+        })
+    return groups
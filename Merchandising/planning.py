@@ -0,0 +1,192 @@
+"""
+Planification des missions en masse.
+
+Une règle de récurrence décrit : un projet (client + période
+date_lancement / date_fin), un merchandiser, un ensemble de PDV, des
+jours de la semaine (0 = lundi) et une fréquence en semaines. Les missions
+sont générées en mémoire, comparées aux missions existantes (même
+merchandiser, même PDV, même jour : conflit, on n'en crée pas une
+deuxième), reçoivent des codes réservés d'avance (cf. codes.py) puis sont
+insérées avec `bulk_create` par paquets. En mode dry_run rien n'est
+écrit : le rapport donne les volumes et les conflits.
+
+bulk_create ne passe pas par Mission.save() / clean() : les contrôles
+utiles (dates passées, rôle du merchandiser) sont faits ici.
+"""
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from django.utils.dateparse import parse_date
+from django.utils.timezone import localdate
+
+from . import codes
+from .models import CustomUser, Mission, PointDeVente, Projet
+
+CHUNK_SIZE = 1000
+# Nombre de conflits détaillés dans le rapport (les autres sont comptés)
+MAX_REPORTED_CONFLICTS = 100
+
+
+class PlanningError(ValueError):
+    pass
+
+
+@dataclass
+class MissionRule:
+    projet_id: int
+    merchandiser_id: int
+    pdv_ids: list
+    weekdays: list
+    every_weeks: int = 1
+    # Bornes optionnelles, ramenées à la période du projet
+    date_from: date = None
+    date_to: date = None
+
+
+@dataclass
+class PlanningReport:
+    dry_run: bool = False
+    generated: int = 0
+    created: int = 0
+    skipped_past: int = 0
+    conflicts: int = 0
+    # [{'merchandiser_id', 'pdv_id', 'date', 'reason'}], au plus MAX_REPORTED_CONFLICTS
+    conflict_details: list = field(default_factory=list)
+
+    def add_conflict(self, merchandiser_id, pdv_id, day, reason):
+        self.conflicts += 1
+        if len(self.conflict_details) < MAX_REPORTED_CONFLICTS:
+            self.conflict_details.append({
+                'merchandiser_id': merchandiser_id,
+                'pdv_id': pdv_id,
+                'date': day.isoformat(),
+                'reason': reason,
+            })
+
+
+def _date(value):
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+def parse_rules(data, projet_id=None):
+    """
+    Règles depuis une liste de dicts (fichier JSON) :
+    {"projet": id, "merchandiser": id, "pdvs": [ids], "weekdays": [0, 3],
+     "every_weeks": 1, "date_from": "AAAA-MM-JJ", "date_to": "AAAA-MM-JJ"}.
+    `projet_id` sert de projet par défaut.
+    """
+    if not isinstance(data, list):
+        raise PlanningError("la liste des règles est attendue")
+    rules = []
+    for index, item in enumerate(data):
+        if not isinstance(item, dict):
+            raise PlanningError(f"règle {index} invalide")
+        try:
+            rules.append(MissionRule(
+                projet_id=int(item.get('projet') or projet_id),
+                merchandiser_id=int(item['merchandiser']),
+                pdv_ids=[int(p) for p in item['pdvs']],
+                weekdays=[int(d) for d in item['weekdays']],
+                every_weeks=int(item.get('every_weeks') or 1),
+                date_from=_date(item.get('date_from')),
+                date_to=_date(item.get('date_to')),
+            ))
+        except (KeyError, TypeError, ValueError):
+            raise PlanningError(f"règle {index} invalide")
+    return rules
+
+
+def rule_dates(rule, projet):
+    """Jours couverts par la règle, dans la période du projet."""
+    start = max(filter(None, [rule.date_from, projet.date_lancement]))
+    end = min(filter(None, [rule.date_to, projet.date_fin]))
+    weekdays = set(rule.weekdays)
+    # Les semaines sont comptées à partir du lundi de la première semaine
+    first_monday = start - timedelta(days=start.weekday())
+    day = start
+    while day <= end:
+        if day.weekday() in weekdays and ((day - first_monday).days // 7) % rule.every_weeks == 0:
+            yield day
+        day += timedelta(days=1)
+
+
+def _validate(rules):
+    if not rules:
+        return {}
+    projets = Projet.objects.in_bulk({r.projet_id for r in rules})
+    merch_ids = set(
+        CustomUser.objects.filter(id__in={r.merchandiser_id for r in rules}, role='merchandiser')
+        .values_list('id', flat=True)
+    )
+    pdv_ids = set(
+        PointDeVente.objects.filter(id__in={p for r in rules for p in r.pdv_ids}).values_list('id', flat=True)
+    )
+    for index, rule in enumerate(rules):
+        if rule.projet_id not in projets:
+            raise PlanningError(f"règle {index} : projet {rule.projet_id} introuvable")
+        if rule.merchandiser_id not in merch_ids:
+            raise PlanningError(f"règle {index} : merchandiser {rule.merchandiser_id} introuvable")
+        missing = set(rule.pdv_ids) - pdv_ids
+        if missing:
+            raise PlanningError(f"règle {index} : PDV introuvable(s) {sorted(missing)}")
+        if not rule.weekdays or not set(rule.weekdays) <= set(range(7)):
+            raise PlanningError(f"règle {index} : jours de semaine invalides")
+        if rule.every_weeks < 1:
+            raise PlanningError(f"règle {index} : fréquence invalide")
+    return projets
+
+
+def _existing_keys(rules, projets):
+    """(merchandiser, pdv, jour) déjà planifiés sur la période des règles."""
+    start = min(projets[r.projet_id].date_lancement for r in rules)
+    end = max(projets[r.projet_id].date_fin for r in rules)
+    rows = Mission.objects.filter(
+        merchandiser_id__in={r.merchandiser_id for r in rules},
+        date_mission__range=(start, end),
+    ).values_list('merchandiser_id', 'pdv_id', 'date_mission')
+    return set(rows.iterator(chunk_size=5000))
+
+
+def plan_missions(rules, created_by=None, dry_run=False, chunk_size=CHUNK_SIZE):
+    """Génère et insère les missions des règles ; retourne un PlanningReport."""
+    report = PlanningReport(dry_run=dry_run)
+    projets = _validate(rules)
+    if not rules:
+        return report
+
+    today = localdate()
+    seen = _existing_keys(rules, projets)
+    existing = set(seen)
+    planned = []
+    for rule in rules:
+        projet = projets[rule.projet_id]
+        for day in rule_dates(rule, projet):
+            if day < today:
+                report.skipped_past += len(rule.pdv_ids)
+                continue
+            for pdv_id in rule.pdv_ids:
+                key = (rule.merchandiser_id, pdv_id, day)
+                if key in seen:
+                    reason = 'existing' if key in existing else 'duplicate'
+                    report.add_conflict(rule.merchandiser_id, pdv_id, day, reason)
+                    continue
+                seen.add(key)
+                planned.append(Mission(
+                    pdv_id=pdv_id,
+                    date_mission=day,
+                    merchandiser_id=rule.merchandiser_id,
+                    created_by=created_by,
+                    client_id=projet.client_id,
+                    etat='planned',
+                ))
+    report.generated = len(planned)
+    if dry_run or not planned:
+        return report
+
+    report.created = codes.bulk_create(Mission, planned, 'mission', batch_size=chunk_size)
+    return report
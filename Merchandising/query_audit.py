@@ -0,0 +1,116 @@
+"""
+Audit des plans d'exécution des requêtes canoniques de l'application.
+
+Chaque requête des chemins chauds (dashboards, listes, reporting) est
+passée à EXPLAIN sur la base courante ; les parcours complets de table
+sont signalés. Utilisé par la commande `manage.py audit_query_plans`.
+"""
+import re
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.db import connections
+from django.utils.timezone import localdate
+
+from .models import (
+    DailyRealisationClient,
+    Mission,
+    PhotoMission,
+    RealisationClientData,
+    RealisationConcurrenceData,
+    VisitSummary,
+)
+
+# Valeurs d'exemple : le plan dépend des index, pas des données
+SAMPLE_ID = 1
+SAMPLE_WILAYA = 'Alger'
+SAMPLE_REGION = 'Centre'
+
+
+def canonical_queries():
+    """(nom, queryset) des accès critiques, dans l'ordre des écrans."""
+    today = localdate()
+    month_ago = today - timedelta(days=30)
+    return [
+        ('dashboard_merch', Mission.objects.filter(
+            merchandiser_id=SAMPLE_ID, date_mission=today,
+        ).order_by('date_mission')),
+        ('client_dashboard', VisitSummary.objects.filter(
+            client_id=SAMPLE_ID,
+        ).order_by('-date_visite', '-id')[:21]),
+        ('search_photos', PhotoMission.objects.filter(
+            client_id=SAMPLE_ID, wilaya=SAMPLE_WILAYA,
+        ).order_by('-mission_id', '-id')[:101]),
+        ('list_photos', PhotoMission.objects.filter(
+            mission_id=SAMPLE_ID, type_photo='avant', categorie='x',
+        ).order_by('-id')[:51]),
+        ('reporting_client', RealisationClientData.objects.filter(
+            client_id=SAMPLE_ID, date_realisation__range=(month_ago, today), region=SAMPLE_REGION,
+        )),
+        ('reporting_concurrence', RealisationConcurrenceData.objects.filter(
+            client_id=SAMPLE_ID, date_realisation__range=(month_ago, today), region=SAMPLE_REGION,
+        )),
+        ('kpi_rollups', DailyRealisationClient.objects.filter(
+            client_id=SAMPLE_ID, jour__range=(month_ago, today),
+        )),
+    ]
+
+
+@dataclass
+class PlanReport:
+    name: str
+    plan: list
+    full_scans: list = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return not self.full_scans
+
+
+# SQLite : "SCAN <table>" sans index ; les SEARCH / SCAN ... USING INDEX sont acceptés
+_SQLITE_SCAN = re.compile(r'^SCAN (?!.*\bUSING (COVERING )?INDEX\b)')
+# SQL Server : parcours de table ou d'index cluster sans Seek
+_MSSQL_SCAN = re.compile(r'\b(Table Scan|Clustered Index Scan)\b')
+_PG_SCAN = re.compile(r'\bSeq Scan\b')
+
+
+def _explain_sqlite(cursor, sql, params):
+    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+    plan = [row[-1] for row in cursor.fetchall()]
+    return plan, [line for line in plan if _SQLITE_SCAN.search(line)]
+
+
+def _explain_mssql(cursor, sql, params):
+    cursor.execute('SET SHOWPLAN_TEXT ON')
+    try:
+        cursor.execute(sql, params)
+        plan = []
+        while True:
+            plan.extend(str(row[0]) for row in cursor.fetchall())
+            if not cursor.nextset():
+                break
+    finally:
+        cursor.execute('SET SHOWPLAN_TEXT OFF')
+    return plan, [line for line in plan if _MSSQL_SCAN.search(line)]
+
+
+def explain(name, queryset, using='default'):
+    connection = connections[using]
+    sql, params = queryset.query.get_compiler(using=using).as_sql()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            plan, scans = _explain_sqlite(cursor, sql, params)
+        elif connection.vendor == 'microsoft':
+            plan, scans = _explain_mssql(cursor, sql, params)
+        else:
+            plan = queryset.explain().splitlines()
+            scans = [line for line in plan if _PG_SCAN.search(line)]
+    return PlanReport(name=name, plan=plan, full_scans=scans)
+
+
+def audit(using='default', only=None):
+    return [
+        explain(name, qs.using(using), using=using)
+        for name, qs in canonical_queries()
+        if not only or name in only
+    ]
@@ -0,0 +1,245 @@
+"""
+Agrégats journaliers des relevés (DailyRealisationClient / Concurrence).
+
+- refresh_slice : recalcule les agrégats d'un PDV pour un jour ; appelé par
+  l'ingestion dans la même transaction que l'écriture des relevés ;
+- schedule_refresh : pour les autres écritures d'un relevé (save() /
+  delete(), admin, suppression en cascade d'une mission ou d'un PDV ;
+  cf. signals.py), la tranche est recalculée après le commit, une fois
+  par tranche et par transaction. Les QuerySet.update() / bulk_create()
+  hors ingestion ne passent pas par les signaux : le code qui écrit en
+  masse appelle ensuite refresh_range (ou refresh_slice) sur la période
+  écrite, comme synthetic.py ; à défaut, `manage.py rebuild_rollups` ;
+- refresh_range : recalcule une période (rattrapage, correction de
+  données). Idempotent : les agrégats de la période sont supprimés puis
+  réécrits depuis les relevés bruts ;
+- series : agrégats semaine / mois lus sur les lignes journalières, pour un
+  coût proportionnel au nombre de jours et non au nombre de relevés.
+"""
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, IntegerField, Max, Sum
+from django.db.models.functions import Cast, TruncMonth, TruncWeek
+
+from .models import (
+    DailyRealisationClient,
+    DailyRealisationConcurrence,
+    PointDeVente,
+    RealisationClientData,
+    RealisationConcurrenceData,
+)
+
+BATCH_SIZE = 1000
+
+# alias de base -> tranches (kind, pdv_id, jour) à recalculer au commit
+_pending = threading.local()
+
+# kind -> (relevés bruts, agrégat journalier, champ produit)
+ROLLUPS = {
+    'client': (RealisationClientData, DailyRealisationClient, 'produit'),
+    'concurrence': (RealisationConcurrenceData, DailyRealisationConcurrence, 'produit_concurrent'),
+}
+
+RAW_KINDS = {raw_model: kind for kind, (raw_model, _, _) in ROLLUPS.items()}
+
+GRAINS = {
+    'day': None,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# Colonnes des séries -> compteur journalier sommé
+SERIES_COLUMNS = {
+    'n': 'nb_releves',
+    'n_dispo': 'nb_disponible',
+    'facing_sum': 'facing_total',
+    'facing_n': 'nb_facing',
+    'price_sum': 'prix_total',
+    'price_n': 'nb_prix',
+}
+
+
+def _spec(kind):
+    if kind not in ROLLUPS:
+        raise ValueError(f"type d'agrégat inconnu : {kind}")
+    return ROLLUPS[kind]
+
+
+def derive(kind, raw_qs):
+    """Agrégats journaliers (non enregistrés) calculés par la base depuis les relevés."""
+    _, rollup_model, produit_field = _spec(kind)
+    rows = (
+        raw_qs.values('pdv_id', f'{produit_field}_id', 'date_realisation')
+        .annotate(
+            # Valeurs dénormalisées : identiques sur toutes les lignes du
+            # groupe sauf changement de région du PDV dans la journée
+            client_ref=Max('client_id'),
+            wilaya_ref=Max('wilaya'),
+            region_ref=Max('region'),
+            nb_releves=Count('id'),
+            nb_disponible=Sum(Cast('disponible', IntegerField())),
+            facing_total=Sum('facing_share'),
+            nb_facing=Count('facing_share'),
+            prix_total=Sum('prix_vente'),
+            nb_prix=Count('prix_vente'),
+        )
+        .order_by()
+    )
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        yield rollup_model(
+            pdv_id=row['pdv_id'],
+            client_id=row['client_ref'],
+            jour=row['date_realisation'],
+            wilaya=row['wilaya_ref'] or '',
+            region=row['region_ref'] or '',
+            nb_releves=row['nb_releves'],
+            nb_disponible=row['nb_disponible'] or 0,
+            facing_total=row['facing_total'] or 0,
+            nb_facing=row['nb_facing'],
+            prix_total=row['prix_total'] or 0,
+            nb_prix=row['nb_prix'],
+            **{f'{produit_field}_id': row[f'{produit_field}_id']},
+        )
+
+
+def _rewrite(kind, raw_qs, rollup_qs):
+    _, rollup_model, _ = _spec(kind)
+    rollup_qs.delete()
+    rollups = list(derive(kind, raw_qs))
+    rollup_model.objects.bulk_create(rollups, batch_size=BATCH_SIZE)
+    return len(rollups)
+
+
+def refresh_slice(kind, pdv_id, jours):
+    """
+    Recalcule les agrégats d'un PDV pour les jours donnés. Le PDV est
+    verrouillé pour que deux visites simultanées ne réécrivent pas la même
+    tranche en parallèle.
+    """
+    raw_model, rollup_model, _ = _spec(kind)
+    jours = set(jours)
+    if not jours:
+        return 0
+    with transaction.atomic(savepoint=False):
+        list(PointDeVente.objects.select_for_update().filter(id=pdv_id).values_list('id', flat=True))
+        return _rewrite(
+            kind,
+            raw_model.objects.filter(pdv_id=pdv_id, date_realisation__in=jours),
+            rollup_model.objects.filter(pdv_id=pdv_id, jour__in=jours),
+        )
+
+
+def _pending_slices(using):
+    if not hasattr(_pending, 'slices'):
+        _pending.slices = defaultdict(set)
+    return _pending.slices[using]
+
+
+def schedule_refresh(kind, pdv_id, jour, using=DEFAULT_DB_ALIAS):
+    """
+    Recalcule la tranche (PDV, jour) après le commit de la transaction en
+    cours (immédiatement hors transaction). Les tranches d'une transaction
+    annulée sont recalculées avec celles du commit suivant : sans effet,
+    le recalcul étant idempotent.
+    """
+    _spec(kind)
+    if pdv_id is None or jour is None:
+        return
+    _pending_slices(using).add((kind, pdv_id, jour))
+    transaction.on_commit(lambda: flush_pending(using), using=using)
+
+
+def remember(obj):
+    """La tranche actuelle du relevé devient celle à recalculer s'il change de PDV."""
+    if not {'pdv_id', 'date_realisation'} & obj.get_deferred_fields():
+        obj._loaded_slice = (obj.pdv_id, obj.date_realisation)
+
+
+def realisation_changed(obj, using=DEFAULT_DB_ALIAS):
+    """Relevé enregistré ou supprimé hors ingestion (cf. signals.py) : tranches avant / après."""
+    kind = RAW_KINDS[type(obj)]
+    loaded = getattr(obj, '_loaded_slice', None)
+    if loaded is not None:
+        schedule_refresh(kind, *loaded, using=using)
+    schedule_refresh(kind, obj.pdv_id, obj.date_realisation, using=using)
+    remember(obj)
+
+
+def flush_pending(using=DEFAULT_DB_ALIAS):
+    """Recalcule les tranches en attente ; sans effet si un rappel précédent l'a déjà fait."""
+    pending = _pending_slices(using)
+    slices = defaultdict(set)
+    while pending:
+        kind, pdv_id, jour = pending.pop()
+        slices[kind, pdv_id].add(jour)
+    for (kind, pdv_id), jours in slices.items():
+        refresh_slice(kind, pdv_id, jours)
+
+
+def refresh_range(kind, date_from, date_to, client_id=None, days_per_batch=31):
+    """
+    Recalcule [date_from, date_to] par tranches de `days_per_batch` jours
+    (une transaction par tranche). Retourne le nombre d'agrégats écrits.
+    """
+    raw_model, rollup_model, _ = _spec(kind)
+    written = 0
+    start = date_from
+    while start <= date_to:
+        end = min(start + timedelta(days=days_per_batch - 1), date_to)
+        raw_qs = raw_model.objects.filter(date_realisation__range=(start, end))
+        rollup_qs = rollup_model.objects.filter(jour__range=(start, end))
+        if client_id is not None:
+            raw_qs = raw_qs.filter(client_id=client_id)
+            rollup_qs = rollup_qs.filter(client_id=client_id)
+        with transaction.atomic():
+            written += _rewrite(kind, raw_qs, rollup_qs)
+        start = end + timedelta(days=1)
+    return written
+
+
+def raw_date_bounds(kind, client_id=None):
+    """(premier jour, dernier jour) des relevés bruts, ou (None, None)."""
+    raw_model, _, _ = _spec(kind)
+    qs = raw_model.objects.all()
+    if client_id is not None:
+        qs = qs.filter(client_id=client_id)
+    dates = qs.order_by('date_realisation').values_list('date_realisation', flat=True)
+    first = dates.first()
+    if first is None:
+        return None, None
+    return first, qs.order_by('-date_realisation').values_list('date_realisation', flat=True).first()
+
+
+def rollup_queryset(kind, client_id, date_from=None, date_to=None):
+    _, rollup_model, _ = _spec(kind)
+    qs = rollup_model.objects.filter(client_id=client_id)
+    if date_from:
+        qs = qs.filter(jour__gte=date_from)
+    if date_to:
+        qs = qs.filter(jour__lte=date_to)
+    return qs
+
+
+def with_period(queryset, grain='week'):
+    """Ajoute la colonne `periode` (début de semaine / de mois, ou le jour)."""
+    if grain not in GRAINS:
+        raise ValueError(f"granularité inconnue : {grain}")
+    trunc = GRAINS[grain]
+    return queryset.annotate(periode=trunc('jour') if trunc else F('jour'))
+
+
+def series(kind, client_id, grain='week', keys=('region',), date_from=None, date_to=None):
+    """
+    Compteurs (SERIES_COLUMNS) agrégés par période et par `keys` (colonnes
+    de l'agrégat : 'region', 'wilaya', 'pdv_id', 'produit__categorie'...).
+    Retourne un queryset de dictionnaires ordonné par période.
+    """
+    qs = with_period(rollup_queryset(kind, client_id, date_from, date_to), grain)
+    return (
+        qs.values('periode', *keys)
+        .annotate(**{column: Sum(counter) for column, counter in SERIES_COLUMNS.items()})
+        .order_by('periode', *keys)
+    )
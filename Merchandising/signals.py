@@ -0,0 +1,95 @@
+"""
+Invalidation des caches :
+- catalogue : toute écriture sur les produits ou les concurrents d'un
+  client incrémente sa CatalogVersion ; un produit supprimé laisse une
+  tombe pour le delta de synchronisation (cf. sync.py) ;
+- index spatial : toute écriture sur un PDV fait reconstruire l'index ;
+- colonnes dénormalisées : un PDV qui change de wilaya / région / commune
+  est recopié dans les relevés, photos et résumés (cf. denorm.py) ;
+- utilisateur authentifié : toute écriture sur l'utilisateur ou son client
+  retire l'utilisateur du cache d'authentification (cf. auth_cache.py) ;
+- tableau de bord superviseur : toute écriture sur une mission réveille les
+  pages ouvertes sur sa région (cf. supervision.py) ;
+- agrégats journaliers : un relevé enregistré ou supprimé hors ingestion
+  (admin, cascade) fait recalculer sa tranche après commit (cf. rollups.py) ;
+- résumés de visite : une photo supprimée ou déplacée fait recalculer les
+  résumés quitté et rejoint après commit (cf. summaries.py).
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import auth_cache, denorm, geo, rollups, summaries, supervision
+from .catalog import bump_version
+from .sync import bury_product
+from .models import (
+    Client,
+    Concurrent,
+    CustomUser,
+    Mission,
+    PhotoMission,
+    PointDeVente,
+    ProduitClient,
+    ProduitConcurrent,
+    RealisationClientData,
+    RealisationConcurrenceData,
+)
+
+
+@receiver([post_save, post_delete], sender=ProduitClient)
+def produit_client_changed(sender, instance, signal, **kwargs):
+    bump_version(instance.client_id)
+    if signal is post_delete:
+        bury_product('client', instance.id, instance.client_id)
+
+
+@receiver([post_save, post_delete], sender=ProduitConcurrent)
+def produit_concurrent_changed(sender, instance, signal, **kwargs):
+    client_id = Concurrent.objects.filter(id=instance.concurrent_id).values_list('client_id', flat=True).first()
+    bump_version(client_id)
+    if signal is post_delete:
+        bury_product('concurrent', instance.id, client_id)
+
+
+@receiver([post_save, post_delete], sender=Concurrent)
+def concurrent_changed(sender, instance, **kwargs):
+    bump_version(instance.client_id)
+
+
+@receiver([post_save, post_delete], sender=PointDeVente)
+def pdv_changed(sender, instance, **kwargs):
+    geo.invalidate()
+
+
+@receiver(post_save, sender=PointDeVente)
+def pdv_moved(sender, instance, created, **kwargs):
+    if not created and denorm.pdv_moved(instance):
+        denorm.cascade_pdv([instance.id])
+    denorm.remember(instance)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def user_changed(sender, instance, **kwargs):
+    auth_cache.invalidate(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Client)
+def client_changed(sender, instance, **kwargs):
+    auth_cache.invalidate_client(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Mission)
+def mission_saved(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None or set(update_fields) & supervision.TRACKED_FIELDS:
+        supervision.mission_changed(instance)
+
+
+@receiver([post_save, post_delete], sender=RealisationClientData)
+@receiver([post_save, post_delete], sender=RealisationConcurrenceData)
+def realisation_changed(sender, instance, using, **kwargs):
+    rollups.realisation_changed(instance, using)
+
+
+@receiver([post_save, post_delete], sender=PhotoMission)
+def photo_changed(sender, instance, signal, using, created=False, **kwargs):
+    summaries.photo_changed(instance, created=created, deleted=signal is post_delete, using=using)
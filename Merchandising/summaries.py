@@ -0,0 +1,285 @@
+"""
+Résumés de visite pour le dashboard client.
+
+Chaque insertion de PhotoMission met à jour une ligne VisitSummary
+(PDV x date) et les facettes wilaya / région du client : le dashboard
+lit une page de résumés au lieu de parcourir tout l'historique photos.
+
+Une photo supprimée (admin, cascade d'une mission) ou déplacée vers une
+autre mission / un autre PDV, ou dont la catégorie ou le type change,
+fait recalculer après commit le résumé qu'elle quitte et celui qu'elle
+rejoint (cf. signals.py), comme les agrégats de rollups.py. Les
+QuerySet.update() / delete() ne passent pas par les signaux : relancer
+`manage.py rebuild_visit_summaries`.
+"""
+import threading
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import DashboardFacet, Mission, PhotoMission, VisitSummary
+from .pagination import CursorPaginator
+
+# Vignettes gardées par catégorie et par type (avant / après)
+MAX_THUMBS = 12
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Champs de la photo qui déterminent son résumé et ses compteurs
+SLICE_FIELDS = ('client_id', 'pdv_id', 'mission_id', 'categorie', 'type_photo')
+
+# alias de base -> résumés (client_id, pdv_id, date_visite) à recalculer au commit
+_pending = threading.local()
+
+
+def photo_url(photo, field='image'):
+    value = getattr(photo, field)
+    if not value:
+        return ''
+    # Avant rechargement depuis la base, l'attribut peut encore être un public_id brut
+    value = photo._meta.get_field(field).to_python(value)
+    try:
+        return value.url
+    except Exception:
+        return ''
+
+
+def photo_entry(photo):
+    """{"thumb", "full"} pour une photo uploadée, None si elle est encore dans le spool."""
+    full = photo_url(photo)
+    if not full:
+        return None
+    return {"thumb": photo_url(photo, 'thumbnail') or full, "full": full}
+
+
+def _merch_nom(mission):
+    merch = mission.merchandiser
+    return f"{merch.first_name} {merch.last_name}" if merch else ""
+
+
+def _apply(summary, photo, entry):
+    cat = summary.categories.setdefault(
+        photo.categorie, {"avant": [], "apres": [], "nb_avant": 0, "nb_apres": 0}
+    )
+    kind = photo.type_photo
+    cat[f"nb_{kind}"] = cat.get(f"nb_{kind}", 0) + 1
+    if entry and len(cat[kind]) < MAX_THUMBS:
+        cat[kind].append(entry)
+
+    if kind == 'avant':
+        summary.nb_avant += 1
+    else:
+        summary.nb_apres += 1
+    if photo.timestamp and (summary.derniere_photo is None or photo.timestamp > summary.derniere_photo):
+        summary.derniere_photo = photo.timestamp
+
+
+def _defaults(photo):
+    return {
+        'pdv_label': str(photo.pdv),
+        'wilaya': photo.wilaya,
+        'region': photo.region,
+        'merch_nom': _merch_nom(photo.mission),
+    }
+
+
+def record_photo(photo):
+    """Ajoute une photo fraîchement créée à son résumé de visite."""
+    if not photo.pdv_id:
+        return
+
+    with transaction.atomic():
+        summary, _ = VisitSummary.objects.select_for_update().get_or_create(
+            client_id=photo.client_id,
+            pdv_id=photo.pdv_id,
+            date_visite=photo.mission.date_mission,
+            defaults=_defaults(photo),
+        )
+        _apply(summary, photo, photo_entry(photo))
+        summary.save()
+        record_facets(photo.client_id, [('wilaya', photo.wilaya), ('region', photo.region)])
+
+
+def record_photo_url(photo):
+    """Ajoute la vignette d'une photo dont l'upload vient de se terminer."""
+    entry = photo_entry(photo)
+    if not entry or not photo.pdv_id:
+        return
+
+    with transaction.atomic():
+        summary = VisitSummary.objects.select_for_update().filter(
+            client_id=photo.client_id,
+            pdv_id=photo.pdv_id,
+            date_visite=photo.mission.date_mission,
+        ).first()
+        if summary is None:
+            return
+        cat = summary.categories.get(photo.categorie)
+        if cat is None or len(cat[photo.type_photo]) >= MAX_THUMBS:
+            return
+        cat[photo.type_photo].append(entry)
+        summary.save(update_fields=['categories'])
+
+
+def record_facets(client_id, pairs):
+    facets = [
+        DashboardFacet(client_id=client_id, kind=kind, value=value)
+        for kind, value in pairs if value
+    ]
+    DashboardFacet.objects.bulk_create(facets, ignore_conflicts=True)
+
+
+def _photos():
+    return PhotoMission.objects.filter(pdv__isnull=False).select_related('pdv', 'mission__merchandiser')
+
+
+def _summaries(photos):
+    """Résumés (non enregistrés) des photos, triées par (PDV, date de mission, id)."""
+    summary = None
+    for photo in photos:
+        key = (photo.client_id, photo.pdv_id, photo.mission.date_mission)
+        if summary is None or (summary.client_id, summary.pdv_id, summary.date_visite) != key:
+            if summary is not None:
+                yield summary
+            summary = VisitSummary(
+                client_id=photo.client_id,
+                pdv_id=photo.pdv_id,
+                date_visite=photo.mission.date_mission,
+                categories={},
+                **_defaults(photo),
+            )
+        _apply(summary, photo, photo_entry(photo))
+    if summary is not None:
+        yield summary
+
+
+def refresh_visit(client_id, pdv_id, date_visite):
+    """Recalcule un résumé depuis ses photos ; le supprime s'il n'en reste aucune."""
+    photos = _photos().filter(client_id=client_id, pdv_id=pdv_id, mission__date_mission=date_visite).order_by('id')
+    with transaction.atomic():
+        VisitSummary.objects.filter(client_id=client_id, pdv_id=pdv_id, date_visite=date_visite).delete()
+        for summary in _summaries(photos):
+            summary.save()
+
+
+def _pending_state(using):
+    if not hasattr(_pending, 'state'):
+        _pending.state = defaultdict(lambda: {'visits': set(), 'dates': {}})
+    return _pending.state[using]
+
+
+def remember(photo):
+    """Le résumé actuel de la photo devient celui à recalculer si elle change (cf. models.py)."""
+    if not set(SLICE_FIELDS) & photo.get_deferred_fields():
+        photo._loaded_slice = tuple(getattr(photo, name) for name in SLICE_FIELDS)
+
+
+def _schedule(photo_slice, using):
+    client_id, pdv_id, mission_id = photo_slice[:3]
+    if pdv_id is None or mission_id is None:
+        return
+    state = _pending_state(using)
+    # Date lue tout de suite : la mission peut être supprimée avant le commit
+    if mission_id not in state['dates']:
+        state['dates'][mission_id] = (
+            Mission.objects.using(using).filter(id=mission_id).values_list('date_mission', flat=True).first()
+        )
+    date_visite = state['dates'][mission_id]
+    if date_visite is not None:
+        state['visits'].add((client_id, pdv_id, date_visite))
+        transaction.on_commit(lambda: flush_pending(using), using=using)
+
+
+def photo_changed(photo, created=False, deleted=False, using=DEFAULT_DB_ALIAS):
+    """
+    Photo enregistrée ou supprimée (cf. signals.py) : recalcule après commit
+    le résumé quitté et le résumé rejoint. Une création est déjà comptée
+    par record_photo.
+    """
+    loaded = getattr(photo, '_loaded_slice', None)
+    current = tuple(getattr(photo, name) for name in SLICE_FIELDS)
+    if deleted:
+        _schedule(loaded or current, using)
+    elif not created and loaded is not None and loaded != current:
+        _schedule(loaded, using)
+        _schedule(current, using)
+    remember(photo)
+
+
+def flush_pending(using=DEFAULT_DB_ALIAS):
+    """Recalcule les résumés en attente ; sans effet si un rappel précédent l'a déjà fait."""
+    state = _pending_state(using)
+    state['dates'].clear()
+    visits = state['visits']
+    while visits:
+        refresh_visit(*visits.pop())
+
+
+def rebuild_summaries(client=None, chunk_size=2000):
+    """
+    Reconstruit les résumés (et facettes) depuis PhotoMission, un client à
+    la fois (une transaction par client). Les photos sont lues triées par
+    PDV et par date : un résumé est écrit dès qu'il est complet, la mémoire
+    ne dépend pas du volume. Utilisé pour le rattrapage initial et après
+    une correction de données. Retourne le nombre de résumés écrits.
+    """
+    if client is not None:
+        client_ids = [client.id]
+    else:
+        client_ids = (
+            set(PhotoMission.objects.order_by().values_list('client_id', flat=True).distinct())
+            | set(VisitSummary.objects.order_by().values_list('client_id', flat=True).distinct())
+            | set(DashboardFacet.objects.order_by().values_list('client_id', flat=True).distinct())
+        )
+    return sum(_rebuild_client(client_id, chunk_size) for client_id in client_ids)
+
+
+def _rebuild_client(client_id, chunk_size):
+    photos = _photos().filter(client_id=client_id).order_by('pdv_id', 'mission__date_mission', 'id')
+    written = 0
+    facets = set()
+    with transaction.atomic():
+        VisitSummary.objects.filter(client_id=client_id).delete()
+        DashboardFacet.objects.filter(client_id=client_id).delete()
+        batch = []
+        for summary in _summaries(photos.iterator(chunk_size=chunk_size)):
+            batch.append(summary)
+            facets.update((('wilaya', summary.wilaya), ('region', summary.region)))
+            if len(batch) >= chunk_size:
+                VisitSummary.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        VisitSummary.objects.bulk_create(batch)
+        written += len(batch)
+        DashboardFacet.objects.bulk_create(
+            [DashboardFacet(client_id=client_id, kind=k, value=v) for k, v in facets if v],
+            ignore_conflicts=True,
+        )
+    return written
+
+
+def facet_values(client, kind):
+    return list(
+        DashboardFacet.objects.filter(client=client, kind=kind)
+        .order_by('value')
+        .values_list('value', flat=True)
+    )
+
+
+def dashboard_page(client, wilaya=None, region=None, pdv_search=None, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Une page de résumés, triée par (-date_visite, -id), paginée par clé.
+    Retourne une CursorPage ; lève InvalidCursor si le curseur est corrompu.
+    """
+    qs = VisitSummary.objects.filter(client=client)
+    if wilaya:
+        qs = qs.filter(wilaya=wilaya)
+    if region:
+        qs = qs.filter(region=region)
+    if pdv_search:
+        qs = qs.filter(pdv_label__icontains=pdv_search)
+
+    paginator = CursorPaginator(
+        qs, ordering=('-date_visite', '-id'),
+        default_page_size=DEFAULT_PAGE_SIZE, max_page_size=MAX_PAGE_SIZE,
+    )
+    return paginator.page(cursor, page_size)
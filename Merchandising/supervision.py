@@ -0,0 +1,235 @@
+"""
+Tableau de bord superviseur : missions du jour de sa région, en direct.
+
+- snapshot : comptes par état (et par wilaya), départs en retard et
+  anomalies GPS, en une seule requête groupée sur les missions du jour de
+  la région ; plus la liste (bornée) des missions à signaler ;
+- chaque enregistrement d'une mission (début, fin, échec, synchronisation,
+  cf. signals.py) incrémente, après commit, un numéro de version par
+  (jour, région) gardé dans le cache ;
+- sous ASGI (async_views.supervision_state), les pages ouvertes attendent
+  un changement de version (long-poll) : ce n'est pas une notification,
+  l'attente relit la version dans le cache toutes les POLL_INTERVAL
+  secondes (une lecture par page en attente, pendant au plus
+  LONG_POLL_TIMEOUT secondes), mais elle ne bloque pas de thread et ne
+  fait aucune requête SQL. Sous WSGI (views.supervision_state), la vue
+  répond tout de suite et la page rappelle après POLL_AFTER secondes :
+  une attente y immobiliserait un thread du serveur par page ouverte.
+  Un snapshot est calculé au plus une fois par version puis partagé par
+  tous les superviseurs de la région.
+
+Sans cache partagé (settings.SUPERVISION_CACHE_ALIAS), les changements
+faits par un autre processus ne sont pas vus : le snapshot est alors
+rafraîchi au plus tard après SNAPSHOT_TTL secondes. Les
+QuerySet.update() / bulk_create() ne passent pas par les signaux :
+appeler publish() après.
+"""
+import asyncio
+import time
+from datetime import datetime, time as dt_time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_time
+
+from .models import Mission, PointDeVente
+
+ETATS = [etat for etat, _ in Mission.ETAT_CHOICES]
+DEFAULT_START_DEADLINE = dt_time(10, 0)
+# Champs dont le changement modifie le tableau de bord
+TRACKED_FIELDS = {
+    'etat', 'begin_time', 'end_time', 'begin_in_geofence', 'end_in_geofence',
+    'begin_distance_m', 'end_distance_m', 'date_mission', 'pdv',
+}
+ISSUES_LIMIT = 50
+LONG_POLL_TIMEOUT = 25
+POLL_INTERVAL = 1.0
+# Délai de rappel conseillé à la page quand la vue ne fait pas de long-poll (WSGI)
+POLL_AFTER = 5
+SNAPSHOT_TTL = 60
+VERSION_TTL = 2 * 24 * 3600
+KEY_PREFIX = 'supervision'
+
+# Début enregistré hors du rayon du PDV, fin hors du rayon, ou début sans position
+GPS_ANOMALY = (
+    Q(begin_in_geofence=False)
+    | Q(end_in_geofence=False)
+    | Q(begin_time__isnull=False, begin_distance_m__isnull=True)
+)
+
+def _cache():
+    return caches[getattr(settings, 'SUPERVISION_CACHE_ALIAS', 'default')]
+
+
+def _version_key(region, day):
+    return f"{KEY_PREFIX}:v:{day.isoformat()}:{quote(region)}"
+
+
+def start_deadline():
+    value = getattr(settings, 'MISSION_START_DEADLINE', None)
+    return parse_time(value) if isinstance(value, str) else (value or DEFAULT_START_DEADLINE)
+
+
+def deadline_for(day):
+    return timezone.make_aware(datetime.combine(day, start_deadline()))
+
+
+def version(region, day):
+    return _cache().get(_version_key(region, day), 0)
+
+
+def publish(region, day):
+    """Signale un changement sur les missions `day` de `region`."""
+    cache = _cache()
+    key = _version_key(region, day)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Valeur initiale non nulle : un cache vidé ne ressert pas un ancien snapshot
+        if not cache.add(key, time.time_ns(), VERSION_TTL):
+            cache.incr(key)
+
+
+def mission_changed(mission):
+    """Publie, après commit, le changement d'une mission (cf. signals.py)."""
+    if Mission.pdv.is_cached(mission):
+        region = mission.pdv.region
+    else:
+        region = None
+    day = mission.date_mission
+    pdv_id = mission.pdv_id
+
+    def send():
+        found = region
+        if found is None:
+            found = PointDeVente.objects.filter(id=pdv_id).values_list('region', flat=True).first()
+        if found:
+            publish(found, day)
+    transaction.on_commit(send)
+
+
+def region_for(user, requested=None):
+    """Région suivie par `user` : la sienne pour un superviseur, au choix pour le staff."""
+    if getattr(user, 'role', None) == 'superviseur':
+        return user.region or None
+    if user.is_staff:
+        return requested or None
+    return None
+
+
+def missions_for(region, day):
+    return Mission.objects.filter(date_mission=day, pdv__region=region)
+
+
+def late_filter(day, now):
+    """Démarrée après l'heure limite, ou pas encore démarrée une fois l'heure passée."""
+    deadline = deadline_for(day)
+    condition = Q(begin_time__gt=deadline)
+    if now > deadline:
+        condition |= Q(etat='planned', begin_time__isnull=True)
+    return condition
+
+
+def compute(region, day, now=None):
+    now = now or timezone.now()
+    late = late_filter(day, now)
+    missions = missions_for(region, day)
+
+    rows = (
+        missions.order_by()
+        .values('pdv__wilaya', 'etat')
+        .annotate(
+            total=Count('id'),
+            late=Count('id', filter=late),
+            gps=Count('id', filter=GPS_ANOMALY),
+        )
+    )
+
+    def empty():
+        return {**{etat: 0 for etat in ETATS}, 'total': 0, 'late': 0, 'gps_anomalies': 0}
+
+    totals, wilayas = empty(), {}
+    for row in rows:
+        for target in (totals, wilayas.setdefault(row['pdv__wilaya'], empty())):
+            target[row['etat']] = target.get(row['etat'], 0) + row['total']
+            target['total'] += row['total']
+            target['late'] += row['late']
+            target['gps_anomalies'] += row['gps']
+
+    deadline = deadline_for(day)
+    issues = []
+    for m in (
+        missions.filter(late | GPS_ANOMALY)
+        .order_by('pdv__wilaya', 'id')
+        .values(
+            'id', 'code', 'etat', 'begin_time', 'end_time', 'begin_distance_m', 'end_distance_m',
+            'begin_in_geofence', 'end_in_geofence', 'pdv__no_pdv', 'pdv__wilaya', 'pdv__commune',
+            'merchandiser__first_name', 'merchandiser__last_name',
+        )[:ISSUES_LIMIT]
+    ):
+        begin = m['begin_time']
+        issues.append({
+            'mission_id': m['id'],
+            'code': m['code'],
+            'etat': m['etat'],
+            'pdv': m['pdv__no_pdv'],
+            'wilaya': m['pdv__wilaya'],
+            'commune': m['pdv__commune'],
+            'merch': f"{m['merchandiser__first_name']} {m['merchandiser__last_name']}".strip(),
+            'begin_time': begin.isoformat() if begin else None,
+            'late': (begin is not None and begin > deadline) or (begin is None and m['etat'] == 'planned' and now > deadline),
+            'gps_anomaly': (
+                m['begin_in_geofence'] is False or m['end_in_geofence'] is False
+                or (begin is not None and m['begin_distance_m'] is None)
+            ),
+            'begin_distance_m': m['begin_distance_m'],
+            'end_distance_m': m['end_distance_m'],
+        })
+
+    return {
+        'date': day.isoformat(),
+        'region': region,
+        'deadline': start_deadline().strftime('%H:%M'),
+        'generated_at': now.isoformat(timespec='seconds'),
+        'totals': totals,
+        'wilayas': [{'wilaya': name, **counts} for name, counts in sorted(wilayas.items())],
+        'issues': issues,
+    }
+
+
+def _snapshot_key(region, day, current, late_open):
+    return f"{KEY_PREFIX}:s:{day.isoformat()}:{quote(region)}:{current}:{int(late_open)}"
+
+
+def snapshot(region, day=None):
+    """Snapshot de la version courante, calculé une fois par version (et par SNAPSHOT_TTL)."""
+    day = day or timezone.localdate()
+    now = timezone.now()
+    current = version(region, day)
+    # Le passage de l'heure limite change les retards sans enregistrement de mission
+    key = _snapshot_key(region, day, current, now > deadline_for(day))
+    cache = _cache()
+    data = cache.get(key)
+    if data is None:
+        data = compute(region, day, now)
+        cache.set(key, data, SNAPSHOT_TTL)
+    return {**data, 'version': current}
+
+
+async def await_change(region, day, since, timeout=LONG_POLL_TIMEOUT):
+    """
+    Relit la version toutes les POLL_INTERVAL s jusqu'à ce qu'elle diffère
+    de `since` (au plus `timeout` s) ; retourne la version.
+    """
+    key = _version_key(region, day)
+    limit = time.monotonic() + timeout
+    while True:
+        current = await _cache().aget(key, 0)
+        remaining = limit - time.monotonic()
+        if current != since or remaining <= 0:
+            return current
+        await asyncio.sleep(min(POLL_INTERVAL, remaining))
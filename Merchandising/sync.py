@@ -0,0 +1,329 @@
+"""
+Synchronisation hors-ligne de l'application merchandiser.
+
+- apply_visit_batch : applique en une transaction le lot complet d'une
+  visite (début, relevés produits, photos, fin), idempotent sur batch_id ;
+- delta_for : missions du jour + changements de catalogue depuis un jeton.
+  Le jeton porte l'instant et les clients servis : un client apparu depuis
+  reçoit son catalogue complet, un client disparu est signalé, et les
+  produits supprimés sont renvoyés par leurs tombes (CatalogTombstone,
+  gardées SYNC_TOMBSTONE_DAYS jours ; un jeton plus ancien redemande tout).
+  Le téléphone applique les suppressions avant les ajouts / modifications.
+
+Format d'un lot (JSON, éventuellement gzip via Content-Encoding) :
+
+    {
+      "batch_id": "<uuid généré par le téléphone>",
+      "start":  {"time": "<iso>", "latitude": .., "longitude": ..},
+      "client_products": [{"produit_id": .., "disponible": .., ...}],
+      "concurrent_products": [{"produit_id": .., ...}],
+      "photos": [<photo_id renvoyé par upload_photo>, ...],
+      "finish": {"time": "<iso>", "latitude": .., "longitude": ..,
+                 "etat": "done" | "failed", "raison_echec": ".."}
+    }
+"""
+import base64
+import gzip
+import io
+import json
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import localdate
+
+from .ingestion import ingest_client_products, ingest_concurrent_products
+from .models import CatalogTombstone, Mission, PhotoMission, ProduitClient, ProduitConcurrent, SyncBatch
+
+# Taille maximale d'un lot une fois décompressé
+MAX_BATCH_BYTES = 5 * 1024 * 1024
+DEFAULT_TOMBSTONE_DAYS = 30
+
+
+class InvalidBatch(ValueError):
+    pass
+
+
+def decode_body(request):
+    """Corps JSON de la requête, décompressé si Content-Encoding: gzip."""
+    body = request.body
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        try:
+            with gzip.GzipFile(fileobj=io.BytesIO(body)) as stream:
+                body = stream.read(MAX_BATCH_BYTES + 1)
+        except (OSError, EOFError):
+            raise InvalidBatch("gzip invalide")
+    if len(body) > MAX_BATCH_BYTES:
+        raise InvalidBatch("lot trop volumineux")
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise InvalidBatch("invalid json")
+    if not isinstance(payload, dict):
+        raise InvalidBatch("invalid json")
+    return payload
+
+
+def _event_time(event):
+    value = event.get('time')
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        return timezone.now()
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _coords(event, prefix):
+    lat, lon = event.get('latitude'), event.get('longitude')
+    if lat in (None, '') or lon in (None, ''):
+        return {}
+    try:
+        lat = Decimal(str(lat)).quantize(Decimal('0.000001'))
+        lon = Decimal(str(lon)).quantize(Decimal('0.000001'))
+    except InvalidOperation:
+        raise InvalidBatch("coordonnées invalides")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise InvalidBatch("coordonnées invalides")
+    return {f'{prefix}_latitude': lat, f'{prefix}_longitude': lon}
+
+
+def _apply_start(mission, start):
+    if not isinstance(start, dict):
+        return []
+    fields = ['etat']
+    if mission.begin_time is None:
+        mission.begin_time = _event_time(start)
+        fields.append('begin_time')
+        for name, value in _coords(start, 'begin').items():
+            setattr(mission, name, value)
+            fields.append(name)
+    if mission.etat == 'planned':
+        mission.etat = 'in_progress'
+    return fields
+
+
+def _apply_finish(mission, finish):
+    if not isinstance(finish, dict):
+        return []
+    etat = finish.get('etat', 'done')
+    if etat not in ('done', 'failed'):
+        raise InvalidBatch("etat de fin invalide")
+    mission.etat = etat
+    mission.end_time = _event_time(finish)
+    fields = ['etat', 'end_time']
+    for name, value in _coords(finish, 'end').items():
+        setattr(mission, name, value)
+        fields.append(name)
+    if etat == 'failed':
+        raison = finish.get('raison_echec') or 'other'
+        if raison not in dict(Mission.REASON_CHOICES):
+            raison = 'other'
+        mission.raison_echec = raison
+        fields.append('raison_echec')
+    return fields
+
+
+def _check_photos(mission, refs):
+    """Vérifie que les photos annoncées (déjà envoyées via upload_photo) appartiennent à la mission."""
+    if not isinstance(refs, list):
+        return {'received': [], 'missing': []}
+    ids = set()
+    for ref in refs:
+        try:
+            ids.add(int(ref))
+        except (TypeError, ValueError):
+            continue
+    found = set(PhotoMission.objects.filter(mission=mission, id__in=ids).values_list('id', flat=True))
+    return {'received': sorted(found), 'missing': sorted(ids - found)}
+
+
+def apply_visit_batch(mission, user, payload):
+    """
+    Applique un lot de visite. Retourne (réponse, rejoué) où `rejoué`
+    vaut True si le lot avait déjà été appliqué.
+    """
+    try:
+        batch_id = uuid.UUID(str(payload.get('batch_id')))
+    except ValueError:
+        raise InvalidBatch("batch_id manquant ou invalide")
+
+    previous = SyncBatch.objects.filter(batch_id=batch_id).first()
+    if previous is not None:
+        if previous.mission_id != mission.id:
+            raise InvalidBatch("batch_id déjà utilisé pour une autre mission")
+        return previous.response, True
+
+    client_items = payload.get('client_products') or []
+    concurrent_items = payload.get('concurrent_products') or []
+    if not isinstance(client_items, list) or not isinstance(concurrent_items, list):
+        raise InvalidBatch("invalid items")
+
+    try:
+        with transaction.atomic():
+            mission = Mission.objects.select_for_update().select_related('pdv').get(id=mission.id)
+            fields = set(_apply_start(mission, payload.get('start')))
+
+            response = {
+                'success': True,
+                'batch_id': str(batch_id),
+                'client_products': ingest_client_products(mission, user, client_items),
+                'concurrent_products': ingest_concurrent_products(mission, user, concurrent_items),
+                'photos': _check_photos(mission, payload.get('photos')),
+            }
+
+            fields.update(_apply_finish(mission, payload.get('finish')))
+            if fields:
+                mission.save(update_fields=sorted(fields))
+            response['etat'] = mission.etat
+            response['geofence'] = {
+                'begin_in_geofence': mission.begin_in_geofence,
+                'end_in_geofence': mission.end_in_geofence,
+            }
+
+            SyncBatch.objects.create(batch_id=batch_id, mission=mission, merch=user, response=response)
+    except IntegrityError:
+        # Même lot reçu en parallèle : l'autre requête l'a enregistré
+        previous = SyncBatch.objects.filter(batch_id=batch_id).first()
+        if previous is None:
+            raise
+        return previous.response, True
+
+    return response, False
+
+
+# ---------------------------------------------------------------------------
+# Delta descendant
+# ---------------------------------------------------------------------------
+
+def tombstone_retention():
+    return timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_DAYS', DEFAULT_TOMBSTONE_DAYS))
+
+
+def bury_product(kind, produit_id, client_id):
+    """Tombe d'un produit supprimé (cf. signals.py)."""
+    CatalogTombstone.objects.create(kind=kind, produit_id=produit_id, client_id=client_id)
+
+
+def purge_tombstones(older_than=None):
+    """Supprime les tombes que plus aucun jeton valide ne peut demander."""
+    limit = timezone.now() - (older_than or tombstone_retention())
+    return CatalogTombstone.objects.filter(deleted_at__lt=limit).delete()[0]
+
+
+def encode_version(moment, client_ids=()):
+    raw = f"{moment.isoformat()}|{','.join(str(c) for c in sorted(client_ids))}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_version(token):
+    """
+    (instant, clients servis) ; clients à None pour un jeton sans liste
+    (ancien format), (None, None) pour un jeton illisible.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        moment, sep, clients = raw.partition('|')
+        client_ids = {int(c) for c in clients.split(',') if c} if sep else None
+        return datetime.fromisoformat(moment), client_ids
+    except (ValueError, UnicodeDecodeError):
+        return None, None
+
+
+def _mission_payload(m):
+    pdv = m.pdv
+    return {
+        'id': m.id,
+        'code': m.code,
+        'date': m.date_mission.isoformat(),
+        'etat': m.etat,
+        'client_id': m.client_id,
+        'pdv': {
+            'id': pdv.id,
+            'code': pdv.code,
+            'no_pdv': pdv.no_pdv,
+            'wilaya': pdv.wilaya,
+            'region': pdv.region,
+            'commune': pdv.commune,
+            'latitude': str(pdv.latitude),
+            'longitude': str(pdv.longitude),
+        },
+    }
+
+
+def _product_payload(p):
+    return {
+        'id': p.id,
+        'nom': p.nom,
+        'categorie': p.categorie,
+        'format': p.format,
+        'image': p.image.url if p.image else None,
+    }
+
+
+def delta_for(user, since=None):
+    """
+    Missions du jour du merchandiser et produits modifiés ou supprimés
+    depuis `since` (jeton renvoyé par l'appel précédent ; absent, illisible
+    ou expiré = catalogue complet).
+    """
+    now = timezone.now()
+    since_dt, known_clients = decode_version(since) if since else (None, None)
+    if since_dt is not None and (timezone.is_naive(since_dt) or since_dt < now - tombstone_retention()):
+        since_dt = None
+
+    missions = list(
+        Mission.objects.filter(merchandiser=user, date_mission=localdate())
+        .select_related('pdv')
+        .order_by('id')
+    )
+    client_ids = {m.client_id for m in missions if m.client_id}
+    if user.client_id:
+        client_ids.add(user.client_id)
+
+    # Catalogue complet pour les clients que le jeton ne connaît pas
+    if since_dt is None or known_clients is None:
+        full_clients, followed = client_ids, set()
+    else:
+        full_clients, followed = client_ids - known_clients, client_ids & known_clients
+
+    changed = Q(updated_at__gt=since_dt, updated_at__lte=now) if followed else Q(pk__in=[])
+    produits = ProduitClient.objects.filter(
+        Q(client_id__in=full_clients) | Q(changed, client_id__in=followed)
+    )
+    concurrents = ProduitConcurrent.objects.filter(
+        Q(concurrent__client_id__in=full_clients) | Q(changed, concurrent__client_id__in=followed)
+    )
+    client_products = [
+        {**_product_payload(p), 'client_id': p.client_id}
+        for p in produits.order_by('id')
+    ]
+    concurrent_products = [
+        {**_product_payload(p), 'concurrent_id': p.concurrent_id, 'concurrent': p.concurrent.nom}
+        for p in concurrents.select_related('concurrent').order_by('id')
+    ]
+
+    deleted = {'client': set(), 'concurrent': set()}
+    if followed:
+        for kind, produit_id in CatalogTombstone.objects.filter(
+            client_id__in=followed, deleted_at__gt=since_dt, deleted_at__lte=now,
+        ).values_list('kind', 'produit_id'):
+            deleted[kind].add(produit_id)
+
+    return {
+        'version': encode_version(now, client_ids),
+        'full': since_dt is None,
+        'full_clients': sorted(full_clients),
+        'removed_clients': sorted(known_clients - client_ids) if since_dt is not None and known_clients else [],
+        'missions': [_mission_payload(m) for m in missions],
+        'client_products': client_products,
+        'concurrent_products': concurrent_products,
+        'deleted_client_products': sorted(deleted['client']),
+        'deleted_concurrent_products': sorted(deleted['concurrent']),
+    }
@@ -0,0 +1,372 @@
+"""
+Jeu de données synthétique pour les mesures de performance.
+
+Génère clients, utilisateurs, PDV, catalogues, missions, relevés et
+photos (URLs factices) par paquets de CHUNK_SIZE, puis reconstruit les
+tables dérivées (résumés de visite, agrégats journaliers). Missions et
+PDV passent par codes.bulk_create ; relevés et photos, qui font
+l'essentiel du volume, sont écrits par INSERT multi-lignes avec wilaya /
+région déjà renseignées. Tout est reconnaissable : no_pdv « SYN-… », clients
+« SYN … », emails en @synthetic.invalid ; `flush` supprime l'ensemble.
+
+Chaque merchandiser a une zone (une wilaya) et visite des PDV de sa
+zone ; les missions couvrent les `days` derniers jours, aujourd'hui
+compris. Les tirages sont faits avec NumPy (graine fixe) : deux
+générations avec les mêmes paramètres donnent les mêmes données.
+"""
+from dataclasses import asdict, dataclass
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.timezone import localdate
+
+from . import codes, geo, rollups, summaries
+from .imports import WILAYAS
+from .models import (
+    Client,
+    Concurrent,
+    CustomUser,
+    Mission,
+    PhotoMission,
+    PointDeVente,
+    ProduitClient,
+    ProduitConcurrent,
+    RealisationClientData,
+    RealisationConcurrenceData,
+)
+
+CHUNK_SIZE = 5000
+EMAIL_DOMAIN = 'synthetic.invalid'
+PDV_PREFIX = 'SYN-'
+CLIENT_PREFIX = 'SYN '
+REGIONS = ('Centre', 'Est', 'Ouest', 'Sud')
+CATEGORIES = ('Boissons', 'Laitiers', 'Épicerie', 'Hygiène', 'Entretien')
+FORMATS = ('25cl', '33cl', '1L', '1.5L', '500g', '1kg')
+
+
+@dataclass
+class Scale:
+    clients: int
+    pdvs: int
+    merchandisers: int
+    missions: int
+    days: int
+    produits_per_client: int = 40
+    concurrents_per_client: int = 3
+    produits_per_concurrent: int = 15
+    releves_per_mission: int = 10
+    releves_concurrence_per_mission: int = 4
+    photos_per_mission: int = 2
+
+
+SCALES = {
+    'small': Scale(clients=2, pdvs=2_000, merchandisers=30, missions=20_000, days=60),
+    'medium': Scale(clients=3, pdvs=15_000, merchandisers=100, missions=200_000, days=90),
+    # ~2M missions, ~20M relevés client
+    'full': Scale(clients=5, pdvs=60_000, merchandisers=300, missions=2_000_000, days=365),
+}
+
+
+def _date(value):
+    return connection.ops.adapt_datefield_value(value)
+
+
+def _datetime(value):
+    return connection.ops.adapt_datetimefield_value(value)
+
+
+def _insert(model, fields, rows):
+    """
+    INSERT multi-lignes sans passer par les instances du modèle : les
+    valeurs sont déjà prêtes pour la base (colonnes dénormalisées
+    comprises). Réservé aux gros volumes générés ici.
+    """
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    opts = model._meta
+    columns = ', '.join(qn(opts.get_field(name).column) for name in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    sql = f"INSERT INTO {qn(opts.db_table)} ({columns}) VALUES ({placeholders})"
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), CHUNK_SIZE):
+            cursor.executemany(sql, rows[start:start + CHUNK_SIZE])
+
+
+def _chunks(total, size=CHUNK_SIZE):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def exists():
+    return PointDeVente.objects.filter(no_pdv__startswith=PDV_PREFIX).exists() or \
+        CustomUser.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').exists()
+
+
+def flush():
+    """Supprime les données synthétiques (les suppressions en cascade emportent missions, relevés, photos)."""
+    with transaction.atomic():
+        PointDeVente.objects.filter(no_pdv__startswith=PDV_PREFIX).delete()
+        CustomUser.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+        Client.objects.filter(raison_sociale__startswith=CLIENT_PREFIX).delete()
+    geo.invalidate()
+
+
+class Generator:
+    def __init__(self, scale, seed=0, derived=True, log=None):
+        self.scale = scale
+        self.derived = derived
+        self.rng = np.random.default_rng(seed)
+        self.log = log or (lambda message: None)
+        self.today = localdate()
+
+    def run(self):
+        s = self.scale
+        self.clients = self._clients()
+        self.catalog = self._catalog()
+        self.merchs, self.client_users = self._users()
+        self.pdv_ids, self.pdv_zone = self._pdvs()
+        self._missions()
+        if self.derived:
+            self._derived()
+        return {'scale': asdict(s), 'clients': len(self.clients), 'pdvs': len(self.pdv_ids)}
+
+    def _clients(self):
+        clients = [
+            Client(raison_sociale=f"{CLIENT_PREFIX}Client {i + 1}", ai=f"AI{i}", rc=f"RC{i}", nif=f"NIF{i}", nis=f"NIS{i}")
+            for i in range(self.scale.clients)
+        ]
+        Client.objects.bulk_create(clients)
+        self.log(f"{len(clients)} client(s)")
+        return clients
+
+    def _catalog(self):
+        s = self.scale
+        produits = [
+            ProduitClient(
+                client=client,
+                nom=f"Produit {client.id}-{j + 1}",
+                categorie=CATEGORIES[j % len(CATEGORIES)],
+                format=FORMATS[j % len(FORMATS)],
+            )
+            for client in self.clients for j in range(s.produits_per_client)
+        ]
+        ProduitClient.objects.bulk_create(produits, batch_size=CHUNK_SIZE)
+        concurrents = [
+            Concurrent(client=client, nom=f"Concurrent {client.id}-{k + 1}")
+            for client in self.clients for k in range(s.concurrents_per_client)
+        ]
+        Concurrent.objects.bulk_create(concurrents)
+        produits_c = [
+            ProduitConcurrent(
+                concurrent=c,
+                nom=f"Produit {c.id}-{j + 1}",
+                categorie=CATEGORIES[j % len(CATEGORIES)],
+                format=FORMATS[j % len(FORMATS)],
+            )
+            for c in concurrents for j in range(s.produits_per_concurrent)
+        ]
+        ProduitConcurrent.objects.bulk_create(produits_c, batch_size=CHUNK_SIZE)
+        self.log(f"{len(produits)} produit(s) client, {len(produits_c)} produit(s) concurrent")
+        return {
+            client.id: (
+                np.array([p.id for p in produits if p.client_id == client.id]),
+                np.array([p.id for p in produits_c if p.concurrent.client_id == client.id]),
+            )
+            for client in self.clients
+        }
+
+    def _users(self):
+        s = self.scale
+        merchs = [
+            CustomUser(
+                email=f"merch{i + 1}@{EMAIL_DOMAIN}",
+                first_name="Merch", last_name=str(i + 1),
+                region=REGIONS[i % len(REGIONS)], wilaya=WILAYAS[i % len(WILAYAS)],
+                phone_number='', role='merchandiser',
+                client=self.clients[i % len(self.clients)],
+                password='!',  # mot de passe inutilisable
+            )
+            for i in range(s.merchandisers)
+        ]
+        client_users = [
+            CustomUser(
+                email=f"client{client.id}@{EMAIL_DOMAIN}",
+                first_name="Client", last_name=str(client.id),
+                region='', wilaya='', phone_number='', role='client', client=client, password='!',
+            )
+            for client in self.clients
+        ]
+        CustomUser.objects.bulk_create(merchs + client_users)
+        self.log(f"{len(merchs)} merchandiser(s), {len(client_users)} utilisateur(s) client")
+        return merchs, client_users
+
+    def _pdvs(self):
+        s = self.scale
+        rng = self.rng
+        zone = rng.integers(0, len(WILAYAS), s.pdvs)
+        # Centre de zone au hasard sur le nord du pays, PDV dispersés autour
+        centres = np.column_stack([rng.uniform(34.5, 36.9, len(WILAYAS)), rng.uniform(-1.5, 8.0, len(WILAYAS))])
+        coords = centres[zone] + rng.normal(0, 0.15, (s.pdvs, 2))
+        types = [value for value, _ in PointDeVente.TYPE_PDV_CHOICES]
+        ids = []
+        self.pdv_geo = {}
+        for start, size in _chunks(s.pdvs):
+            pdvs = [
+                PointDeVente(
+                    no_pdv=f"{PDV_PREFIX}{i + 1:07d}",
+                    region=REGIONS[zone[i] % len(REGIONS)],
+                    wilaya=WILAYAS[zone[i]],
+                    commune=f"Commune {zone[i]}-{i % 25}",
+                    type_pdv=types[i % len(types)],
+                    latitude=Decimal(f"{coords[i, 0]:.6f}"),
+                    longitude=Decimal(f"{coords[i, 1]:.6f}"),
+                )
+                for i in range(start, start + size)
+            ]
+            codes.bulk_create(PointDeVente, pdvs, 'pdv', batch_size=CHUNK_SIZE)
+            ids.extend(p.id for p in pdvs)
+            self.pdv_geo.update((p.id, (p.wilaya, p.region)) for p in pdvs)
+        geo.invalidate()
+        self.log(f"{s.pdvs} PDV")
+        return np.array(ids), zone
+
+    def _missions(self):
+        s = self.scale
+        rng = self.rng
+        merch_ids = np.array([m.id for m in self.merchs])
+        merch_client = np.array([m.client_id for m in self.merchs])
+        # PDV de la zone de chaque merchandiser (à défaut : tous les PDV)
+        by_zone = {z: self.pdv_ids[self.pdv_zone == z] for z in np.unique(self.pdv_zone)}
+        merch_zone = np.arange(len(self.merchs)) % len(WILAYAS)
+        pools = [by_zone.get(z, self.pdv_ids) for z in merch_zone]
+
+        created = releves = releves_c = photos = 0
+        for _, size in _chunks(s.missions):
+            who = rng.integers(0, len(merch_ids), size)
+            days_ago = rng.integers(0, s.days, size)
+            picks = rng.random(size)
+            outcome = rng.random(size)
+            missions = []
+            for k in range(size):
+                pool = pools[who[k]]
+                day = self.today - timedelta(days=int(days_ago[k]))
+                etat = 'planned' if day == self.today else ('done' if outcome[k] < 0.95 else 'failed')
+                missions.append(Mission(
+                    pdv_id=int(pool[int(picks[k] * len(pool))]),
+                    date_mission=day,
+                    merchandiser_id=int(merch_ids[who[k]]),
+                    client_id=int(merch_client[who[k]]),
+                    etat=etat,
+                    raison_echec='pdv_closed' if etat == 'failed' else None,
+                ))
+            with transaction.atomic():
+                codes.bulk_create(Mission, missions, 'mission', batch_size=CHUNK_SIZE)
+                done = [m for m in missions if m.etat == 'done']
+                releves += self._releves(done)
+                releves_c += self._releves_concurrence(done)
+                photos += self._photos(done)
+            created += size
+            self.log(f"{created}/{s.missions} missions")
+        self.log(f"{releves} relevé(s) client, {releves_c} relevé(s) concurrence, {photos} photo(s)")
+
+    def _by_client(self, missions, catalog_index, per_mission):
+        """
+        (mission, ids produits tirés) par client : tirage sans remise
+        vectorisé (argsort d'une matrice aléatoire) sur le catalogue du client.
+        """
+        groups = {}
+        for m in missions:
+            groups.setdefault(m.client_id, []).append(m)
+        for client_id, group in groups.items():
+            produits = self.catalog[client_id][catalog_index]
+            count = min(per_mission, len(produits))
+            if not count:
+                continue
+            picked = produits[np.argsort(self.rng.random((len(group), len(produits))), axis=1)[:, :count]]
+            yield group, picked.tolist()
+
+    def _releves(self, missions):
+        rows = []
+        for group, picked in self._by_client(missions, 0, self.scale.releves_per_mission):
+            shape = (len(group), len(picked[0]))
+            dispo = (self.rng.random(shape) < 0.85).tolist()
+            handling = (self.rng.random(shape) < 0.7).tolist()
+            facing = self.rng.uniform(5, 60, shape).round(1).tolist()
+            prix = self.rng.uniform(40, 400, shape).round(2).tolist()
+            stock = self.rng.integers(0, 200, shape).tolist()
+            for i, m in enumerate(group):
+                day = _date(m.date_mission)
+                wilaya, region = self.pdv_geo[m.pdv_id]
+                for j, produit_id in enumerate(picked[i]):
+                    ok = dispo[i][j]
+                    rows.append((
+                        m.id, m.pdv_id, m.merchandiser_id, m.client_id, day, produit_id,
+                        ok, ok and handling[i][j],
+                        facing[i][j] if ok else None,
+                        f"{prix[i][j]:.2f}" if ok else None,
+                        stock[i][j] if ok else None,
+                        wilaya, region,
+                    ))
+        _insert(RealisationClientData, (
+            'mission', 'pdv', 'merch', 'client', 'date_realisation', 'produit', 'disponible', 'handling',
+            'facing_share', 'prix_vente', 'stock', 'wilaya', 'region',
+        ), rows)
+        return len(rows)
+
+    def _releves_concurrence(self, missions):
+        rows = []
+        for group, picked in self._by_client(missions, 1, self.scale.releves_concurrence_per_mission):
+            shape = (len(group), len(picked[0]))
+            dispo = (self.rng.random(shape) < 0.8).tolist()
+            facing = self.rng.uniform(5, 50, shape).round(1).tolist()
+            prix = self.rng.uniform(40, 400, shape).round(2).tolist()
+            for i, m in enumerate(group):
+                day = _date(m.date_mission)
+                wilaya, region = self.pdv_geo[m.pdv_id]
+                for j, produit_id in enumerate(picked[i]):
+                    ok = dispo[i][j]
+                    rows.append((
+                        m.id, m.pdv_id, m.merchandiser_id, m.client_id, day, produit_id, ok,
+                        facing[i][j] if ok else None,
+                        f"{prix[i][j]:.2f}" if ok else None,
+                        wilaya, region,
+                    ))
+        _insert(RealisationConcurrenceData, (
+            'mission', 'pdv', 'merch', 'client', 'date_realisation', 'produit_concurrent', 'disponible',
+            'facing_share', 'prix_vente', 'wilaya', 'region',
+        ), rows)
+        return len(rows)
+
+    def _photos(self, missions):
+        rows = []
+        minutes = self.rng.integers(0, 540, len(missions)).tolist()
+        for m, minute in zip(missions, minutes):
+            wilaya, region = self.pdv_geo[m.pdv_id]
+            start = timezone.make_aware(datetime.combine(m.date_mission, time(9)) + timedelta(minutes=minute))
+            for k in range(self.scale.photos_per_mission):
+                name = f"synthetic/{m.code}-{k}"
+                rows.append((
+                    m.id, m.client_id, m.pdv_id, CATEGORIES[k % len(CATEGORIES)],
+                    'avant' if k % 2 == 0 else 'apres', name, f"{name}-thumb", 'uploaded', '',
+                    _datetime(start + timedelta(minutes=5 * k)), wilaya, region, '', '',
+                ))
+        # Pas d'empreinte : les photos synthétiques n'ont pas de fichier
+        _insert(PhotoMission, (
+            'mission', 'client', 'pdv', 'categorie', 'type_photo', 'image', 'thumbnail', 'statut_upload',
+            'spool_path', 'timestamp', 'wilaya', 'region', 'content_sha256', 'duplicate_kind',
+        ), rows)
+        return len(rows)
+
+    def _derived(self):
+        start = self.today - timedelta(days=self.scale.days - 1)
+        for kind in rollups.ROLLUPS:
+            for client in self.clients:
+                rollups.refresh_range(kind, start, self.today, client_id=client.id)
+        self.log("agrégats journaliers reconstruits")
+        for client in self.clients:
+            summaries.rebuild_summaries(client=client)
+        self.log("résumés de visite reconstruits")
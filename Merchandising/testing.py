@@ -0,0 +1,34 @@
+"""
+Aides pour les tests : budget de requêtes SQL par vue.
+
+    class DashboardTests(QueryBudgetMixin, TestCase):
+        def test_dashboard(self):
+            with self.assertQueryBudget('client_dashboard'):
+                self.client.get(reverse('client_dashboard'))
+
+Le budget vient de settings.VIEW_QUERY_BUDGETS (le même que celui
+surveillé par MetricsMiddleware) ou de l'argument `budget`. Un
+dépassement (N+1 réintroduit) fait échouer le test avec la liste des
+requêtes exécutées.
+"""
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .metrics import query_budget
+
+
+class QueryBudgetMixin:
+
+    @contextmanager
+    def assertQueryBudget(self, view_name, budget=None):
+        budget = query_budget(view_name) if budget is None else budget
+        if budget is None:
+            self.fail(f"Aucun budget de requêtes pour {view_name} (settings.VIEW_QUERY_BUDGETS)")
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(f"{i}. {q['sql']}" for i, q in enumerate(context.captured_queries, start=1))
+            self.fail(f"{view_name} : {executed} requêtes SQL pour un budget de {budget}\n{queries}")
@@ -1,3 +1,1106 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import os
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+from django.utils.timezone import localdate
+from openpyxl import Workbook, load_workbook
+from PIL import Image
+
+from . import async_views, auth_cache, chunked, codes, exports, fingerprint, geo, imports, planning, rollups, routing, supervision, uploads
+from .ingestion import ingest_client_products
+from .metrics import REGISTRY
+from .models import (
+    ChunkedUpload,
+    Client,
+    CodeSequence,
+    Concurrent,
+    CustomUser,
+    DailyRealisationClient,
+    DashboardFacet,
+    Mission,
+    PhotoMission,
+    PointDeVente,
+    ProduitClient,
+    ProduitConcurrent,
+    Projet,
+    RealisationClientData,
+    RealisationConcurrenceData,
+    VisitSummary,
+)
+from .pagination import CursorPaginator
+from .summaries import rebuild_summaries
+from .testing import QueryBudgetMixin
+
+
+def photo_storage(tmp=None):
+    """Spool et stockage dans un répertoire temporaire, upload synchrone."""
+    tmp = tmp or tempfile.mkdtemp()
+    return override_settings(
+        PHOTO_SPOOL_DIR=os.path.join(tmp, 'spool'),
+        PHOTO_LOCAL_STORAGE_DIR=os.path.join(tmp, 'store'),
+        PHOTO_STORAGE_BACKEND='Merchandising.uploads.LocalFileSystemBackend',
+        PHOTO_UPLOAD_EAGER=True,
+    )
+
+
+def jpeg_bytes(size=(64, 48), color=(200, 10, 10)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+class BaseTestCase(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_obj = Client.objects.create(raison_sociale='C', ai='1', rc='1', nif='1', nis='1')
+        cls.merch = CustomUser.objects.create_user(
+            'm@example.com', 'pw', first_name='A', last_name='B', role='merchandiser', client=cls.client_obj,
+        )
+        cls.client_user = CustomUser.objects.create_user(
+            'c@example.com', 'pw', first_name='C', last_name='D', role='client', client=cls.client_obj,
+        )
+        cls.pdv = PointDeVente.objects.create(
+            no_pdv='1', region='Centre', wilaya='Alger', commune='X', type_pdv='epicerie', latitude=36.75, longitude=3.05,
+        )
+        cls.mission = Mission.objects.create(
+            pdv=cls.pdv, date_mission=localdate(), merchandiser=cls.merch, client=cls.client_obj,
+        )
+        cls.produits = [
+            ProduitClient.objects.create(client=cls.client_obj, nom=f'P{i}', categorie=f'cat{i % 3}', format='1L')
+            for i in range(10)
+        ]
+        cls.concurrent = Concurrent.objects.create(client=cls.client_obj, nom='K')
+        cls.produits_concurrents = [
+            ProduitConcurrent.objects.create(concurrent=cls.concurrent, nom=f'K{i}', categorie='c', format='1L')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.merch)
+
+    def post_json(self, url, payload):
+        return self.client.post(url, json.dumps(payload), content_type='application/json')
+
+    def mission_with_pdv(self):
+        return Mission.objects.select_related('pdv').get(id=self.mission.id)
+
+
+class QueryBudgetTests(BaseTestCase):
+    """Un N+1 réintroduit sur ces vues fait échouer la suite."""
+
+    def test_client_dashboard(self):
+        for i in range(5):
+            PhotoMission.objects.create(mission=self.mission, categorie=f'cat{i}', image=f'sample{i}', type_photo='avant')
+        self.client.force_login(self.client_user)
+        with self.assertQueryBudget('client_dashboard'):
+            response = self.client.get(reverse('client_dashboard'))
+        self.assertContains(response, 'Alger')
+
+    def test_save_client_products(self):
+        items = [{'produit_id': p.id, 'disponible': True, 'prix_vente': '10'} for p in self.produits]
+        with self.assertQueryBudget('save_client_products'):
+            response = self.post_json(reverse('save_client_products', args=[self.mission.id]), {'items': items})
+        self.assertEqual(response.json()['created'], 10)
+
+    def test_mission_realisation(self):
+        for i in range(3):
+            PhotoMission.objects.create(mission=self.mission, categorie=f'cat{i}', type_photo='avant')
+        with self.assertQueryBudget('mission_realisation'):
+            response = self.client.get(reverse('mission_realisation', args=[self.mission.id]))
+        self.assertContains(response, 'P9')
+
+    def test_budget_exceeded_fails(self):
+        with self.assertRaises(AssertionError):
+            with self.assertQueryBudget('dashboard_merch', budget=1):
+                self.client.get(reverse('dashboard_merch'))
+
+
+class IngestionTests(BaseTestCase):
+    def test_save_client_products(self):
+        items = [
+            {'produit_id': p.id, 'disponible': 1, 'handling': 0, 'facing_share': '12.5', 'prix_vente': '99.9', 'stock': '3'}
+            for p in self.produits
+        ]
+        items += [{'produit_id': 99999}, {'produit_id': 'x'}, {'produit_id': self.produits[0].id, 'stock': 'abc'}]
+        response = self.post_json(reverse('save_client_products', args=[self.mission.id]), {'items': items})
+        data = response.json()
+        self.assertEqual((data['created'], data['rejected']), (10, 3))
+        self.assertEqual(
+            [(r['status'], r['reason']) for r in data['results'][-3:]],
+            [('rejected', 'produit inconnu'), ('rejected', 'produit_id invalide'), ('rejected', 'stock invalide')],
+        )
+        row = RealisationClientData.objects.first()
+        self.assertEqual((row.wilaya, row.region, row.client_id), ('Alger', 'Centre', self.client_obj.id))
+
+    def test_rejects_non_finite_and_foreign_products(self):
+        other = Client.objects.create(raison_sociale='O', ai='2', rc='2', nif='2', nis='2')
+        foreign = ProduitClient.objects.create(client=other, nom='F', categorie='c', format='1L')
+        p = self.produits[0].id
+        result = ingest_client_products(self.mission_with_pdv(), self.merch, [
+            {'produit_id': p, 'facing_share': 'nan'},
+            {'produit_id': p, 'facing_share': float('inf')},
+            {'produit_id': p, 'prix_vente': 'NaN'},
+            {'produit_id': p, 'stock': float('inf')},
+            {'produit_id': foreign.id},
+        ])
+        self.assertEqual(result['created'], 0)
+        self.assertEqual([r['reason'] for r in result['results']], [
+            'facing_share invalide', 'facing_share invalide', 'prix_vente invalide', 'stock invalide',
+            "produit d'un autre client",
+        ])
+
+    def test_mission_without_client(self):
+        Mission.objects.filter(id=self.mission.id).update(client=None)
+        other = Client.objects.create(raison_sociale='O', ai='2', rc='2', nif='2', nis='2')
+        foreign = ProduitClient.objects.create(client=other, nom='F', categorie='c', format='1L')
+        items = [{'produit_id': self.produits[0].id}, {'produit_id': foreign.id}]
+        result = ingest_client_products(self.mission_with_pdv(), self.merch, items)
+        # Client du merchandiser à défaut de celui de la mission
+        self.assertEqual([r['status'] for r in result['results']], ['accepted', 'rejected'])
+        self.assertEqual(RealisationClientData.objects.get().client_id, self.client_obj.id)
+
+        self.merch.client = None
+        result = ingest_client_products(self.mission_with_pdv(), self.merch, items)
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(RealisationClientData.objects.filter(produit=foreign).get().client_id, other.id)
+
+    def test_save_concurrent_products(self):
+        items = [{'produit_id': p.id} for p in self.produits_concurrents]
+        response = self.post_json(reverse('save_concurrent_products', args=[self.mission.id]), {'items': items})
+        self.assertEqual(response.json()['created'], 5)
+
+    def test_rollups(self):
+        mission = self.mission_with_pdv()
+        ingest_client_products(mission, self.merch, [
+            {'produit_id': self.produits[0].id, 'prix_vente': 100, 'disponible': 1, 'facing_share': 20},
+        ])
+        ingest_client_products(mission, self.merch, [
+            {'produit_id': self.produits[0].id, 'prix_vente': 120, 'disponible': 0},
+            {'produit_id': self.produits[1].id},
+        ])
+        rows = list(DailyRealisationClient.objects.order_by('produit_id').values())
+        self.assertEqual((rows[0]['nb_releves'], rows[0]['nb_disponible']), (2, 1))
+
+        strip = lambda values: [{k: v for k, v in row.items() if k != 'id'} for row in values]
+        DailyRealisationClient.objects.all().delete()
+        call_command('rebuild_rollups')
+        self.assertEqual(strip(DailyRealisationClient.objects.order_by('produit_id').values()), strip(rows))
+
+        self.client.force_login(self.client_user)
+        response = self.client.get(reverse('client_kpis'), {'grain': 'month'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['items'])
+        self.assertEqual(self.client.get(reverse('client_kpis'), {'grain': 'year'}).status_code, 400)
+
+    def test_rollups_follow_edits_and_deletes(self):
+        mission = self.mission_with_pdv()
+        ingest_client_products(mission, self.merch, [{'produit_id': p.id, 'disponible': 1} for p in self.produits[:2]])
+        row = RealisationClientData.objects.get(produit=self.produits[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            row.disponible = False
+            row.save()
+        self.assertEqual(DailyRealisationClient.objects.get(produit=self.produits[0]).nb_disponible, 0)
+
+        other = PointDeVente.objects.create(no_pdv='2', region='Centre', wilaya='Alger', commune='Y', type_pdv='epicerie', latitude=36.7, longitude=3.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            row.pdv = other
+            row.save()
+        self.assertEqual(DailyRealisationClient.objects.get(produit=self.produits[0]).pdv_id, other.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Mission.objects.filter(id=mission.id).delete()
+        self.assertFalse(DailyRealisationClient.objects.exists())
+
+
+class DashboardTests(BaseTestCase):
+    def test_summaries(self):
+        for i in range(5):
+            PhotoMission.objects.create(
+                mission=self.mission, categorie=f'cat{i % 2}', image=f'sample{i}', type_photo='avant' if i % 2 else 'apres',
+            )
+        summary = VisitSummary.objects.get()
+        self.assertEqual((summary.nb_avant, summary.nb_apres), (2, 3))
+        self.assertEqual(rebuild_summaries(), 1)
+        self.assertEqual(VisitSummary.objects.get().categories, summary.categories)
+
+        self.client.force_login(self.client_user)
+        response = self.client.get(reverse('client_dashboard'), {'page_size': 1, 'cursor': 'zzz'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_summaries_follow_deletes_and_moves(self):
+        photos = [
+            PhotoMission.objects.create(mission=self.mission, categorie='c', image=f's{i}', type_photo='avant')
+            for i in range(3)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            photos[0].delete()
+        summary = VisitSummary.objects.get()
+        self.assertEqual((summary.nb_avant, summary.categories['c']['nb_avant']), (2, 2))
+        self.assertEqual(len(summary.categories['c']['avant']), 2)
+
+        other_pdv = PointDeVente.objects.create(
+            no_pdv='2', region='Est', wilaya='Oran', commune='Y', type_pdv='epicerie', latitude=35.7, longitude=-0.6,
+        )
+        other = Mission.objects.create(pdv=other_pdv, date_mission=localdate(), merchandiser=self.merch, client=self.client_obj)
+        moved = PhotoMission.objects.get(id=photos[1].id)
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.mission = other
+            moved.type_photo = 'apres'
+            moved.save()
+        self.assertEqual(
+            sorted(VisitSummary.objects.values_list('pdv_id', 'nb_avant', 'nb_apres')),
+            sorted([(self.pdv.id, 1, 0), (other_pdv.id, 0, 1)]),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Mission.objects.filter(id=other.id).delete()
+        self.assertEqual(list(VisitSummary.objects.values_list('pdv_id', flat=True)), [self.pdv.id])
+
+    def test_rebuild_per_client(self):
+        other_client = Client.objects.create(raison_sociale='O', ai='2', rc='2', nif='2', nis='2')
+        other = Mission.objects.create(pdv=self.pdv, date_mission=localdate(), merchandiser=self.merch, client=other_client)
+        for mission in (self.mission, other, other):
+            PhotoMission.objects.create(mission=mission, categorie='c', image='s', type_photo='avant')
+        expected = sorted(VisitSummary.objects.values_list('client_id', 'nb_avant', 'categories'), key=str)
+        VisitSummary.objects.update(nb_avant=0)
+        self.assertEqual(rebuild_summaries(chunk_size=1), 2)
+        self.assertEqual(sorted(VisitSummary.objects.values_list('client_id', 'nb_avant', 'categories'), key=str), expected)
+        PhotoMission.objects.filter(client=other_client).delete()
+        self.assertEqual(rebuild_summaries(client=other_client), 0)
+        self.assertEqual(list(VisitSummary.objects.values_list('client_id', flat=True)), [self.client_obj.id])
+
+
+@photo_storage()
+class PhotoUploadTests(BaseTestCase):
+    def upload(self, content):
+        image = SimpleUploadedFile('a.jpg', content, content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('upload_photo', args=[self.mission.id]),
+                {'image': image, 'categorie': 'c', 'photo_type': 'avant'},
+            )
+
+    def test_upload(self):
+        self.upload(jpeg_bytes())
+        photo = PhotoMission.objects.get()
+        self.assertEqual(photo.statut_upload, 'uploaded')
+        self.assertEqual(VisitSummary.objects.get().nb_avant, 1)
+        items = self.client.get(reverse('list_photos', args=[self.mission.id])).json()['items']
+        self.assertEqual([item['id'] for item in items], [photo.id])
+
+    def test_backend_must_implement_push(self):
+        class Incomplete(uploads.StorageBackend):
+            pass
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_invalid_json_bodies(self):
+        for url in (
+            reverse('upload_init', args=[self.mission.id]),
+            reverse('save_client_products', args=[self.mission.id]),
+        ):
+            for body in ('[1, 2]', '"x"', 'null', '{'):
+                response = self.client.post(url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400, (url, body))
+
+    def test_pending_preview(self):
+        content = jpeg_bytes()
+        image = SimpleUploadedFile('a.jpg', content, content_type='image/jpeg')
+        response = self.client.post(
+            reverse('upload_photo', args=[self.mission.id]), {'image': image, 'categorie': 'c', 'photo_type': 'avant'},
+        )
+        response = self.client.get(reverse('photo_preview', args=[response.json()['photo_id']]))
+        self.assertEqual(b''.join(response.streaming_content), content)
+
+    def test_image_processing(self):
+        img = Image.new('RGB', (4000, 3000), (200, 10, 10))
+        exif = Image.Exif()
+        exif[0x0112] = 6  # orientation
+        exif[0x010f] = 'Phone'
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG', exif=exif.tobytes())
+        self.upload(buf.getvalue())
+
+        photo = PhotoMission.objects.get()
+        self.assertEqual(photo.statut_upload, 'uploaded')
+        self.assertTrue(photo.thumbnail)
+        from django.conf import settings
+        store = settings.PHOTO_LOCAL_STORAGE_DIR
+        for name in os.listdir(store):
+            with Image.open(os.path.join(store, name)) as stored:
+                self.assertNotIn(0x010f, dict(stored.getexif()))
+                self.assertLessEqual(max(stored.size), 4000)
+
+    @photo_storage()
+    def test_unreadable_image_not_pushed(self):
+        from django.conf import settings
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            self.upload(jpeg_bytes())
+        self.upload(b'not an image')
+        self.assertEqual(set(PhotoMission.objects.values_list('statut_upload', 'spool_path')), {('rejected', '')})
+        store = settings.PHOTO_LOCAL_STORAGE_DIR
+        self.assertFalse(os.path.exists(store) and os.listdir(store))
+
+    def test_cursor_pagination(self):
+        for i in range(7):
+            PhotoMission.objects.create(mission=self.mission, categorie='c', image=f's{i}', type_photo='avant')
+        url = reverse('list_photos', args=[self.mission.id])
+        seen, cursor = [], ''
+        while True:
+            data = self.client.get(url, {'page_size': 3, 'cursor': cursor, 'count': '1'}).json()
+            seen += [item['id'] for item in data['items']]
+            if not data['has_next']:
+                break
+            cursor = data['next_cursor']
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual((len(seen), data['count']), (7, 7))
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage!'}).status_code, 400)
+
+        paginator = CursorPaginator(PhotoMission.objects.all(), ordering=('-timestamp', '-id'))
+        first = paginator.page(None, 2)
+        second = paginator.page(first.next_cursor, 2)
+        self.assertFalse({p.id for p in first.items} & {p.id for p in second.items})
+
+
+@photo_storage()
+@override_settings(PHOTO_CHUNK_SIZE=1024)
+class ChunkedUploadTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = jpeg_bytes((320, 240))
+        self.upload_id = str(uuid.uuid4())
+
+    def init(self, upload_id=None):
+        return self.post_json(reverse('upload_init', args=[self.mission.id]), {
+            'upload_id': upload_id or self.upload_id, 'size': len(self.data),
+            'sha256': hashlib.sha256(self.data).hexdigest(), 'categorie': 'c', 'photo_type': 'avant',
+        })
+
+    def put(self, start, end, content=None, checksum=True):
+        content = self.data[start:end] if content is None else content
+        headers = {'HTTP_X_CHUNK_SHA256': hashlib.sha256(self.data[start:end]).hexdigest()} if checksum else {}
+        return self.client.put(
+            reverse('upload_chunk', args=[self.upload_id]) + f'?offset={start}', content,
+            content_type='application/octet-stream', **headers,
+        )
+
+    def test_checksum_verified_before_write(self):
+        self.init()
+        size = len(self.data)
+        self.assertEqual(self.put(0, size, checksum=False).status_code, 200)
+        spool_path = ChunkedUpload.objects.get().spool_path
+        # Renvoi corrompu d'une plage déjà reçue, avec ou sans somme : rien n'est écrit
+        garbage = b'x' * 1024
+        self.assertEqual(self.put(0, 1024, content=garbage).status_code, 200)
+        self.assertEqual(self.put(0, 1024, content=garbage, checksum=False).status_code, 200)
+        ChunkedUpload.objects.update(received=[[1024, size]])
+        self.assertEqual(self.put(0, 1024, content=garbage).status_code, 400)
+        with open(spool_path, 'rb') as fh:
+            self.assertEqual(fh.read(), self.data)
+
+        self.assertEqual(self.put(0, 1024).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('upload_complete', args=[self.upload_id]))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(PHOTO_UPLOAD_MAX_OPEN=2)
+    def test_open_uploads_limit_and_purge(self):
+        self.assertEqual(self.init().status_code, 200)
+        self.assertEqual(self.init(str(uuid.uuid4())).status_code, 200)
+        self.assertEqual(self.init(str(uuid.uuid4())).status_code, 429)
+        self.assertEqual(self.init().status_code, 200)  # reprise d'un upload existant
+
+        paths = list(ChunkedUpload.objects.values_list('spool_path', flat=True))
+        ChunkedUpload.objects.update(updated_at=timezone.now() - chunked.STALE_AFTER - timedelta(hours=1))
+        call_command('purge_chunked_uploads')
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertFalse([path for path in paths if os.path.exists(path)])
+
+
+class FingerprintIndexTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        fingerprint._index = None
+
+    def test_refresh_outside_lock(self):
+        PhotoMission.objects.create(mission=self.mission, categorie='c', type_photo='avant', phash=0b1011)
+        index = fingerprint.get_index()
+        index.add(10**9, 0b1011, self.client_obj.id, 0)
+
+        fingerprint._index_built_at -= fingerprint.INDEX_TTL + 1
+        fingerprint._index_refreshing = True
+        with self.assertNumQueries(0):
+            self.assertIs(fingerprint.get_index(), index)
+
+        fingerprint._index_refreshing = False
+        refreshed = fingerprint.get_index()
+        self.assertIsNot(refreshed, index)
+        self.assertEqual(len(refreshed), 2)
+        matches = refreshed.search(0b1011, self.client_obj.id)
+        self.assertEqual({m.photo_id for m in matches}, {PhotoMission.objects.get().id, 10**9})
+
+
+    def test_built_in_chunks(self):
+        photos = [
+            PhotoMission.objects.create(mission=self.mission, categorie='c', type_photo='avant', phash=value)
+            for value in (0, 0b1, -1, 1 << 40, 0b1011)
+        ]
+        empty = fingerprint.HashIndex.from_queryset(PhotoMission.objects.none())
+        self.assertEqual(len(empty), 0)
+        index = fingerprint.HashIndex.from_queryset(chunk_size=2, max_distance=2)
+        self.assertEqual(sorted(index.ids.tolist()), [p.id for p in photos])
+        self.assertEqual(set(index.clients.tolist()), {self.client_obj.id})
+        matches = index.search(0b11, self.client_obj.id)
+        self.assertEqual({m.photo_id for m in matches}, {photos[0].id, photos[1].id, photos[4].id})
+
+
+class SyncTests(BaseTestCase):
+    def test_sync_visit(self):
+        payload = {
+            'batch_id': str(uuid.uuid4()),
+            'start': {'time': '2026-10-17T08:00:00Z', 'latitude': '36.7', 'longitude': '3.0'},
+            'client_products': [{'produit_id': p.id, 'disponible': 1} for p in self.produits],
+            'concurrent_products': [{'produit_id': 999}],
+            'photos': [5, 'x'],
+            'finish': {'latitude': 36.7, 'longitude': 3.01},
+        }
+        body = gzip.compress(json.dumps(payload).encode())
+        url = reverse('sync_visit', args=[self.mission.id])
+        first = self.client.post(url, body, content_type='application/json', HTTP_CONTENT_ENCODING='gzip').json()
+        self.assertFalse(first['replayed'])
+        second = self.client.post(url, body, content_type='application/json', HTTP_CONTENT_ENCODING='gzip').json()
+        self.assertTrue(second['replayed'])
+        self.assertEqual(RealisationClientData.objects.count(), 10)
+        mission = Mission.objects.get()
+        self.assertEqual(mission.etat, 'done')
+        self.assertIsNotNone(mission.end_time)
+        self.assertEqual(self.post_json(url, {}).status_code, 400)
+
+    def test_delta(self):
+        full = self.client.get(reverse('sync_delta')).json()
+        self.assertEqual(len(full['client_products']), 10)
+        self.assertEqual(full['missions'][0]['pdv']['code'], self.pdv.code)
+        unchanged = self.client.get(reverse('sync_delta'), {'since': full['version']}).json()
+        self.assertEqual(unchanged['client_products'], [])
+        self.produits[0].save()
+        changed = self.client.get(reverse('sync_delta'), {'since': full['version']}).json()
+        self.assertEqual(len(changed['client_products']), 1)
+
+        # Produit supprimé : tombe ; client apparu depuis le jeton : catalogue complet
+        deleted_id = self.produits[1].id
+        self.produits[1].delete()
+        other = Client.objects.create(raison_sociale='O', ai='2', rc='2', nif='2', nis='2')
+        ProduitClient.objects.create(client=other, nom='Q', categorie='c', format='1L')
+        Mission.objects.create(pdv=self.pdv, date_mission=localdate(), merchandiser=self.merch, client=other)
+        delta = self.client.get(reverse('sync_delta'), {'since': full['version']}).json()
+        self.assertEqual(delta['deleted_client_products'], [deleted_id])
+        self.assertEqual(delta['full_clients'], [other.id])
+        self.assertEqual({p['client_id'] for p in delta['client_products']}, {self.client_obj.id, other.id})
+        self.assertEqual(len(delta['client_products']), 2)
+
+        Mission.objects.filter(client=other).delete()
+        later = self.client.get(reverse('sync_delta'), {'since': delta['version']}).json()
+        self.assertEqual(later['removed_clients'], [other.id])
+        self.assertEqual(later['deleted_client_products'], [])
+
+    def test_delta_expired_token(self):
+        full = self.client.get(reverse('sync_delta')).json()
+        with override_settings(SYNC_TOMBSTONE_DAYS=0):
+            delta = self.client.get(reverse('sync_delta'), {'since': full['version']}).json()
+        self.assertTrue(delta['full'])
+        self.assertEqual(len(delta['client_products']), 10)
+
+
+class CatalogTests(BaseTestCase):
+    def test_etag(self):
+        url = reverse('mission_catalog', args=[self.mission.id])
+        response = self.client.get(url)
+        tag = response['ETag']
+        self.assertEqual(len(response.json()['client_products']), 10)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 304)
+
+        self.produits[0].nom = 'new'
+        self.produits[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 200)
+        self.produits_concurrents[0].delete()
+        self.assertEqual(len(self.client.get(url).json()['concurrent_products']), 4)
+        self.assertContains(self.client.get(reverse('mission_realisation', args=[self.mission.id])), 'new')
+
+
+class ExportTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        ingest_client_products(self.mission_with_pdv(), self.merch, [
+            {'produit_id': p.id, 'prix_vente': 10, 'disponible': 1} for p in self.produits
+        ])
+        self.client.force_login(self.client_user)
+
+    def test_csv(self):
+        response = self.client.get(reverse('export_realisations', args=['csv']))
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(body.strip().splitlines()), 11)
+
+    def test_xlsx(self):
+        response = self.client.get(reverse('export_realisations', args=['xlsx']))
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(workbook.active.max_row, 11)
+        row = [cell.value for cell in workbook.active[2]]
+        self.assertEqual((row[0].date(), row[11], row[14]), (localdate(), True, 10))
+
+    def test_xlsx_sheets(self):
+        with mock.patch.object(exports, 'MAX_XLSX_ROWS', 4):
+            content = b''.join(exports.iter_xlsx('client', exports.export_queryset('client'), chunk_size=3))
+        workbook = load_workbook(io.BytesIO(content))
+        self.assertEqual([ws.max_row for ws in workbook.worksheets], [5, 5, 3])
+
+    def test_invalid(self):
+        self.assertEqual(self.client.get(reverse('export_realisations', args=['pdf'])).status_code, 404)
+        response = self.client.get(reverse('export_realisations', args=['csv']), {'date_from': '2024-13-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class GeoTests(BaseTestCase):
+    def test_geofence_and_nearby(self):
+        response = self.client.post(
+            reverse('finish_visit', args=[self.mission.id]),
+            {'latitude': str(self.pdv.latitude), 'longitude': str(float(self.pdv.longitude) + 0.001)},
+        )
+        self.assertTrue(response.json()['end_in_geofence'])
+
+        PointDeVente.objects.create(
+            no_pdv='far', region='C', wilaya='W', commune='X', type_pdv='epicerie',
+            latitude=float(self.pdv.latitude) + 0.015, longitude=self.pdv.longitude,
+        )
+        url = reverse('nearby_pdvs')
+        params = {'lat': self.pdv.latitude, 'lon': self.pdv.longitude}
+        self.assertEqual(len(self.client.get(url, {**params, 'radius_km': 1}).json()['items']), 1)
+        self.assertEqual(len(self.client.get(url, {**params, 'radius_km': 2}).json()['items']), 2)
+
+    def test_index_follows_pdv_changes(self):
+        url = reverse('nearby_pdvs')
+        params = {'lat': self.pdv.latitude, 'lon': self.pdv.longitude, 'radius_km': 1}
+        self.assertEqual(len(self.client.get(url, params).json()['items']), 1)
+        # La version est publiée après commit, dans le cache partagé entre processus
+        with self.captureOnCommitCallbacks(execute=True):
+            PointDeVente.objects.create(
+                no_pdv='near', region='C', wilaya='W', commune='X', type_pdv='epicerie',
+                latitude=self.pdv.latitude, longitude=float(self.pdv.longitude) + 0.001,
+            )
+        self.assertEqual(len(self.client.get(url, params).json()['items']), 2)
+
+    def test_geofence_reads_pdv_position_only(self):
+        mission = Mission.objects.get(id=self.mission.id)
+        mission.begin_latitude, mission.begin_longitude = self.pdv.latitude, self.pdv.longitude
+        mission.end_latitude, mission.end_longitude = self.pdv.latitude, self.pdv.longitude
+        with self.assertNumQueries(1):
+            geo.apply_geofence(mission)
+        self.assertFalse(Mission.pdv.is_cached(mission))
+        self.assertEqual(mission.begin_distance_m, 0.0)
+        self.assertTrue(mission.end_in_geofence)
+        loaded = self.mission_with_pdv()
+        loaded.begin_latitude, loaded.begin_longitude = self.pdv.latitude, self.pdv.longitude
+        with self.assertNumQueries(0):
+            geo.apply_geofence(loaded)
+        self.assertTrue(loaded.begin_in_geofence)
+
+    def test_index_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        lats, lons = rng.uniform(19, 37, 5000), rng.uniform(-8, 12, 5000)
+        index = geo.PDVIndex(np.arange(5000), lats, lons)
+        for k in range(20):
+            distances = geo.haversine_m(lats[k], lons[k], lats, lons)
+            expected = sorted(np.flatnonzero(distances <= 20000).tolist())
+            self.assertEqual(sorted(n.pdv_id for n in index.nearby(lats[k], lons[k], 20000)), expected)
+
+
+class RoutingTests(BaseTestCase):
+    def test_plan_routes(self):
+        import itertools
+        rng = np.random.default_rng(1)
+        for n in (2, 3, 5, 7):
+            points = rng.uniform([36, 3], [36.3, 3.3], (n, 2))
+            stops = {1: [(i, *p) for i, p in enumerate(points)]}
+            ids, legs = routing.plan_routes(stops)[1]
+            matrix = routing.distance_matrix(points[:, 0], points[:, 1])
+            best = min(sum(matrix[a, b] for a, b in zip(p, p[1:])) for p in itertools.permutations(range(n)))
+            self.assertEqual(sorted(ids), list(range(n)))
+            self.assertLessEqual(sum(legs), best * 1.05 + 1)
+
+    def test_mission_route(self):
+        far = PointDeVente.objects.create(
+            no_pdv='2', region='Centre', wilaya='Alger', commune='Y', type_pdv='epicerie', latitude=36.8, longitude=3.1,
+        )
+        near = PointDeVente.objects.create(
+            no_pdv='3', region='Centre', wilaya='Alger', commune='Z', type_pdv='epicerie', latitude=36.76, longitude=3.06,
+        )
+        m_far = Mission.objects.create(pdv=far, date_mission=localdate(), merchandiser=self.merch, client=self.client_obj)
+        m_near = Mission.objects.create(pdv=near, date_mission=localdate(), merchandiser=self.merch, client=self.client_obj)
+        items = self.client.get(reverse('mission_route'), {'lat': 36.75, 'lon': 3.05}).json()['items']
+        self.assertEqual([i['id'] for i in items], [self.mission.id, m_near.id, m_far.id])
+        self.assertEqual(self.client.get(reverse('mission_route'), {'lat': 'x'}).status_code, 400)
+
+
+class PlanningTests(BaseTestCase):
+    def test_plan_missions(self):
+        from datetime import timedelta
+        today = localdate()
+        projet = Projet.objects.create(
+            client=self.client_obj, nom_projet='P', date_lancement=today - timedelta(days=3), date_fin=today + timedelta(days=30),
+        )
+        merchs = [
+            CustomUser.objects.create_user(f'm{i}@example.com', 'pw', first_name='A', last_name='B', role='merchandiser')
+            for i in range(3)
+        ]
+        pdvs = [
+            PointDeVente.objects.create(
+                no_pdv=f'x{i}', region='C', wilaya='Alger', commune='X', type_pdv='epicerie', latitude=36, longitude=3,
+            )
+            for i in range(5)
+        ]
+        rules = [planning.MissionRule(projet.id, m.id, [p.id for p in pdvs], list(range(7))) for m in merchs]
+        dry = planning.plan_missions(rules, dry_run=True)
+        self.assertEqual(Mission.objects.count(), 1)
+        created = planning.plan_missions(rules)
+        self.assertEqual(created.created, dry.generated)
+        self.assertEqual(len(set(Mission.objects.values_list('code', flat=True))), Mission.objects.count())
+        self.assertEqual(planning.plan_missions(rules, dry_run=True).generated, 0)
+        with self.assertRaises(planning.PlanningError):
+            planning.parse_rules([{'merchandiser': 1, 'pdvs': [1], 'weekdays': [0], 'date_from': 'x'}], projet.id)
+
+
+class CodeTests(BaseTestCase):
+    def test_codes(self):
+        self.assertRegex(self.mission.code, r'^MSN-.{7}$')
+        self.assertTrue(self.pdv.code.startswith('PDV-ALGER-'))
+        # valeur suivante de la séquence déjà prise à la main
+        taken = codes.FORMATS['mission'](None, CodeSequence.objects.get(name='mission').next_value)
+        manual = Mission(pdv=self.pdv, date_mission=localdate(), merchandiser=self.merch)
+        manual.code = taken
+        manual.save()
+        self.assertNotEqual(Mission.objects.create(pdv=self.pdv, date_mission=localdate(), merchandiser=self.merch).code, taken)
+
+        objs = [Mission(pdv=self.pdv, date_mission=localdate(), merchandiser=self.merch) for _ in range(500)]
+        codes.bulk_create(Mission, objs, 'mission')
+        self.assertEqual(len(set(Mission.objects.values_list('code', flat=True))), Mission.objects.count())
+
+
+class ImportTests(BaseTestCase):
+    def test_importer_must_implement_write(self):
+        class Incomplete(imports.Importer):
+            model = PointDeVente
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_pdv_csv(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'pdv.csv')
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write('N° PDV;Région;Wilaya;Commune;Type;Lat;Lon\n')
+            for i in range(200):
+                fh.write(f'P{i};Centre;{"alger" if i % 2 else "Blida"};C;Épicerie;36,{i};3.1\n')
+            fh.write('P5;Centre;Alger;C;epicerie;36;3\n')  # doublon
+            fh.write('\n')
+            fh.write('Q1;Centre;Nowhere;C;epicerie;136;x\n')
+            fh.write('1;Centre;Alger;C2;supermarche;36;3\n')  # mise à jour
+        errors = io.StringIO()
+        result = imports.run_import('pdv', path, error_file=errors)
+        self.assertEqual((result.created, result.updated, result.rejected), (200, 1, 2))
+        self.assertEqual(PointDeVente.objects.get(no_pdv='1').commune, 'C2')
+        self.assertEqual(PointDeVente.objects.get(no_pdv='P1').wilaya, 'Alger')
+        self.assertEqual(imports.run_import('pdv', path, dry_run=True).created, 0)
+
+    def test_catalog_xlsx(self):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['Concurrent', 'Produit', 'Catégorie', 'Format'])
+        sheet.append(['K', 'X', 'c', '1L'])
+        sheet.append(['K', 'K0', 'new', '1L'])
+        sheet.append(['Z', 'X', 'c', '1L'])
+        path = os.path.join(tempfile.mkdtemp(), 'pc.xlsx')
+        workbook.save(path)
+        result = imports.run_import('produits_concurrents', path, client_id=self.client_obj.id)
+        self.assertEqual((result.created, result.updated, result.rejected), (1, 1, 1))
+        with self.assertRaises(imports.InvalidImport):
+            imports.run_import('produits', path)
+
+
+class DenormalizationTests(BaseTestCase):
+    def test_bulk_and_cascade(self):
+        mission = self.mission_with_pdv()
+        with self.assertNumQueries(1):
+            RealisationClientData.objects.bulk_create_denormalized([
+                RealisationClientData(mission=mission, pdv=mission.pdv, merch=self.merch, produit=p) for p in self.produits
+            ])
+        photo = PhotoMission(mission_id=mission.id, categorie='c', type_photo='avant')
+        PhotoMission.objects.bulk_create_denormalized([photo])
+        self.assertEqual((photo.client_id, photo.pdv_id, photo.region), (self.client_obj.id, self.pdv.id, 'Centre'))
+
+        photo = PhotoMission.objects.create(mission=mission, categorie='c', type_photo='apres')
+        pdv = PointDeVente.objects.get(id=self.pdv.id)
+        pdv.wilaya, pdv.region = 'Blida', 'Nord'
+        pdv.save()
+        self.assertEqual(set(RealisationClientData.objects.values_list('wilaya', flat=True)), {'Blida'})
+        self.assertEqual(PhotoMission.objects.get(id=photo.id).region, 'Nord')
+        self.assertEqual(VisitSummary.objects.get().wilaya, 'Blida')
+        self.assertIn('Blida', DashboardFacet.objects.filter(kind='wilaya').values_list('value', flat=True))
+
+        PointDeVente.objects.filter(id=pdv.id).update(wilaya='Oran')
+        RealisationClientData.objects.update(client=None)
+        PhotoMission.objects.filter(id=photo.id).update(client=None)
+        call_command('refresh_denormalized')
+        photo.refresh_from_db()
+        self.assertEqual((photo.wilaya, photo.client_id), ('Oran', self.client_obj.id))
+        self.assertEqual(set(RealisationClientData.objects.values_list('client_id', flat=True)), {self.client_obj.id})
+
+    def test_backfill_client(self):
+        migration = importlib.import_module('Merchandising.migrations.0024_backfill_realisation_client')
+        mission = self.mission_with_pdv()
+        RealisationClientData.objects.bulk_create_denormalized([
+            RealisationClientData(mission=mission, pdv=mission.pdv, merch=self.merch, produit=p) for p in self.produits[:2]
+        ])
+        RealisationConcurrenceData.objects.bulk_create_denormalized([
+            RealisationConcurrenceData(mission=mission, pdv=mission.pdv, merch=self.merch, produit_concurrent=self.produits_concurrents[0])
+        ])
+        rollups.refresh_slice('client', self.pdv.id, [localdate()])
+        # Lignes antérieures à la dénormalisation
+        RealisationClientData.objects.update(client=None)
+        RealisationConcurrenceData.objects.update(client=None)
+        DailyRealisationClient.objects.update(client=None)
+
+        migration.backfill_client(apps, None)
+        self.assertEqual(set(RealisationClientData.objects.values_list('client_id', flat=True)), {self.client_obj.id})
+        self.assertEqual(set(RealisationConcurrenceData.objects.values_list('client_id', flat=True)), {self.client_obj.id})
+        self.assertEqual(set(DailyRealisationClient.objects.values_list('client_id', flat=True)), {self.client_obj.id})
+
+
+class PhotoSearchTests(BaseTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        other_client = Client.objects.create(raison_sociale='O', ai='2', rc='2', nif='2', nis='2')
+        colleague = CustomUser.objects.create_user(
+            'm2@example.com', 'pw', first_name='E', last_name='F', role='merchandiser', client=cls.client_obj,
+        )
+        cls.colleague_mission = Mission.objects.create(
+            pdv=cls.pdv, date_mission=localdate(), merchandiser=colleague, client=cls.client_obj,
+        )
+        cls.foreign_mission = Mission.objects.create(
+            pdv=cls.pdv, date_mission=localdate(), merchandiser=colleague, client=other_client,
+        )
+        cls.photos = {}
+        for mission, count in ((cls.mission, 3), (cls.colleague_mission, 2), (cls.foreign_mission, 2)):
+            cls.photos[mission.id] = [
+                PhotoMission.objects.create(mission=mission, categorie='c', image=f'{mission.id}-{i}', type_photo='avant').id
+                for i in range(count)
+            ]
+
+    def search(self, **params):
+        with self.assertQueryBudget('search_photos'):
+            response = self.client.get(reverse('search_photos'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def photo_ids(self, data):
+        return [photo['id'] for group in data['groups'] for photo in group['photos']]
+
+    def test_scoped_by_role(self):
+        own = self.photos[self.mission.id]
+        self.assertEqual(sorted(self.photo_ids(self.search())), own)
+
+        self.client.force_login(self.client_user)
+        data = self.search(count='1', client=self.foreign_mission.client_id)
+        self.assertEqual(
+            sorted(self.photo_ids(data)), sorted(own + self.photos[self.colleague_mission.id]),
+        )
+        self.assertEqual(data['count'], 5)
+        # Une photo par entrée de mission, dans l'ordre (-mission_id, -id)
+        self.assertEqual(
+            [(group['mission_id'], [p['id'] for p in group['photos']]) for group in data['groups']],
+            [
+                (self.colleague_mission.id, self.photos[self.colleague_mission.id][::-1]),
+                (self.mission.id, own[::-1]),
+            ],
+        )
+        group = data['groups'][1]
+        self.assertEqual((group['mission_code'], group['pdv']['id'], group['pdv']['wilaya']), (
+            self.mission.code, self.pdv.id, 'Alger',
+        ))
+
+    def test_cursor_pagination(self):
+        self.client.force_login(self.client_user)
+        seen, groups, cursor = [], [], ''
+        while True:
+            data = self.search(page_size=2, cursor=cursor)
+            seen += self.photo_ids(data)
+            groups += [group['mission_id'] for group in data['groups']]
+            if not data['has_next']:
+                break
+            cursor = data['next_cursor']
+        expected = [
+            *self.photos[self.colleague_mission.id][::-1],
+            *self.photos[self.mission.id][::-1],
+        ]
+        self.assertEqual(seen, expected)
+        # La mission commencée en page 1 se poursuit en page 2
+        self.assertEqual(groups, [self.colleague_mission.id, self.mission.id, self.mission.id])
+        self.assertEqual(self.client.get(reverse('search_photos'), {'cursor': 'garbage!'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('search_photos'), {'type': 'x'}).status_code, 400)
+
+
+class SupervisionTests(BaseTestCase):
+    def test_state_does_not_wait(self):
+        sup = CustomUser.objects.create_user(
+            's@example.com', 'pw', first_name='S', last_name='U', role='superviseur', region='Centre',
+        )
+        self.client.force_login(sup)
+        url = reverse('supervision_state')
+        state = self.client.get(url).json()
+        self.assertEqual(state['totals']['planned'], 1)
+
+        # Sans changement : réponse immédiate, même version, délai de rappel
+        start = time.monotonic()
+        same = self.client.get(url, {'since': state['version']}).json()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual((same['version'], same['poll_after']), (state['version'], supervision.POLL_AFTER))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mission = Mission.objects.get(id=self.mission.id)
+            mission.etat = 'in_progress'
+            mission.save()
+        changed = self.client.get(url, {'since': state['version']}).json()
+        self.assertNotEqual(changed['version'], state['version'])
+        self.assertEqual(changed['totals']['in_progress'], 1)
+        # `since` ne sert qu'au long-poll de la vue async
+        self.assertEqual(self.client.get(url, {'since': 'x'}).json()['version'], changed['version'])
+
+
+class SyntheticDataTests(TestCase):
+    """Smoke test de generate_synthetic_data et run_benchmarks sur un jeu minuscule."""
+    options = dict(clients=1, pdvs=20, merchandisers=2, missions=30, days=3, releves_per_mission=2, photos_per_mission=1)
+
+    def generate(self, seed, **extra):
+        call_command('generate_synthetic_data', seed=seed, stdout=io.StringIO(), **self.options, **extra)
+        return (
+            list(PointDeVente.objects.order_by('no_pdv').values_list('no_pdv', 'wilaya', 'latitude', 'longitude')),
+            list(
+                Mission.objects.order_by('pdv__no_pdv', 'date_mission', 'merchandiser__email', 'etat')
+                .values_list('pdv__no_pdv', 'date_mission', 'merchandiser__email', 'etat')
+            ),
+            # Noms de produits et clés dépendent des ids attribués par la base
+            sorted(
+                RealisationClientData.objects.values_list(
+                    'pdv__no_pdv', 'produit__categorie', 'produit__format', 'prix_vente', 'stock', 'disponible',
+                ),
+                key=str,
+            ),
+        )
+
+    def test_generate_and_benchmark(self):
+        first = self.generate(seed=1)
+        self.assertEqual((PointDeVente.objects.count(), Mission.objects.count()), (20, 30))
+        # Relevés et photos pour les missions terminées seulement
+        done = Mission.objects.filter(etat='done').count()
+        self.assertGreater(done, 0)
+        self.assertEqual((RealisationClientData.objects.count(), PhotoMission.objects.count()), (2 * done, done))
+        # Tables dérivées reconstruites
+        summaries = VisitSummary.objects.count()
+        self.assertEqual(rebuild_summaries(), summaries)
+        self.assertTrue(DailyRealisationClient.objects.exists())
+        with self.assertRaises(CommandError):
+            self.generate(seed=1)
+
+        # Même graine : mêmes données ; autre graine : d'autres
+        self.assertEqual(self.generate(seed=1, flush=True), first)
+        self.assertNotEqual(self.generate(seed=2, flush=True), first)
+
+        output = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        call_command(
+            'run_benchmarks', iterations=1, warmup=0, host='testserver', output=output,
+            only=['dashboard_merch', 'save_client_products', 'client_kpis_query'], stdout=io.StringIO(),
+        )
+        with open(output, encoding='utf-8') as fh:
+            report = json.load(fh)
+        self.assertEqual(report['dataset']['missions'], 30)
+        self.assertEqual(set(report['results']), {'dashboard_merch', 'save_client_products', 'client_kpis_query'})
+        # Écritures du scénario annulées
+        self.assertEqual(RealisationClientData.objects.count(), report['dataset']['realisations_client'])
+
+
+@photo_storage()
+class AsyncViewTests(BaseTestCase):
+    """Endpoints mobiles de async_views.py, routés comme sous ASGI (IRIS_ASYNC_VIEWS=1)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Nettoyages dans l'ordre inverse : URLs rechargées une fois le réglage rétabli
+        cls.addClassCleanup(cls.reload_urls)
+        cls.enterClassContext(override_settings(ASYNC_MOBILE_VIEWS=True))
+        cls.reload_urls()
+
+    @staticmethod
+    def reload_urls():
+        from IrisTrade import urls as project_urls
+        from . import urls
+        importlib.reload(urls)
+        importlib.reload(project_urls)
+        clear_url_caches()
+
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.merch)
+
+    async def test_routes_to_async_views(self):
+        self.assertIs(resolve(reverse('save_client_products', args=[1])).func, async_views.save_client_products)
+
+    async def test_auth(self):
+        url = reverse('save_client_products', args=[self.mission.id])
+        await self.async_client.alogout()
+        response = await self.async_client.post(url, '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response.url)
+
+        await self.async_client.aforce_login(self.client_user)
+        for response in (
+            await self.async_client.post(url, '{}', content_type='application/json'),
+            await self.async_client.get(reverse('list_photos', args=[self.mission.id])),
+            await self.async_client.post(reverse('finish_visit', args=[self.mission.id])),
+        ):
+            self.assertEqual(response.status_code, 403)
+        self.assertEqual((await self.async_client.get(url)).status_code, 405)
+
+    async def test_write_views_recheck_access(self):
+        await self.async_client.get(reverse('list_photos', args=[self.mission.id]))
+        await CustomUser.objects.filter(id=self.merch.id).aupdate(is_active=False)
+        response = await self.async_client.post(
+            reverse('save_client_products', args=[self.mission.id]), '{}', content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 403)
+
+    async def test_save_products(self):
+        response = await self.async_client.post(
+            reverse('save_client_products', args=[self.mission.id]),
+            json.dumps({'items': [{'produit_id': p.id, 'disponible': 1} for p in self.produits] + [{'produit_id': 'x'}]}),
+            content_type='application/json',
+        )
+        self.assertEqual((response.json()['created'], response.json()['rejected']), (10, 1))
+        response = await self.async_client.post(
+            reverse('save_concurrent_products', args=[self.mission.id]),
+            json.dumps({'items': [{'produit_id': p.id} for p in self.produits_concurrents]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['created'], 5)
+        self.assertEqual(await RealisationClientData.objects.filter(client=self.client_obj).acount(), 10)
+        self.assertEqual(await DailyRealisationClient.objects.acount(), 10)
+        response = await self.async_client.post(
+            reverse('save_client_products', args=[self.mission.id]), '[1]', content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_upload_and_list_photos(self):
+        response = await self.async_client.post(
+            reverse('upload_photo', args=[self.mission.id]),
+            {'image': SimpleUploadedFile('a.jpg', jpeg_bytes(), content_type='image/jpeg'), 'categorie': 'c', 'photo_type': 'avant'},
+        )
+        photo_id = response.json()['photo_id']
+        photo = await PhotoMission.objects.aget(id=photo_id)
+        self.assertTrue(os.path.exists(photo.spool_path))
+        response = await self.async_client.post(reverse('upload_photo', args=[self.mission.id]), {'categorie': 'c'})
+        self.assertEqual(response.status_code, 400)
+
+        data = (await self.async_client.get(reverse('list_photos', args=[self.mission.id]), {'count': '1'})).json()
+        self.assertEqual(([item['id'] for item in data['items']], data['count']), ([photo_id], 1))
+
+    async def test_finish_visit(self):
+        response = await self.async_client.post(
+            reverse('finish_visit', args=[self.mission.id]),
+            {'latitude': str(self.pdv.latitude), 'longitude': str(float(self.pdv.longitude) + 0.001)},
+        )
+        self.assertTrue(response.json()['end_in_geofence'])
+        mission = await Mission.objects.aget(id=self.mission.id)
+        self.assertEqual(mission.etat, 'done')
+        self.assertIsNotNone(mission.end_time)
+
+    async def test_supervision_state(self):
+        sup = await CustomUser.objects.acreate(email='s@example.com', role='superviseur', region='Centre')
+        await self.async_client.aforce_login(sup)
+        url = reverse('supervision_state')
+        state = (await self.async_client.get(url)).json()
+        self.assertEqual((state['totals']['planned'], state['poll_after']), (1, 0))
+        # Version déjà dépassée : pas d'attente
+        start = time.monotonic()
+        await self.async_client.get(url, {'since': state['version'] - 1})
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual((await self.async_client.get(url, {'since': 'x'})).status_code, 400)
+
+
+class AuthCacheTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        auth_cache._local.clear()
+
+    def test_sensitive_views_recheck_access(self):
+        self.client.force_login(self.client_user)
+        url = reverse('client_kpis')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # Changements faits par un autre processus : le LRU local ne les voit pas
+        CustomUser.objects.filter(id=self.client_user.id).update(role='merchandiser')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        CustomUser.objects.filter(id=self.client_user.id).update(role='client', is_active=False)
+        self.assertEqual(self.client.get(reverse('search_photos')).status_code, 403)
+
+    def test_write_views_recheck_access(self):
+        self.client.force_login(self.merch)
+        url = reverse('save_client_products', args=[self.mission.id])
+        self.assertEqual(self.post_json(url, {'items': []}).status_code, 200)
+        CustomUser.objects.filter(id=self.merch.id).update(is_active=False)
+        self.assertEqual(self.post_json(url, {'items': []}).status_code, 403)
+        # L'entrée locale est invalidée : la requête suivante n'est plus authentifiée
+        self.assertEqual(self.client.post(reverse('finish_visit', args=[self.mission.id])).status_code, 302)
+        self.assertFalse(RealisationClientData.objects.exists())
+
+    @override_settings(USER_CACHE_ALIAS='default')
+    def test_shared_cache_only(self):
+        self.assertEqual(auth_cache.get_user(self.merch.id).id, self.merch.id)
+        self.assertIsNone(auth_cache._local.get(auth_cache._key(self.merch.id)))
+        CustomUser.objects.filter(id=self.merch.id).update(first_name='Z')
+        auth_cache.invalidate(self.merch.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(auth_cache.get_user(self.merch.id).first_name, 'Z')
+        with self.assertNumQueries(0):
+            auth_cache.get_user(self.merch.id)
+
+
+class MetricsTests(BaseTestCase):
+    def test_metrics_view(self):
+        REGISTRY.reset()
+        self.client.get(reverse('dashboard_merch'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        staff = CustomUser.objects.create_user('s@example.com', 'pw', first_name='S', last_name='T', is_staff=True)
+        self.client.force_login(staff)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('iris_http_requests_total{view="dashboard_merch",status="200"} 1', body)
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_server_timing_is_ascii(self):
+        header = self.client.get(reverse('dashboard_merch'))['Server-Timing']
+        self.assertTrue(header.isascii())
@@ -0,0 +1,309 @@
+"""
+Pipeline d'upload photo asynchrone.
+
+1. La requête écrit le fichier dans un spool local (par blocs, jamais
+   entièrement en mémoire) et crée la PhotoMission en statut "pending".
+2. Un pool de workers traite l'image (cf. imaging.py) puis pousse l'image
+   et sa vignette vers le backend de stockage (Cloudinary par défaut)
+   avec retries et concurrence bornée.
+
+Un fichier identique (SHA-256) déjà uploadé pour le même client n'est
+pas renvoyé : la nouvelle photo reprend son image et est marquée doublon
+exact. Les quasi-doublons (pHash proche, autre mission) sont signalés
+par le worker après l'upload (cf. fingerprint.py).
+
+Réglages (settings.py, tous optionnels) :
+    PHOTO_SPOOL_DIR        dossier du spool local
+    PHOTO_STORAGE_BACKEND  chemin pointé de la classe backend
+    PHOTO_UPLOAD_WORKERS   nombre de workers
+    PHOTO_UPLOAD_RETRIES   tentatives par photo
+    PHOTO_UPLOAD_EAGER     True : upload immédiat dans le thread appelant (tests)
+"""
+import abc
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.db import close_old_connections, transaction
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from . import fingerprint
+from .imaging import ImageProcessingError, process_photo
+from .models import PhotoMission
+from .summaries import record_photo_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'Merchandising.uploads.CloudinaryBackend'
+
+
+def spool_dir():
+    path = Path(getattr(settings, 'PHOTO_SPOOL_DIR', Path(settings.BASE_DIR) / 'spool'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def spool_upload(uploaded_file):
+    """
+    Copie un UploadedFile dans le spool et retourne son chemin.
+    Un fichier déjà posé sur disque par Django est simplement déplacé.
+    """
+    suffix = Path(uploaded_file.name or '').suffix.lower()[:10]
+    target = spool_dir() / f"{uuid.uuid4().hex}{suffix}"
+
+    temp_path = getattr(uploaded_file, 'temporary_file_path', None)
+    if temp_path:
+        # Django ignore l'absence du fichier temporaire à la fermeture
+        file_move_safe(temp_path(), target)
+        uploaded_file.close()
+        return str(target)
+
+    partial = target.with_suffix(target.suffix + '.part')
+    with open(partial, 'wb') as out:
+        for chunk in uploaded_file.chunks():
+            out.write(chunk)
+    os.replace(partial, target)
+    return str(target)
+
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def create_photo(mission, categorie, photo_type, spool_path, digest=None):
+    """
+    Crée la PhotoMission d'un fichier du spool et programme son upload ;
+    un doublon exact d'une photo déjà uploadée du client la réutilise.
+    `digest` : SHA-256 du fichier s'il est déjà connu.
+    """
+    digest = digest or fingerprint.sha256_file(spool_path)
+    original = (
+        PhotoMission.objects.filter(client_id=mission.client_id, content_sha256=digest, statut_upload='uploaded')
+        .exclude(image='').order_by('id').first()
+    )
+    if original is not None:
+        photo = PhotoMission.objects.create(
+            mission=mission,
+            categorie=categorie,
+            type_photo=photo_type,
+            image=original.image,
+            thumbnail=original.thumbnail,
+            statut_upload='uploaded',
+            content_sha256=digest,
+            phash=original.phash,
+            duplicate_of=original,
+            duplicate_kind='exact',
+        )
+        _remove(spool_path)
+        return photo
+
+    photo = PhotoMission.objects.create(
+        mission=mission,
+        categorie=categorie,
+        type_photo=photo_type,
+        statut_upload='pending',
+        spool_path=spool_path,
+        content_sha256=digest,
+    )
+    enqueue_photo(photo.id)
+    return photo
+
+
+# ---------------------------------------------------------------------------
+# Backends de stockage
+# ---------------------------------------------------------------------------
+
+class StorageBackend(abc.ABC):
+    """Pousse un fichier du spool et retourne la valeur à stocker dans PhotoMission.image."""
+
+    @abc.abstractmethod
+    def push(self, path, photo):
+        ...
+
+
+class CloudinaryBackend(StorageBackend):
+    def push(self, path, photo):
+        from cloudinary import uploader
+
+        resource = uploader.upload_resource(path, type='upload', resource_type='image')
+        return resource.get_prep_value()
+
+
+class LocalFileSystemBackend(StorageBackend):
+    """Stand-in local (tests, développement hors ligne) : copie dans PHOTO_LOCAL_STORAGE_DIR."""
+
+    def __init__(self, root=None):
+        root = root or getattr(settings, 'PHOTO_LOCAL_STORAGE_DIR', Path(settings.BASE_DIR) / 'media' / 'photos')
+        self.root = Path(root)
+
+    def push(self, path, photo):
+        self.root.mkdir(parents=True, exist_ok=True)
+        name = f"mission_{photo.mission_id}_{photo.id}_{Path(path).name}"
+        shutil.copyfile(path, self.root / name)
+        return f"image/upload/{name}"
+
+
+def get_backend():
+    return import_string(getattr(settings, 'PHOTO_STORAGE_BACKEND', DEFAULT_BACKEND))()
+
+
+# ---------------------------------------------------------------------------
+# Pool de workers
+# ---------------------------------------------------------------------------
+
+def push_photo(photo_id, backend=None, retries=None, backoff=1.0):
+    """
+    Pousse une photo "pending" vers le stockage. Retourne True si la photo
+    est uploadée (ou l'était déjà). En cas d'échec définitif la photo passe
+    en "failed" et le fichier reste dans le spool pour une reprise. Une
+    image que le traitement ne sait pas lire passe en "rejected" : son
+    original (EXIF / GPS compris) n'est pas envoyé et le spool est vidé.
+    """
+    backend = backend or get_backend()
+    retries = retries or getattr(settings, 'PHOTO_UPLOAD_RETRIES', 3)
+
+    photo = PhotoMission.objects.filter(id=photo_id).first()
+    if photo is None or photo.statut_upload == 'uploaded':
+        return photo is not None
+    if not photo.spool_path or not os.path.exists(photo.spool_path):
+        logger.error("Photo %s : fichier spool introuvable (%s)", photo_id, photo.spool_path)
+        PhotoMission.objects.filter(id=photo_id).update(statut_upload='failed')
+        return False
+
+    # Étape de traitement : EXIF supprimé, taille plafonnée, WebP + vignette
+    try:
+        upload_path, thumb_path = process_photo(photo.spool_path)
+    except ImageProcessingError:
+        logger.warning("Photo %s : image illisible, non envoyée", photo_id, exc_info=True)
+        PhotoMission.objects.filter(id=photo_id).update(statut_upload='rejected', spool_path='')
+        _remove(photo.spool_path)
+        return False
+
+    for attempt in range(1, retries + 1):
+        try:
+            value = backend.push(upload_path, photo)
+            thumb_value = backend.push(thumb_path, photo) if thumb_path else ''
+            break
+        except Exception:
+            logger.warning("Photo %s : échec upload (tentative %s/%s)", photo_id, attempt, retries, exc_info=True)
+            if attempt < retries:
+                time.sleep(backoff * 2 ** (attempt - 1))
+    else:
+        PhotoMission.objects.filter(id=photo_id).update(statut_upload='failed')
+        return False
+
+    spool_files = {photo.spool_path, upload_path, thumb_path} - {None}
+    photo.image = value
+    photo.thumbnail = thumb_value
+    photo.statut_upload = 'uploaded'
+    photo.spool_path = ''
+    fields = ['image', 'thumbnail', 'statut_upload', 'spool_path']
+    fields += _flag_near_duplicate(photo, upload_path)
+    photo.save(update_fields=fields)
+    record_photo_url(photo)
+    _remove(*spool_files)
+    return True
+
+
+def _flag_near_duplicate(photo, path):
+    """pHash de la photo et rapprochement avec les photos du client ; retourne les champs modifiés."""
+    try:
+        photo.phash = fingerprint.perceptual_hash_file(path)
+    except fingerprint.FingerprintError:
+        logger.warning("Photo %s : empreinte impossible", photo.id, exc_info=True)
+        return []
+    fields = ['phash']
+    match = fingerprint.find_near_duplicate(photo)
+    if match is not None:
+        photo.duplicate_of_id = match.photo_id
+        photo.duplicate_kind = 'near'
+        fields += ['duplicate_of', 'duplicate_kind']
+    fingerprint.get_index().add(photo.id, photo.phash, photo.client_id, photo.mission_id)
+    return fields
+
+
+class UploadPool:
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='photo-upload')
+
+    def submit(self, photo_id):
+        return self.executor.submit(self._run, photo_id)
+
+    @staticmethod
+    def _run(photo_id):
+        close_old_connections()
+        try:
+            return push_photo(photo_id)
+        except Exception:
+            logger.exception("Photo %s : erreur inattendue du worker d'upload", photo_id)
+            return False
+        finally:
+            close_old_connections()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = UploadPool(getattr(settings, 'PHOTO_UPLOAD_WORKERS', 4))
+        return _pool
+
+
+def enqueue_photo(photo_id):
+    """Programme l'upload après le commit de la transaction courante."""
+    if getattr(settings, 'PHOTO_UPLOAD_EAGER', False):
+        transaction.on_commit(lambda: push_photo(photo_id))
+    else:
+        transaction.on_commit(lambda: get_pool().submit(photo_id))
+
+
+def display_url(request, photo_id, statut_upload, image):
+    """Cf. photo_display_url ; prend les colonnes (lignes `.values()`, cf. photo_search.py)."""
+    if statut_upload == 'uploaded' and image:
+        return request.build_absolute_uri(image.url)
+    return request.build_absolute_uri(reverse('photo_preview', args=[photo_id]))
+
+
+def thumbnail_url(request, photo_id, statut_upload, image, thumbnail):
+    if statut_upload == 'uploaded' and thumbnail:
+        return request.build_absolute_uri(thumbnail.url)
+    return display_url(request, photo_id, statut_upload, image)
+
+
+def photo_display_url(request, photo):
+    """URL affichable : stockage définitif si uploadée, sinon aperçu servi depuis le spool."""
+    return display_url(request, photo.id, photo.statut_upload, photo.image)
+
+
+def photo_payload(request, photo):
+    """Réponse JSON d'une photo reçue (upload simple ou par morceaux)."""
+    return {
+        'success': True,
+        'photo_id': photo.id,
+        'url': photo_display_url(request, photo),
+        'status': photo.statut_upload,
+        'categorie': photo.categorie,
+        'type': photo.type_photo,
+        'duplicate_of': photo.duplicate_of_id,
+    }
+
+
+def photo_thumbnail_url(request, photo):
+    """URL de vignette ; repli sur l'URL d'affichage pour les photos sans vignette."""
+    return thumbnail_url(request, photo.id, photo.statut_upload, photo.image, photo.thumbnail)
@@ -1,24 +1,55 @@
+from django.conf import settings
 from django.urls import path
 from .views import login_view,dashboard_merch
-from . import views
+from . import async_views, views
+from .metrics import metrics_view
+
+# Vues async sous ASGI (cf. async_views.py), mêmes URLs et mêmes noms
+mobile = async_views if settings.ASYNC_MOBILE_VIEWS else views
 
 urlpatterns = [
     path('', login_view, name='login'),
     path('dashboard/merch/', dashboard_merch, name='dashboard_merch'),
+    path('dashboard/superviseur/', views.dashboard_superviseur, name='dashboard_superviseur'),
+    # Long-poll du tableau de bord superviseur (cf. supervision.py)
+    path('supervision/state', mobile.supervision_state, name='supervision_state'),
 
     # Missions merch
-    path('missions/<int:mission_id>/start', views.start_visit, name='start_visit'),
+    path('missions/<int:mission_id>/start', mobile.start_visit, name='start_visit'),
     path('missions/<int:mission_id>/realisation', views.mission_realisation, name='mission_realisation'),
-    path('missions/<int:mission_id>/upload-photo', views.upload_photo, name='upload_photo'),
-    path('missions/<int:mission_id>/save-client', views.save_client_products, name='save_client_products'),
-    path('missions/<int:mission_id>/save-concurrents', views.save_concurrent_products, name='save_concurrent_products'),
-    path('missions/<int:mission_id>/finish', views.finish_visit, name='finish_visit'),
+    path('missions/<int:mission_id>/catalog', views.mission_catalog, name='mission_catalog'),
+    path('missions/<int:mission_id>/upload-photo', mobile.upload_photo, name='upload_photo'),
+    # Upload par morceaux, reprenable (cf. chunked.py)
+    path('missions/<int:mission_id>/uploads', mobile.upload_init, name='upload_init'),
+    path('uploads/<uuid:upload_id>', mobile.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:upload_id>/complete', mobile.upload_complete, name='upload_complete'),
+    path('missions/<int:mission_id>/save-client', mobile.save_client_products, name='save_client_products'),
+    path('missions/<int:mission_id>/save-concurrents', mobile.save_concurrent_products, name='save_concurrent_products'),
+    path('missions/<int:mission_id>/finish', mobile.finish_visit, name='finish_visit'),
 
     # Nouveau endpoint photos (préchargement)
-    path('missions/<int:mission_id>/photos', views.list_photos, name='list_photos'),
+    path('missions/<int:mission_id>/photos', mobile.list_photos, name='list_photos'),
+    path('photos/<int:photo_id>/preview', views.photo_preview, name='photo_preview'),
+    # Photos de plusieurs missions (portail client, superviseurs)
+    path('photos/search', views.search_photos, name='search_photos'),
+
+    # Synchronisation hors-ligne (application mobile)
+    path('missions/<int:mission_id>/sync', views.sync_visit, name='sync_visit'),
+    path('sync/delta', views.sync_delta, name='sync_delta'),
+
+    # Tournée du jour
+    path('missions/route', views.mission_route, name='mission_route'),
+
+    # Recherche géographique
+    path('pdv/nearby', views.nearby_pdvs, name='nearby_pdvs'),
+
+    # Instrumentation (format Prometheus)
+    path('metrics', metrics_view, name='metrics'),
 
     # Client area
     path('client/dashboard/', views.client_dashboard, name='client_dashboard'),
+    path('client/kpis/', views.client_kpis, name='client_kpis'),
+    path('client/exports/realisations.<str:fmt>', views.export_realisations, name='export_realisations'),
 
     # JSON / AJAX endpoints
     #path('api/pdv/<int:pdv_id>/photos/', views.api_pdv_photos, name='api_pdv_photos'),
@@ -1,17 +1,25 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponseForbidden
-from django.views.decorators.http import require_POST,require_GET
+from django.http import (
+    FileResponse,
+    Http404,
+    JsonResponse,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.views.decorators.http import require_POST,require_GET,require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from collections import OrderedDict, defaultdict
-from django.core.paginator import Paginator
 from django.db.models import Prefetch
 from django.urls import reverse
 from django.contrib.auth import authenticate, login
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.timezone import localdate
 import json
+import os
 from .models import (
+    ChunkedUpload,
     Mission,
     PhotoMission,
     ProduitClient,
@@ -21,6 +29,15 @@ from .models import (
     PointDeVente,
     Client,
 )
+from . import analytics, chunked, geo, photo_search, routing, supervision
+from .auth_cache import fresh_user
+from .catalog import etag as catalog_etag, get_catalog, get_version as get_catalog_version
+from .exports import InvalidExport, export_filename, export_queryset, iter_csv, iter_xlsx
+from .ingestion import ingest_client_products, ingest_concurrent_products
+from .pagination import CursorPaginator, InvalidCursor, count_estimate
+from .summaries import dashboard_page, facet_values
+from .sync import InvalidBatch, apply_visit_batch, decode_body, delta_for
+from .uploads import create_photo, photo_display_url, photo_payload, photo_thumbnail_url, spool_upload
 
 def login_view(request):
     if request.method == 'POST':
@@ -51,12 +68,48 @@ def dashboard_merch(request):
     missions = Mission.objects.filter(
         merchandiser=request.user,
         date_mission=today
-    ).order_by('date_mission')
+    ).select_related('pdv')
+
+    # Ordre de visite optimisé (cf. routing.py)
+    plan = routing.plan_for(request.user.id, today)
+    rank = {mission_id: position for position, mission_id in enumerate(plan.mission_ids)}
+    missions = sorted(missions, key=lambda m: rank.get(m.id, len(rank)))
 
     return render(request, 'merchandiser.html', {'missions': missions})
 
+@login_required
+def dashboard_superviseur(request):
+    """Missions du jour de la région, rafraîchies par supervision_state (cf. supervision.py)."""
+    region = supervision.region_for(request.user, request.GET.get('region'))
+    if region is None:
+        return redirect('login')
+
+    return render(request, 'superviseur.html', {
+        'region': region,
+        'snapshot': supervision.snapshot(region),
+        'etats': Mission.ETAT_CHOICES,
+    })
+
+
+@login_required
+@require_GET
+def supervision_state(request):
+    """
+    Snapshot du tableau de bord superviseur, sans attente : la page rappelle
+    après `poll_after` s (le long-poll est réservé à la vue async, cf.
+    supervision.py). GET params: region (staff) ; `since`, envoyé par la
+    page pour la vue async, est ignoré : le snapshot d'une version est de
+    toute façon calculé une seule fois et servi depuis le cache.
+    """
+    region = supervision.region_for(request.user, request.GET.get('region'))
+    if region is None:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    snapshot = supervision.snapshot(region, localdate())
+    return JsonResponse({'success': True, 'poll_after': supervision.POLL_AFTER, **snapshot})
+
 @require_POST
 @login_required
+@fresh_user
 def start_visit(request, mission_id):
     mission = get_object_or_404(Mission, id=mission_id)
     if mission.merchandiser != request.user:
@@ -76,36 +129,55 @@ def start_visit(request, mission_id):
 
 @login_required
 def mission_realisation(request, mission_id):
-    mission = get_object_or_404(Mission, id=mission_id)
-    if mission.merchandiser != request.user:
+    mission = get_object_or_404(Mission.objects.select_related('pdv'), id=mission_id)
+    if mission.merchandiser_id != request.user.id:
         return redirect('dashboard_merch')
 
-    # Produits client (exemple avec client statique; adapte si besoin)
-    try:
-        client_products_qs = ProduitClient.objects.filter(client='Amir20000')
-    except Exception:
-        client_products_qs = ProduitClient.objects.all()
-
-    client_products = client_products_qs[:50]
-    categories = list(client_products_qs.values_list('categorie', flat=True).distinct())
-    concurrent_products = ProduitConcurrent.objects.all()[:50]
+    # Catalogue du client de la mission, servi depuis le cache (cf. catalog.py)
+    _, catalog = get_catalog(mission.client_id or request.user.client_id)
 
     context = {
         'mission': mission,
-        'client_products': client_products,
-        'concurrent_products': concurrent_products,
-        'categories': categories,
+        'client_products': catalog['client_products'],
+        'concurrent_products': catalog['concurrent_products'],
+        'categories': catalog['categories'],
     }
     return render(request, 'mission_realisation.html', context)
 
 
 @login_required
+@require_GET
+def mission_catalog(request, mission_id):
+    """
+    Catalogue JSON du client de la mission (produits, concurrents, catégories).
+    ETag = version du catalogue : If-None-Match permet une réponse 304 sans corps.
+    """
+    mission = get_object_or_404(Mission, id=mission_id)
+    if mission.merchandiser_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    client_id = mission.client_id or request.user.client_id
+    version = get_catalog_version(client_id)
+    tag = catalog_etag(client_id, version)
+    if tag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        _, catalog = get_catalog(client_id, version)
+        response = JsonResponse(catalog)
+    response['ETag'] = tag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required
+@fresh_user
 @require_POST
 def upload_photo(request, mission_id):
     """
     Upload d'une photo (avant/apres)
     Attend FormData: image, categorie, photo_type ('avant'|'apres')
-    Retourne aussi l'URL pour affichage immédiat côté front.
+    Retourne aussi l'URL pour affichage immédiat côté front
+    (aperçu provisoire tant que l'upload de fond n'est pas terminé).
     """
     mission = get_object_or_404(Mission, id=mission_id)
     if mission.merchandiser != request.user:
@@ -117,96 +189,150 @@ def upload_photo(request, mission_id):
     if not image or not categorie or photo_type not in ('avant', 'apres'):
         return JsonResponse({'error': 'missing parameters'}, status=400)
 
-    photo = PhotoMission.objects.create(
-        mission=mission,
-        categorie=categorie,
-        image=image,
-        type_photo=photo_type,
-    )
+    # Le fichier part dans le spool local ; l'envoi vers le stockage se fait
+    # en arrière-plan (cf. uploads.py), la requête ne bloque plus dessus.
+    # Un fichier identique déjà uploadé pour ce client n'est pas renvoyé
+    # (cf. uploads.create_photo).
+    photo = create_photo(mission, categorie, photo_type, spool_upload(image))
 
-    return JsonResponse({
-        'success': True,
-        'photo_id': photo.id,
-        'url': request.build_absolute_uri(photo.image.url),  # important pour le front
-        'categorie': categorie,
-        'type': photo_type,
-    })
+    # url : affichage immédiat côté front
+    return JsonResponse(photo_payload(request, photo))
 
 
 @login_required
+@fresh_user
 @require_POST
-def save_client_products(request, mission_id):
+def upload_init(request, mission_id):
+    """
+    Début (ou reprise) d'un upload par morceaux (cf. chunked.py).
+    JSON : upload_id, size, sha256, categorie, photo_type, filename.
+    """
     mission = get_object_or_404(Mission, id=mission_id)
-    if mission.merchandiser != request.user:
+    if mission.merchandiser_id != request.user.id:
         return JsonResponse({'error': 'forbidden'}, status=403)
-
     try:
         payload = json.loads(request.body)
-        items = payload.get('items', [])
-    except Exception:
+    except ValueError:
+        return JsonResponse({'error': 'invalid json'}, status=400)
+    if not isinstance(payload, dict):
         return JsonResponse({'error': 'invalid json'}, status=400)
+    try:
+        upload = chunked.init_upload(mission, request.user, payload)
+    except chunked.TooManyUploads as exc:
+        return JsonResponse({'error': str(exc)}, status=429)
+    except chunked.ChunkError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(chunked.state(upload))
+
 
-    created = 0
-    for it in items:
-        produit_id = it.get('produit_id')
+@login_required
+@fresh_user
+@require_http_methods(['GET', 'PUT'])
+def upload_chunk(request, upload_id):
+    """
+    GET : plages déjà reçues. PUT ?offset=N : corps brut du morceau,
+    en-tête X-Chunk-Sha256 facultatif.
+    """
+    upload = get_object_or_404(ChunkedUpload, upload_id=upload_id)
+    if upload.merch_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    if request.method == 'PUT':
         try:
-            produit = ProduitClient.objects.get(id=produit_id)
-        except ProduitClient.DoesNotExist:
-            continue
-
-        RealisationClientData.objects.create(
-            mission=mission,
-            pdv=getattr(mission, 'pdv', None),
-            merch=request.user,
-            produit=produit,
-            disponible=bool(it.get('disponible')),
-            handling=bool(it.get('handling')),
-            facing_share=it.get('facing_share') or None,
-            prix_vente=it.get('prix_vente') or None,
-            stock=it.get('stock') or None
-        )
-        created += 1
+            offset = int(request.GET.get('offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            chunked.write_chunk(upload, offset, request, length, request.headers.get('X-Chunk-Sha256'))
+        except ValueError:
+            return JsonResponse({'error': 'invalid offset'}, status=400)
+        except chunked.ChunkError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        upload = chunked.record_chunk(upload, offset, length)
+    return JsonResponse(chunked.state(upload))
 
-    return JsonResponse({'success': True, 'created': created})
+
+@login_required
+@fresh_user
+@require_POST
+def upload_complete(request, upload_id):
+    upload = get_object_or_404(ChunkedUpload, upload_id=upload_id)
+    if upload.merch_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    try:
+        photo = chunked.complete_upload(upload)
+    except chunked.ChunkError as exc:
+        upload.refresh_from_db()
+        return JsonResponse({'error': str(exc), **chunked.state(upload)}, status=409)
+    return JsonResponse(photo_payload(request, photo))
 
 
 @login_required
+@require_GET
+def photo_preview(request, photo_id):
+    """
+    Aperçu d'une photo : redirige vers le stockage si l'upload est fini,
+    sinon sert le fichier encore présent dans le spool local.
+    """
+    photo = get_object_or_404(PhotoMission.objects.select_related('mission'), id=photo_id)
+    is_owner = photo.mission.merchandiser_id == request.user.id
+    is_client = request.user.client_id is not None and photo.client_id == request.user.client_id
+    is_supervisor = request.user.role == 'superviseur' and request.user.region and photo.region == request.user.region
+    if not (is_owner or is_client or is_supervisor or request.user.is_staff):
+        return HttpResponseForbidden("Non autorisé")
+
+    if photo.statut_upload == 'uploaded' and photo.image:
+        return redirect(photo.image.url)
+    if not photo.spool_path or not os.path.exists(photo.spool_path):
+        raise Http404("Photo indisponible")
+    return FileResponse(open(photo.spool_path, 'rb'))
+
+
+@login_required
+@fresh_user
+@require_POST
+def save_client_products(request, mission_id):
+    mission = get_object_or_404(Mission.objects.select_related('pdv'), id=mission_id)
+    if mission.merchandiser_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'invalid json'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'invalid json'}, status=400)
+
+    items = payload.get('items', [])
+    if not isinstance(items, list):
+        return JsonResponse({'error': 'invalid items'}, status=400)
+
+    result = ingest_client_products(mission, request.user, items)
+    return JsonResponse({'success': True, **result})
+
+
+@login_required
+@fresh_user
 @require_POST
 def save_concurrent_products(request, mission_id):
-    mission = get_object_or_404(Mission, id=mission_id)
-    if mission.merchandiser != request.user:
+    mission = get_object_or_404(Mission.objects.select_related('pdv'), id=mission_id)
+    if mission.merchandiser_id != request.user.id:
         return JsonResponse({'error': 'forbidden'}, status=403)
 
     try:
         payload = json.loads(request.body)
-        items = payload.get('items', [])
-    except Exception:
+    except ValueError:
+        return JsonResponse({'error': 'invalid json'}, status=400)
+    if not isinstance(payload, dict):
         return JsonResponse({'error': 'invalid json'}, status=400)
 
-    created = 0
-    for it in items:
-        produit_id = it.get('produit_id')
-        try:
-            produit = ProduitConcurrent.objects.get(id=produit_id)
-        except ProduitConcurrent.DoesNotExist:
-            continue
-
-        RealisationConcurrenceData.objects.create(
-            mission=mission,
-            pdv=getattr(mission, 'pdv', None),
-            merch=request.user,
-            produit_concurrent=produit,
-            disponible=bool(it.get('disponible')),
-            facing_share=it.get('facing_share') or None,
-            prix_vente=it.get('prix_vente') or None,
-            stock=it.get('stock') or None
-        )
-        created += 1
+    items = payload.get('items', [])
+    if not isinstance(items, list):
+        return JsonResponse({'error': 'invalid items'}, status=400)
 
-    return JsonResponse({'success': True, 'created': created})
+    result = ingest_concurrent_products(mission, request.user, items)
+    return JsonResponse({'success': True, **result})
 
 
 @login_required
+@fresh_user
 @require_POST
 def finish_visit(request, mission_id):
     mission = get_object_or_404(Mission, id=mission_id)
@@ -214,108 +340,335 @@ def finish_visit(request, mission_id):
         return JsonResponse({'error': 'forbidden'}, status=403)
 
     mission.etat = 'done'
-    mission.save()
-    return JsonResponse({'success': True, 'redirect': reverse('dashboard_merch')})
+    mission.finish(request.POST.get('latitude'), request.POST.get('longitude'))
+    return JsonResponse({
+        'success': True,
+        'redirect': reverse('dashboard_merch'),
+        'end_in_geofence': mission.end_in_geofence,
+        'end_distance_m': mission.end_distance_m,
+    })
 
 
 @login_required
 @require_GET
-def list_photos(request, mission_id):
+def nearby_pdvs(request):
     """
-    Liste paginée des photos d'une mission.
-    GET params: type=('avant'|'apres'|None), categorie (opt), page, page_size
+    PDV proches d'une position (index spatial, cf. geo.py).
+    GET params: lat, lon, radius_km (défaut 2, max 50), limit (défaut 50, max 500)
     """
-    from django.core.paginator import Paginator
+    try:
+        lat = float(request.GET['lat'])
+        lon = float(request.GET['lon'])
+        radius_km = float(request.GET.get('radius_km') or 2)
+        limit = int(request.GET.get('limit') or 50)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'invalid parameters'}, status=400)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or not (0 < radius_km <= 50):
+        return JsonResponse({'error': 'invalid parameters'}, status=400)
+    limit = max(1, min(limit, 500))
+
+    neighbours = geo.nearby_pdvs(lat, lon, radius_km * 1000, limit)
+    pdvs = PointDeVente.objects.in_bulk([n.pdv_id for n in neighbours])
+    items = [{
+        'id': n.pdv_id,
+        'code': pdvs[n.pdv_id].code,
+        'no_pdv': pdvs[n.pdv_id].no_pdv,
+        'wilaya': pdvs[n.pdv_id].wilaya,
+        'region': pdvs[n.pdv_id].region,
+        'commune': pdvs[n.pdv_id].commune,
+        'latitude': str(pdvs[n.pdv_id].latitude),
+        'longitude': str(pdvs[n.pdv_id].longitude),
+        'distance_m': round(n.distance_m, 1),
+    } for n in neighbours if n.pdv_id in pdvs]
+    return JsonResponse({'success': True, 'items': items})
+
 
+@login_required
+@require_GET
+def mission_route(request):
+    """
+    Tournée optimisée du merchandiser (cf. routing.py).
+    GET params: date (défaut aujourd'hui), lat / lon (position de départ, opt),
+    pending=1 pour ne garder que les missions pas encore faites.
+    """
+    if request.user.role != 'merchandiser':
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    try:
+        day = parse_date(request.GET.get('date') or '') or localdate()
+        origin = None
+        if request.GET.get('lat') or request.GET.get('lon'):
+            origin = (float(request.GET['lat']), float(request.GET['lon']))
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'invalid parameters'}, status=400)
+    if origin and not (-90 <= origin[0] <= 90 and -180 <= origin[1] <= 180):
+        return JsonResponse({'error': 'invalid parameters'}, status=400)
+    etats = ('planned', 'in_progress') if request.GET.get('pending') == '1' else None
+
+    plan = routing.plan_for(request.user.id, day, origin, etats)
+    missions = Mission.objects.select_related('pdv').in_bulk(plan.mission_ids)
+    items = [{
+        'id': mission_id,
+        'code': missions[mission_id].code,
+        'etat': missions[mission_id].etat,
+        'pdv_id': missions[mission_id].pdv_id,
+        'pdv_code': missions[mission_id].pdv.code,
+        'latitude': str(missions[mission_id].pdv.latitude),
+        'longitude': str(missions[mission_id].pdv.longitude),
+        'leg_m': round(leg, 1),
+    } for mission_id, leg in zip(plan.mission_ids, plan.legs_m)]
+    return JsonResponse({
+        'success': True,
+        'date': day.isoformat(),
+        'distance_m': round(plan.distance_m, 1),
+        'items': items,
+    })
+
+
+@login_required
+@require_GET
+def list_photos(request, mission_id):
+    """
+    Liste des photos d'une mission, paginée par curseur (cf. pagination.py).
+    GET params: type=('avant'|'apres'|None), categorie (opt), cursor, page_size,
+    count=1 pour un comptage borné.
+    """
     mission = get_object_or_404(Mission, id=mission_id)
-    if mission.merchandiser != request.user:
+    if mission.merchandiser_id != request.user.id:
         return JsonResponse({'error': 'forbidden'}, status=403)
 
     photo_type = request.GET.get('type')      # 'avant' | 'apres' | None
     categorie = request.GET.get('categorie')  # optionnel
-    page = int(request.GET.get('page', 1))
-    page_size = int(request.GET.get('page_size', 50))
 
-    qs = PhotoMission.objects.filter(mission=mission).order_by('-id')
+    qs = PhotoMission.objects.filter(mission=mission)
     if photo_type in ('avant', 'apres'):
         qs = qs.filter(type_photo=photo_type)
     if categorie:
         qs = qs.filter(categorie=categorie)
 
-    p = Paginator(qs, page_size)
-    page_obj = p.get_page(page)
+    try:
+        page = CursorPaginator(qs, ordering=('-id',)).page(
+            request.GET.get('cursor'), request.GET.get('page_size'),
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
 
     items = [{
         'id': ph.id,
-        'url': request.build_absolute_uri(ph.image.url),
+        'url': photo_display_url(request, ph),
+        'thumb': photo_thumbnail_url(request, ph),
         'cat': ph.categorie,
         'type': ph.type_photo,
-    } for ph in page_obj.object_list]
+    } for ph in page.items]
 
-    return JsonResponse({
+    data = {
         'success': True,
         'items': items,
-        'page': page_obj.number,
-        'pages': p.num_pages,
-        'count': p.count,
-    })
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    }
+    if request.GET.get('count') == '1':
+        data['count'], data['count_exact'] = count_estimate(qs)
+    return JsonResponse(data)
 
-# Util : check que l'utilisateur est un "client"
-def user_is_client(user):
-    return getattr(user, 'role', None) == 'client'
+@login_required
+@fresh_user
+@require_GET
+def search_photos(request):
+    """
+    Photos de plusieurs missions en un appel, regroupées par mission / PDV
+    (cf. photo_search.py), dans le périmètre du rôle de l'utilisateur.
+    GET params: client (staff / superviseur), date_from, date_to, wilaya,
+    region, pdv, mission (répétable), categorie, type, cursor, page_size,
+    count=1 pour un comptage borné.
+    """
+    base = photo_search.visible_photos(request.user)
+    if base is None:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    params = request.GET
+    try:
+        # Un client ne voit de toute façon que ses photos
+        client_id = None
+        if params.get('client') and not user_is_client(request.user):
+            client_id = int(params['client'])
+        mission_ids = [int(v) for v in params.getlist('mission') if v]
+        if len(mission_ids) > photo_search.MAX_PAGE_SIZE:
+            raise ValueError("trop de missions")
+        qs = photo_search.search_queryset(
+            base,
+            client_id=client_id,
+            date_from=parse_date(params.get('date_from') or ''),
+            date_to=parse_date(params.get('date_to') or ''),
+            wilaya=params.get('wilaya'),
+            region=params.get('region'),
+            pdv_id=int(params['pdv']) if params.get('pdv') else None,
+            mission_ids=mission_ids,
+            categorie=params.get('categorie'),
+            photo_type=params.get('type'),
+        )
+        page = photo_search.search_page(qs, params.get('cursor'), params.get('page_size'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
+    except ValueError:
+        return JsonResponse({'error': 'invalid parameters'}, status=400)
+
+    data = {
+        'success': True,
+        'groups': photo_search.group_rows(request, page.items),
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    }
+    if params.get('count') == '1':
+        data['count'], data['count_exact'] = count_estimate(qs)
+    return JsonResponse(data)
 
 @login_required
-def client_dashboard(request):
-    client = request.user.client  # user lié au client
-    print(f"Client: {client}")
+@fresh_user
+@require_POST
+def sync_visit(request, mission_id):
+    """
+    Synchronisation d'une visite complète en un seul appel (cf. sync.py).
+    Idempotent : un lot déjà reçu renvoie la même réponse.
+    """
+    mission = get_object_or_404(Mission, id=mission_id)
+    if mission.merchandiser_id != request.user.id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
 
-    wilaya_filter = request.GET.get('wilaya')
-    region_filter = request.GET.get('region')
-    pdv_search = request.GET.get('pdv_search')
+    try:
+        payload = decode_body(request)
+        response, replayed = apply_visit_batch(mission, request.user, payload)
+    except InvalidBatch as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    return JsonResponse({**response, 'replayed': replayed})
+
+
+@login_required
+@require_GET
+def sync_delta(request):
+    """Missions du jour + changements catalogue depuis ?since=<version>."""
+    if request.user.role != 'merchandiser':
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    return JsonResponse(delta_for(request.user, request.GET.get('since')))
+
+
+@login_required
+@fresh_user
+@require_GET
+def export_realisations(request, fmt):
+    """
+    Export CSV / XLSX des réalisations, en flux (cf. exports.py).
+    GET params: type=('client'|'concurrence'), date_from, date_to, region, wilaya
+    (+ client pour le staff).
+    """
+    if request.user.is_staff:
+        client_id = request.GET.get('client') or None
+    elif user_is_client(request.user) and request.user.client_id:
+        client_id = request.user.client_id
+    else:
+        return HttpResponseForbidden("Non autorisé")
 
-    photos_qs = PhotoMission.objects.filter(client=client).select_related(
-        'mission', 'pdv', 'mission__merchandiser'
-    ).order_by('-timestamp')
+    if fmt not in ('csv', 'xlsx'):
+        raise Http404("Format inconnu")
 
-    if wilaya_filter:
-        photos_qs = photos_qs.filter(wilaya=wilaya_filter)
-    if region_filter:
-        photos_qs = photos_qs.filter(region=region_filter)
-    if pdv_search:
-        photos_qs = photos_qs.filter(pdv__nom__icontains=pdv_search)
+    kind = request.GET.get('type', 'client')
+    try:
+        date_from = parse_date(request.GET.get('date_from') or '')
+        date_to = parse_date(request.GET.get('date_to') or '')
+        qs = export_queryset(
+            kind,
+            client_id=client_id,
+            date_from=date_from,
+            date_to=date_to,
+            region=request.GET.get('region'),
+            wilaya=request.GET.get('wilaya'),
+        )
+    except (InvalidExport, ValueError):
+        return JsonResponse({'error': 'invalid parameters'}, status=400)
+
+    filename = export_filename(kind, fmt, date_from, date_to)
+    if fmt == 'csv':
+        response = StreamingHttpResponse(iter_csv(kind, qs), content_type='text/csv; charset=utf-8')
+    else:
+        response = StreamingHttpResponse(
+            iter_xlsx(kind, qs),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
-    grouped = OrderedDict()
 
-    for photo in photos_qs:
-        pdv = photo.pdv
-        if not pdv:
-            continue
+@login_required
+@fresh_user
+@require_GET
+def client_kpis(request):
+    """
+    KPI par produit x wilaya x région x période (cf. analytics.py).
+    GET params: date_from, date_to, grain (week | month)
+    """
+    if not user_is_client(request.user) or not request.user.client_id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    try:
+        date_from = parse_date(request.GET.get('date_from') or '')
+        date_to = parse_date(request.GET.get('date_to') or '')
+    except ValueError:
+        return JsonResponse({'error': 'invalid parameters'}, status=400)
+    grain = request.GET.get('grain') or 'week'
+    if grain not in ('week', 'month'):
+        return JsonResponse({'error': 'invalid parameters'}, status=400)
+
+    frame = analytics.client_kpis(request.user.client_id, date_from, date_to, grain)
+    return JsonResponse({'success': True, 'grain': grain, 'items': analytics.to_records(frame)})
 
-        key = (pdv.id, photo.mission.date_mission)
 
-        if key not in grouped:
-            merch = photo.mission.merchandiser
-            grouped[key] = {
-                "pdv": getattr(pdv, 'nom', str(pdv)),
-                "wilaya": photo.wilaya,
-                "region": photo.region,
-                "merch": f"{merch.first_name} {merch.last_name}" if merch else "",
-                "date": photo.mission.date_mission.strftime("%d/%m/%Y"),
-                "categories": defaultdict(lambda: {"avant": [], "apres": []}),
-            }
+# Util : check que l'utilisateur est un "client"
+def user_is_client(user):
+    return getattr(user, 'role', None) == 'client'
 
-        grouped[key]["categories"][photo.categorie][photo.type_photo].append(photo.image.url)
+@login_required
+def client_dashboard(request):
+    client_id = request.user.client_id  # user lié au client
 
-    # Convertir les defaultdict en dict pour que Django template puisse itérer correctement
-    for val in grouped.values():
-        val["categories"] = dict(val["categories"])
+    wilaya_filter = request.GET.get('wilaya')
+    region_filter = request.GET.get('region')
+    pdv_search = request.GET.get('pdv_search')
 
-    realisation_list = list(grouped.values())
+    # Lecture d'une page de résumés matérialisés (cf. summaries.py) :
+    # le coût dépend de la taille de page, pas de l'historique photos.
+    try:
+        page = dashboard_page(
+            client_id,
+            wilaya=wilaya_filter,
+            region=region_filter,
+            pdv_search=pdv_search,
+            cursor=request.GET.get('cursor'),
+            page_size=request.GET.get('page_size'),
+        )
+    except InvalidCursor:
+        return redirect('client_dashboard')
+
+    realisation_list = [{
+        "pdv": s.pdv_label,
+        "wilaya": s.wilaya,
+        "region": s.region,
+        "merch": s.merch_nom,
+        "date": s.date_visite.strftime("%d/%m/%Y"),
+        "nb_avant": s.nb_avant,
+        "nb_apres": s.nb_apres,
+        "categories": s.categories,
+    } for s in page.items]
+
+    next_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_url = f"?{params.urlencode()}"
 
     context = {
         "realisations": realisation_list,
-        "filter_wilayas": sorted(set(photo.wilaya for photo in photos_qs if photo.wilaya)),
-        "filter_regions": sorted(set(photo.region for photo in photos_qs if photo.region)),
+        "filter_wilayas": facet_values(client_id, 'wilaya'),
+        "filter_regions": facet_values(client_id, 'region'),
+        "next_url": next_url,
     }
 
-    return render(request, "client_dashboard.html", context)
\ No newline at end of file
+    return render(request, "client_dashboard.html", context)